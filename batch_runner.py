@@ -0,0 +1,328 @@
+import argparse
+import csv
+import gc
+import importlib
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+from config import Config
+from instrumentation import PipelineMetrics
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+WORKER_DIED_ERROR = "Worker process died while running this case"
+
+# Libraries every case uses that the pipeline modules only import at the point
+# of use; preload_worker_state imports them in the parent ahead of forking.
+PRELOAD_MODULES = ("numpy", "PIL.Image", "pdfplumber", "pdfminer.pdftypes", "pytesseract", "joblib")
+
+# Components are built once per worker process by init_worker and reused for
+# every case that worker handles (parsers, image analyzer, rules, loaded ML model).
+_worker_components = None
+
+# Set in the parent by preload_worker_state; forked workers inherit it.
+_preloaded = None
+
+def _limit_native_threads():
+    # One process per core: keep native libraries (OpenMP/BLAS, OpenCV) from
+    # spawning their own thread pools on top of ours and oversubscribing the box.
+    # Read when those libraries load, so this has to run before they're imported.
+    os.environ.setdefault("OMP_NUM_THREADS", "1")
+    os.environ.setdefault("OPENBLAS_NUM_THREADS", "1")
+
+def preload_worker_state():
+    """
+    Imports the pipeline modules and their libraries and loads the risk model
+    once, in this process, so workers forked from it (create_worker_pool)
+    share them copy-on-write instead of each importing and unpickling them.
+    Nothing that starts threads or opens connections is created here; each
+    worker still builds those in init_worker. Returns {"ml_model": MLRiskModel or None}.
+    """
+    global _preloaded
+    if _preloaded is None:
+        _limit_native_threads()
+        for name in PRELOAD_MODULES:
+            importlib.import_module(name)
+        import main # the parsers, image analyzer, rules and model modules
+        from defect_detector import create_backend
+        from ml_risk_model import MLRiskModel
+        create_backend(Config.IMAGE_MODEL_PATH, input_size=Config.IMAGE_INPUT_SIZE).preload()
+        ml_model = MLRiskModel()
+        if not ml_model.load_model():
+            ml_model = None
+        _preloaded = {"ml_model": ml_model}
+        # Park everything loaded so far outside the garbage collector: a collection
+        # in a worker would otherwise touch, and so copy, every page holding it
+        gc.freeze()
+    return _preloaded
+
+def init_worker():
+    """Process pool initializer: builds this worker's pipeline components once."""
+    global _worker_components
+    _limit_native_threads()
+    from main import build_components
+    # Cases already run one per core, so OCR within a case stays inline
+    _worker_components = build_components(ocr_workers=1, ml_model=(_preloaded or {}).get("ml_model"))
+
+def create_worker_pool(max_workers, preload=Config.WORKER_PRELOAD, start_method=None):
+    """
+    Process pool running init_worker in each worker. With preload (where the OS
+    can fork) the parent runs preload_worker_state first and the workers are
+    forked from it, so they start with everything imported and the model
+    loaded; otherwise each worker imports and loads everything itself.
+    start_method ("spawn", "forkserver") starts the workers that way instead,
+    without preloading: for pools created once this process has threads of
+    its own, which a forked child could inherit mid-lock.
+    """
+    if start_method is not None:
+        return ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context(start_method),
+                                   initializer=init_worker)
+    if preload and "fork" in multiprocessing.get_all_start_methods():
+        preload_worker_state()
+        return ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("fork"),
+                                   initializer=init_worker)
+    return ProcessPoolExecutor(max_workers=max_workers, initializer=init_worker)
+
+def run_case_isolated(case, start_method=Config.WORKER_RESTART_START_METHOD):
+    """
+    Runs one case alone in a new worker process. For the cases in flight when
+    a worker died: which of them killed it isn't known, and that one kills
+    this process too and gets an error result, without taking a pool down.
+    """
+    with create_worker_pool(1, start_method=start_method) as pool:
+        try:
+            return pool.submit(run_case, case).result()
+        except BrokenProcessPool:
+            return {"case_id": case["case_id"], "report_path": case.get("report_path"),
+                    "photo_path": case.get("photo_path"), "error": WORKER_DIED_ERROR}
+
+def start_workers(pool):
+    """
+    Starts the pool's worker processes now rather than on the first case, e.g.
+    so a service forks them before it starts any threads of its own.
+    """
+    pool.submit(os.getpid).result()
+
+def json_default(value):
+    # numpy scalars/arrays (model labels, probabilities) and anything else exotic
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    return str(value)
+
+def run_case(case):
+    """
+    Runs one case with this worker's components. Failures are returned in the
+    result's "error" field rather than raised, so one bad file never stops a batch.
+    """
+    from main import run_underwriting_case
+    started = time.perf_counter()
+    result = {"case_id": case["case_id"], "report_path": case["report_path"], "photo_path": case.get("photo_path")}
+    try:
+        outputs = run_underwriting_case(
+            case["report_path"], case.get("photo_path"), components=_worker_components, case_id=case["case_id"]
+        )
+        result.update({
+            "decision": outputs["decision"],
+            "degraded": outputs["degraded"],
+            "rule_based_assessment": outputs["rule_based_assessment"],
+            "ml_prediction": outputs["ml_prediction"],
+            "combined_features": outputs["features"].to_dict(),
+            # For the feature store, written by the parent process
+            "parsed_text": outputs["parsed_text"],
+            "image_analysis": outputs["image_analysis"],
+            "features": outputs["features"].as_tuple(),
+            "report_hash": outputs["report_hash"],
+            "image_hash": outputs["image_hash"],
+            "versions": outputs["versions"],
+        })
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    result["elapsed_sec"] = round(time.perf_counter() - started, 4)
+    # Per-stage timings and counters; the parent merges these into its PipelineMetrics
+    result["metrics"] = _worker_components.get("last_case_metrics")
+    return result
+
+def _find_photo(directory, stem):
+    case_id = stem[len("report_"):] if stem.startswith("report_") else stem
+    for name in (f"property_{case_id}", stem):
+        for ext in IMAGE_EXTENSIONS:
+            candidate = os.path.join(directory, name + ext)
+            if os.path.exists(candidate):
+                return case_id, candidate
+    return case_id, None
+
+def discover_cases(input_dir=Config.RAW_DATA_DIR, manifest_path=None):
+    """
+    Yields case dicts ({"case_id", "report_path", "photo_path"}) lazily so a
+    directory of tens of thousands of appraisals is never listed into memory twice.
+
+    With a manifest (CSV with case_id,report_path,photo_path columns, or JSON lines
+    with the same keys) the manifest order is used. Otherwise every PDF in input_dir
+    is a case, paired with property_<id>.jpg / <stem>.jpg when present
+    (report_001.pdf -> property_001.jpg).
+    """
+    if manifest_path:
+        with open(manifest_path, newline="") as f:
+            if manifest_path.endswith((".jsonl", ".json")):
+                rows = (json.loads(line) for line in f if line.strip())
+            else:
+                rows = csv.DictReader(f)
+            for row in rows:
+                report_path = row["report_path"]
+                yield {
+                    "case_id": row.get("case_id") or os.path.splitext(os.path.basename(report_path))[0],
+                    "report_path": report_path,
+                    "photo_path": row.get("photo_path") or None,
+                }
+        return
+
+    with os.scandir(input_dir) as entries:
+        names = sorted(e.name for e in entries if e.is_file() and e.name.lower().endswith(".pdf"))
+    for name in names:
+        case_id, photo_path = _find_photo(input_dir, os.path.splitext(name)[0])
+        yield {"case_id": case_id, "report_path": os.path.join(input_dir, name), "photo_path": photo_path}
+
+class BatchRunner:
+    def __init__(self, max_workers=Config.BATCH_MAX_WORKERS, max_pending=None,
+                 output_path=Config.BATCH_RESULTS_PATH, progress_every=500, metrics_path=Config.METRICS_JSON_PATH,
+                 feature_store=None, preload=Config.WORKER_PRELOAD):
+        self.max_workers = max_workers
+        # Bounded submission queue: never hold more than max_pending futures (and their
+        # results) in memory, however many cases the input yields.
+        self.max_pending = max_pending or max_workers * Config.BATCH_QUEUE_FACTOR
+        self.output_path = output_path
+        self.progress_every = progress_every
+        self.metrics_path = metrics_path
+        self.metrics = PipelineMetrics()
+        self.feature_store = feature_store # FeatureStore receiving every successful case, or None
+        self.preload = preload # fork workers from a preloaded parent (create_worker_pool)
+
+    def _replace_pool(self, broken):
+        print("[batch] a worker process died; starting a new pool")
+        broken.shutdown(wait=False, cancel_futures=True)
+        self.metrics.incr("worker_pool_restarts")
+        # This process has threads of its own by now (the pool's manager), so no forking
+        return create_worker_pool(self.max_workers, start_method=Config.WORKER_RESTART_START_METHOD)
+
+    def run(self, cases):
+        """
+        Fans cases out over a process pool and streams each result to output_path
+        as one JSON line as soon as it completes (completion order, not input order).
+        Returns a summary with throughput in cases/sec.
+        """
+        output_dir = os.path.dirname(self.output_path)
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+
+        completed = errors = degraded = restarts = 0
+        started = time.perf_counter()
+        pool = create_worker_pool(self.max_workers, self.preload)
+        try:
+            with open(self.output_path, "w") as out:
+                pending = {} # future -> (case, pool it was submitted to)
+                case_iter = iter(cases)
+                exhausted = False
+                while pending or not exhausted:
+                    while not exhausted and len(pending) < self.max_pending:
+                        case = next(case_iter, None)
+                        if case is None:
+                            exhausted = True
+                            break
+                        try:
+                            pending[pool.submit(run_case, case)] = (case, pool)
+                        except BrokenProcessPool: # the cases in flight on it are re-run below
+                            pool, restarts = self._replace_pool(pool), restarts + 1
+                            pending[pool.submit(run_case, case)] = (case, pool)
+                    if not pending:
+                        break
+
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        case, submitted_to = pending.pop(future)
+                        try:
+                            result = future.result()
+                        except BrokenProcessPool:
+                            # A worker died (OOM kill, native crash) and took every case in
+                            # flight with it. Re-run each alone: the one that killed it gets
+                            # an error result, the rest complete, and a new pool carries on.
+                            if submitted_to is pool:
+                                pool, restarts = self._replace_pool(pool), restarts + 1
+                            result = run_case_isolated(case)
+                        if "error" in result:
+                            errors += 1
+                        else:
+                            if result.get("degraded"):
+                                degraded += 1 # decided, but on incomplete input (see run_underwriting_case)
+                            if self.feature_store is not None:
+                                self.feature_store.append_case(result)
+                        if result.get("metrics"):
+                            self.metrics.record_case(result["metrics"])
+                        out.write(json.dumps(result, default=json_default) + "\n")
+                        completed += 1
+                        if self.progress_every and completed % self.progress_every == 0:
+                            elapsed = time.perf_counter() - started
+                            print(f"[batch] {completed} cases, {completed / elapsed:.1f} cases/sec")
+                    out.flush()
+        finally:
+            pool.shutdown(cancel_futures=True)
+            # Finish the store's open files even when a case or the pool fails
+            if self.feature_store is not None:
+                self.feature_store.close()
+
+        elapsed = time.perf_counter() - started
+        summary = {
+            "cases": completed,
+            "errors": errors,
+            "degraded": degraded,
+            "workers": self.max_workers,
+            "worker_restarts": restarts,
+            "elapsed_sec": round(elapsed, 3),
+            "cases_per_sec": round(completed / elapsed, 3) if elapsed > 0 else 0.0,
+            "output_path": self.output_path,
+            "stage_mean_ms": {name: stage["mean_ms"] for name, stage in self.metrics.snapshot()["stages"].items()},
+        }
+        if self.metrics_path:
+            self.metrics.append_json_line(self.metrics_path)
+        print(f"[batch] done: {summary}")
+        return summary
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run underwriting over a directory or manifest of cases.")
+    parser.add_argument("--input-dir", default=Config.RAW_DATA_DIR)
+    parser.add_argument("--manifest", default=None, help="CSV or JSON-lines file with case_id,report_path,photo_path")
+    parser.add_argument("--output", default=Config.BATCH_RESULTS_PATH)
+    parser.add_argument("--workers", type=int, default=Config.BATCH_MAX_WORKERS)
+    parser.add_argument("--max-pending", type=int, default=None)
+    parser.add_argument("--metrics-json", default=Config.METRICS_JSON_PATH, help="append a metrics snapshot (JSON line) here")
+    parser.add_argument("--metrics-prom", default=None, help="write Prometheus text metrics here")
+    parser.add_argument("--feature-store", action=argparse.BooleanOptionalAction, default=Config.FEATURE_STORE_ENABLED,
+                        help="write parsed text, image results, features and decisions to the Parquet feature store")
+    parser.add_argument("--preload", action=argparse.BooleanOptionalAction, default=Config.WORKER_PRELOAD,
+                        help="import libraries and load the risk model once, then fork the workers from this process")
+    args = parser.parse_args(argv)
+
+    feature_store = None
+    if args.feature_store:
+        from feature_store import FeatureStore # pyarrow is only needed when writing the store
+        feature_store = FeatureStore()
+    runner = BatchRunner(max_workers=args.workers, max_pending=args.max_pending, output_path=args.output,
+                         metrics_path=args.metrics_json, feature_store=feature_store, preload=args.preload)
+    summary = runner.run(discover_cases(args.input_dir, args.manifest))
+    if args.metrics_prom:
+        with open(args.metrics_prom, "w") as f:
+            f.write(runner.metrics.to_prometheus())
+    return summary
+
+if __name__ == "__main__":
+    main()
+
+# Example Usage:
+# runner = BatchRunner(max_workers=8, output_path="data/batch_results.jsonl")
+# summary = runner.run(discover_cases("data/raw_appraisals"))
+# print("Throughput:", summary["cases_per_sec"], "cases/sec")
+#
+# # Workers are forked from a parent that already imported the libraries and loaded
+# # the risk model (Config.WORKER_PRELOAD); --no-preload starts them cold
+# # python batch_runner.py --input-dir data/raw_appraisals --workers 8 --no-preload
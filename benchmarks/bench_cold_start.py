@@ -0,0 +1,168 @@
+"""
+Cold start: how long a fresh interpreter takes to import the pipeline, to
+apply the rules to one case, to load the risk model and score one case, and
+to build every pipeline component, with the heaviest imports behind each
+(python -X importtime). Then how long a pool of case workers takes to run its
+first case (a one-case synthetic corpus, see benchmarks/corpus.py) with and
+without preloading (batch_runner.create_worker_pool), and how much memory
+each worker keeps to itself versus shares with the others.
+
+The scoring scenarios load a forest fitted on synthetic cases
+(bench_forest_scorer.fit_model), saved to a temporary artifact, so every run
+loads the same model. Everything runs in subprocesses: nothing is warm.
+
+    python -m benchmarks.bench_cold_start
+    python -m benchmarks.bench_cold_start --workers 4 --repeat 5 --json
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Every scenario starts by pointing the pipeline at the benchmark model, with
+# the stage cache off so nothing is written outside the temporary directory
+_SETUP = """
+from config import Config
+Config.RISK_MODEL_PATH = {model_path!r}
+Config.CACHE_ENABLED = False
+"""
+
+SCENARIOS = {
+    "import_main": "import main",
+    "rules_only": """
+from feature_record import FeatureRecord
+from rule_engine import RuleEngine
+RuleEngine().apply_rules(FeatureRecord())
+""",
+    "score_only": """
+from feature_record import FeatureRecord
+from ml_risk_model import MLRiskModel
+model = MLRiskModel()
+assert model.load_model()
+model.predict_risk(FeatureRecord())
+""",
+    "build_components": """
+from main import build_components
+build_components(ocr_workers=1)["image_analyzer"].close()
+""",
+}
+
+# Prints the seconds from the start of the (fresh) parent to the first case
+# finished by a worker, then the pool's per-worker memory
+_POOL_SCENARIO = """
+import json, time
+started = time.perf_counter()
+import batch_runner
+from benchmarks.bench_cold_start import worker_probe
+pool = batch_runner.create_worker_pool({workers}, preload={preload})
+result = pool.submit(batch_runner.run_case, {case!r}).result()
+assert "error" not in result, result["error"]
+first_case = time.perf_counter() - started
+memory = dict(pool.map(worker_probe, range({workers} * 4), chunksize=1))
+pool.shutdown()
+print(json.dumps({{"first_case": first_case, "memory": list(memory.values())}}))
+"""
+
+def worker_probe(_):
+    # Runs in a pool worker after init_worker; the sleep spreads probes over workers
+    time.sleep(0.05)
+    return os.getpid(), process_memory()
+
+def process_memory():
+    """(private, shared) resident bytes of this process, from /proc; (None, None) elsewhere."""
+    try:
+        with open("/proc/self/smaps_rollup") as f:
+            fields = dict(line.split(":", 1) for line in f if line.endswith("kB\n"))
+    except OSError:
+        return None, None
+    kb = {name: int(value.split()[0]) for name, value in fields.items()}
+    return ((kb["Private_Clean"] + kb["Private_Dirty"]) * 1024,
+            (kb["Shared_Clean"] + kb["Shared_Dirty"]) * 1024)
+
+def _python(code, importtime=False):
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [REPO_DIR, os.environ.get("PYTHONPATH")])))
+    command = [sys.executable] + (["-X", "importtime"] if importtime else []) + ["-c", code]
+    started = time.perf_counter()
+    completed = subprocess.run(command, capture_output=True, text=True, env=env)
+    if completed.returncode != 0:
+        raise RuntimeError(f"cold start scenario failed:\n{completed.stderr[-2000:]}")
+    return time.perf_counter() - started, completed
+
+def heaviest_imports(importtime_output, top=4):
+    """Top-level packages by cumulative import time (ms), from python -X importtime output."""
+    packages = {}
+    for line in importtime_output.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        name = name.strip()
+        if cumulative.strip().isdigit() and "." not in name and not os.path.exists(os.path.join(REPO_DIR, name + ".py")):
+            packages[name] = max(packages.get(name, 0), int(cumulative) / 1000)
+    return [f"{name} {ms:.0f}" for name, ms in sorted(packages.items(), key=lambda item: -item[1])[:top]]
+
+def save_model(model_path):
+    from benchmarks.bench_forest_scorer import fit_model
+    model = fit_model()
+    model.model_path = model_path
+    model.save_model(model_version="bench")
+
+def run(workers=2, repeat=3):
+    from benchmarks.corpus import generate_corpus
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        model_path = os.path.join(tmp, "risk_scorer_model.pkl")
+        save_model(model_path)
+        setup = _SETUP.format(model_path=model_path)
+        corpus = generate_corpus(os.path.join(tmp, "corpus"), cases=1)["cases"][0]
+        case = {"case_id": corpus["case_id"], "report_path": os.path.join(tmp, "corpus", corpus["report"]),
+                "photo_path": os.path.join(tmp, "corpus", corpus["photo"])}
+
+        for name, code in SCENARIOS.items():
+            # Best of repeat runs: the least disturbed measurement of the same work
+            wall = min(_python(setup + code)[0] for _ in range(repeat))
+            _, completed = _python(setup + code, importtime=True)
+            results.append({"scenario": name, "wall_ms": round(wall * 1000, 1),
+                            "heaviest_imports_ms": heaviest_imports(completed.stderr)})
+
+        for preload in (False, True):
+            runs = []
+            for _ in range(repeat):
+                _, completed = _python(setup + _POOL_SCENARIO.format(workers=workers, preload=preload, case=case))
+                runs.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+            best = min(runs, key=lambda r: r["first_case"])
+            private = [m[0] for m in best["memory"] if m[0] is not None]
+            shared = [m[1] for m in best["memory"] if m[1] is not None]
+            results.append({
+                "scenario": "worker_pool_preload" if preload else "worker_pool",
+                "workers": workers,
+                "wall_ms": round(best["first_case"] * 1000, 1),
+                "worker_private_mb": round(sum(private) / len(private) / 2**20, 1) if private else None,
+                "worker_shared_mb": round(sum(shared) / len(shared) / 2**20, 1) if shared else None,
+            })
+    return results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=2, help="workers in the pool scenarios")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per scenario (best is reported)")
+    parser.add_argument("--json", action="store_true", help="print results as JSON lines")
+    args = parser.parse_args(argv)
+
+    results = run(args.workers, args.repeat)
+    if args.json:
+        for row in results:
+            print(json.dumps(row))
+    else:
+        print(f"{'scenario':>20} {'wall ms':>10} {'private MB':>11} {'shared MB':>10}  heaviest imports (ms)")
+        for row in results:
+            print(f"{row['scenario']:>20} {row['wall_ms']:>10} {row.get('worker_private_mb', ''):>11} "
+                  f"{row.get('worker_shared_mb', ''):>10}  {', '.join(row.get('heaviest_imports_ms', []))}")
+    return results
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Risk model scoring latency: sklearn's RandomForestClassifier.predict_proba
+(single-threaded) versus the flat-array CompiledForest (forest_compiler.py),
+for a single case and for batches (tests/test_forest_scorer.py checks that
+both give identical probabilities). Use the crossover to set
+Config.RISK_MODEL_COMPILED_MAX_BATCH.
+
+Uses the model at --model when given, otherwise fits a forest on synthetic
+cases labelled by the rule engine.
+
+    python -m benchmarks.bench_forest_scorer
+    python -m benchmarks.bench_forest_scorer --model models/risk_scorer_model.pkl --cases 1 1000 100000 --json
+"""
+import argparse
+import json
+import time
+import numpy as np
+from sklearn.ensemble import RandomForestClassifier
+from feature_record import CATEGORIES, FIELD_INDEX, FIELDS, ML_FEATURE_COLUMNS, FeatureBatch
+from ml_risk_model import MLRiskModel
+from rule_engine import RuleEngine
+
+def synthetic_features(n, seed=42):
+    rng = np.random.default_rng(seed)
+    values = np.zeros((n, len(FIELDS)), dtype=np.float64)
+    values[:, FIELD_INDEX["square_footage"]] = rng.integers(600, 5000, n)
+    values[:, FIELD_INDEX["year_built"]] = np.where(rng.random(n) < 0.05, 0, rng.integers(1900, 2024, n))
+    values[:, FIELD_INDEX["image_num_defects"]] = rng.poisson(1.0, n)
+    values[:, FIELD_INDEX["multimodal_roof_conflict"]] = rng.random(n) < 0.1
+    values[:, FIELD_INDEX["combined_property_condition_score"]] = rng.integers(0, 5, n)
+    for field, categories in CATEGORIES.items():
+        values[:, FIELD_INDEX[field]] = rng.integers(0, len(categories), n)
+    return FeatureBatch(values)
+
+def fit_model(n_cases=20000, n_estimators=100):
+    batch = synthetic_features(n_cases, seed=7)
+    labels = RuleEngine().apply_rules_batch(batch.rule_columns())["overall_rule_based_risk"]
+    model = MLRiskModel()
+    model.model = RandomForestClassifier(n_estimators=n_estimators, random_state=42, n_jobs=1)
+    model.model.fit(batch.to_ml_matrix(ML_FEATURE_COLUMNS), labels)
+    model.feature_columns = list(ML_FEATURE_COLUMNS)
+    return model
+
+def _timed(score, X, repeat):
+    # Best of repeat runs: the least disturbed measurement of the same work
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = score(X)
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+def run(case_counts=(1, 1000, 100000), model_path=None, repeat=5):
+    if model_path:
+        model = MLRiskModel(model_path)
+        if not model.load_model():
+            raise SystemExit(f"Could not load {model_path}")
+    else:
+        model = fit_model()
+    compiled = model.compiled_forest()
+    if compiled is None:
+        raise SystemExit("The model is not a tree classifier; nothing to compile")
+
+    sklearn_model = MLRiskModel(model.model_path, use_compiled=False)
+    sklearn_model.model, sklearn_model.feature_columns = model.model, model.feature_columns
+
+    results = []
+    for n in case_counts:
+        X = synthetic_features(n).to_ml_matrix(model.feature_columns)
+        # One case repeats the call many times; batches a few times each
+        runs = repeat * 40 if n == 1 else repeat
+        sklearn_sec, _ = _timed(lambda X: sklearn_model.predict_batch(X, n_jobs=1), X, runs)
+        compiled_sec, _ = _timed(compiled.predict_proba, X, runs)
+
+        results.append({
+            "cases": n,
+            "trees": compiled.n_trees,
+            "nodes": compiled.n_nodes,
+            "sklearn_ms": round(sklearn_sec * 1000, 3),
+            "compiled_ms": round(compiled_sec * 1000, 3),
+            "sklearn_cases_per_sec": round(n / sklearn_sec),
+            "compiled_cases_per_sec": round(n / compiled_sec),
+            "speedup": round(sklearn_sec / compiled_sec, 1),
+        })
+    return results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cases", type=int, nargs="+", default=[1, 1000, 100000])
+    parser.add_argument("--model", default=None, help="saved risk model (defaults to a synthetic 100-tree forest)")
+    parser.add_argument("--repeat", type=int, default=5, help="timed runs per batch size (best is reported)")
+    parser.add_argument("--json", action="store_true", help="print results as JSON lines")
+    args = parser.parse_args(argv)
+
+    results = run(args.cases, args.model, args.repeat)
+    if args.json:
+        for row in results:
+            print(json.dumps(row))
+    else:
+        print(f"{'cases':>8} {'sklearn ms':>12} {'compiled ms':>12} {'compiled/s':>12} {'speedup':>8}")
+        for row in results:
+            print(f"{row['cases']:>8} {row['sklearn_ms']:>12} {row['compiled_ms']:>12} "
+                  f"{row['compiled_cases_per_sec']:>12} {row['speedup']:>8}")
+    return results
+
+if __name__ == "__main__":
+    main()
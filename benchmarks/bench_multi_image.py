@@ -0,0 +1,134 @@
+"""
+Image stage cost against the number of photos in a packet: every photo run
+through the detector (triage, dedup and the photo budget off) versus
+ImageAnalyzer.analyze_property_images as configured. Each packet is half
+distinct house photos (corpus photos with their own foreground objects, so
+no two show the same scene), a quarter near-duplicates of them (resized and
+recompressed) and a quarter scanned document pages, like the images
+embedded in a real appraisal.
+
+analyzed is how many images reached the detector; with triage and dedup it
+should equal the number of distinct photos. The stub detector costs next to
+nothing, so it's charged --detector-ms per image on top (roughly a small CNN
+on one CPU core) to make the detector's share of the stage realistic.
+
+    python -m benchmarks.bench_multi_image
+    python -m benchmarks.bench_multi_image --photos 1 8 32 64 --detector-ms 0 --repeat 5 --json
+"""
+import argparse
+import io
+import json
+import os
+import tempfile
+import time
+import numpy as np
+from PIL import Image, ImageDraw
+from defect_detector import StubDefectBackend
+from image_analyzer import ImageAnalyzer
+from benchmarks.corpus import EMBEDDED_PHOTO_SIZE, _scanned_page, synthetic_photo
+
+class TimedStubBackend(StubDefectBackend):
+    """The stub detector, taking detector_ms per image like a real model would."""
+    def __init__(self, detector_ms):
+        super().__init__()
+        self.detector_ms = detector_ms
+
+    def predict(self, batch):
+        time.sleep(self.detector_ms * len(batch) / 1000)
+        return super().predict(batch)
+
+def distinct_photo(rng):
+    # Corpus photos share one layout (sky, house, lawn); trees, cars and the
+    # like in random places and colors make each one a different scene
+    image = synthetic_photo(rng, EMBEDDED_PHOTO_SIZE)
+    draw = ImageDraw.Draw(image)
+    width, height = image.size
+    for _ in range(6):
+        x, y, r = rng.integers(0, width), rng.integers(0, height), int(rng.uniform(0.05, 0.15) * width)
+        draw.ellipse([x - r, y - r, x + r, y + r], fill=tuple(int(c) for c in rng.integers(0, 256, 3)))
+    return image
+
+def write_packet(directory, n_photos, seed=0):
+    """Writes n_photos JPEGs to directory; returns (paths, number of distinct photos)."""
+    rng = np.random.default_rng(seed)
+    n_distinct = max(1, (n_photos + 1) // 2)
+    n_duplicates = min(n_photos - n_distinct, n_photos // 4)
+    paths, photos = [], []
+    for i in range(n_photos):
+        path = os.path.join(directory, f"image_{n_photos}_{i:03d}.jpg")
+        if i < n_distinct:
+            image = distinct_photo(rng)
+            photos.append(image)
+            image.save(path, format="JPEG", quality=85)
+        elif i < n_distinct + n_duplicates:
+            # The same photo again, resized and recompressed, as when it's both uploaded and embedded
+            original = photos[i - n_distinct]
+            copy = original.resize((original.width * 3 // 4, original.height * 3 // 4), Image.BILINEAR)
+            buffer = io.BytesIO()
+            copy.save(buffer, format="JPEG", quality=60)
+            Image.open(buffer).save(path, format="JPEG", quality=90)
+        else:
+            _scanned_page(rng, ["Narrative continued"] * 30).save(path, format="JPEG", quality=75)
+        paths.append(path)
+    return paths, n_distinct
+
+def _timed(fn, arg, repeat):
+    # Best of repeat runs: the least disturbed measurement of the same work
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn(arg)
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+def run(photo_counts=(1, 4, 16, 64, 128), detector_ms=20.0, repeat=3):
+    every_photo = ImageAnalyzer(backend=TimedStubBackend(detector_ms), triage=False, dedup_max_distance=None,
+                                max_photos=None)
+    selective = ImageAnalyzer(backend=TimedStubBackend(detector_ms))
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in photo_counts:
+            paths, n_distinct = write_packet(tmp, n)
+            every_sec, every_result = _timed(every_photo.analyze_property_images, paths, repeat)
+            selective_sec, result = _timed(selective.analyze_property_images, paths, repeat)
+            stats = result["photo_stats"]
+            results.append({
+                "photos": n,
+                "detector_ms": detector_ms,
+                "distinct": n_distinct,
+                "analyzed": stats["analyzed"],
+                "duplicates": stats["duplicates"],
+                "skipped": sum(stats["skipped"].values()),
+                "every_photo_ms": round(every_sec * 1000, 1),
+                "selective_ms": round(selective_sec * 1000, 1),
+                "selective_ms_per_photo": round(selective_sec * 1000 / n, 2),
+                "speedup": round(every_sec / selective_sec, 2),
+                "every_photo_analyzed": every_result["photo_stats"]["analyzed"],
+            })
+    every_photo.close()
+    selective.close()
+    return results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--photos", type=int, nargs="+", default=[1, 4, 16, 64, 128], help="photos per packet")
+    parser.add_argument("--detector-ms", type=float, default=20.0, help="simulated detector cost per image")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per packet (best is reported)")
+    parser.add_argument("--json", action="store_true", help="print results as JSON lines")
+    args = parser.parse_args(argv)
+
+    results = run(args.photos, args.detector_ms, args.repeat)
+    if args.json:
+        for row in results:
+            print(json.dumps(row))
+    else:
+        print(f"{'photos':>7} {'distinct':>9} {'analyzed':>9} {'dups':>5} {'skipped':>8} "
+              f"{'every ms':>10} {'selective ms':>13} {'ms/photo':>9} {'speedup':>8}")
+        for row in results:
+            print(f"{row['photos']:>7} {row['distinct']:>9} {row['analyzed']:>9} {row['duplicates']:>5} "
+                  f"{row['skipped']:>8} {row['every_photo_ms']:>10} {row['selective_ms']:>13} "
+                  f"{row['selective_ms_per_photo']:>9} {row['speedup']:>8}")
+    return results
+
+if __name__ == "__main__":
+    main()
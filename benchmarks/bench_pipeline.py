@@ -0,0 +1,176 @@
+"""
+Per-stage and end-to-end latency of the underwriting pipeline on a synthetic
+appraisal corpus (see benchmarks/corpus.py): OCRParser, ReportParser,
+ImageAnalyzer, DataIntegrator, RuleEngine and MLRiskModel one at a time, then
+whole cases through main.run_underwriting_case. The stage cache is off, so
+every number is real work.
+
+Parsed fields are checked against the corpus manifest (field_accuracy). OCR
+of scanned pages needs Tesseract; without it scanned pages are skipped and
+the ocr row says so (ocr_fallback=false).
+
+    python -m benchmarks.bench_pipeline
+    python -m benchmarks.bench_pipeline --corpus data/bench_corpus --cases 50 --repeat 3 --json
+"""
+import argparse
+import json
+import os
+import time
+import numpy as np
+import pytesseract
+from config import Config
+from data_integrator import DataIntegrator
+from image_analyzer import ImageAnalyzer
+from ocr_parser import OCRParser
+from report_parser import ReportParser
+from rule_engine import RuleEngine
+from benchmarks.bench_forest_scorer import fit_model
+from benchmarks.corpus import generate_corpus
+
+STAGE_ORDER = ["ocr", "parse", "image", "fuse", "rules", "ml", "end_to_end"]
+
+def tesseract_available():
+    try:
+        pytesseract.get_tesseract_version()
+        return True
+    except Exception:
+        return False
+
+def _summary(stage, seconds, **extra):
+    ms = np.array(seconds) * 1000
+    row = {
+        "stage": stage,
+        "count": len(ms),
+        "p50_ms": round(float(np.percentile(ms, 50)), 3),
+        "p95_ms": round(float(np.percentile(ms, 95)), 3),
+        "mean_ms": round(float(ms.mean()), 3),
+        "max_ms": round(float(ms.max()), 3),
+        "per_sec": round(1000 / float(ms.mean()), 1) if ms.mean() > 0 else None,
+    }
+    row.update(extra)
+    return row
+
+def _timed(fn, *args):
+    started = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - started, result
+
+def _field_accuracy(parsed, cases, ocr_fallback):
+    # Fields on scanned pages only count when they could have been OCR'd
+    matched = expected = 0
+    for result, case in zip(parsed, cases):
+        improvements_scanned = len(case["layout"]) > 1 and case["layout"][1] == "scanned"
+        for field, value in case["fields"].items():
+            if improvements_scanned and not ocr_fallback and field.endswith("_text"):
+                continue
+            expected += 1
+            matched += (result.get(field) or "").strip() == value
+    return round(matched / expected, 4) if expected else None
+
+def build_components():
+    ocr_parser = OCRParser(Config.TESSERACT_CMD, ocr_workers=1, cache_dir=None)
+    return {
+        "ocr_parser": ocr_parser,
+        "report_parser": ReportParser(),
+        "image_analyzer": ImageAnalyzer(Config.IMAGE_MODEL_PATH),
+        "data_integrator": DataIntegrator(),
+        "rule_engine": RuleEngine(),
+        "ml_model": fit_model(), # the same synthetic forest every run, so results are comparable
+        "cache": None,
+    }
+
+def run(corpus_dir=os.path.join("data", "bench_corpus"), cases=20, repeat=1, end_to_end=True):
+    manifest = generate_corpus(corpus_dir, cases)
+    corpus = manifest["cases"]
+    reports = [os.path.join(corpus_dir, case["report"]) for case in corpus]
+    photos = [os.path.join(corpus_dir, case["photo"]) for case in corpus]
+
+    ocr_fallback = Config.OCR_FALLBACK_ENABLED and tesseract_available()
+    components = build_components()
+    ocr_parser, report_parser = components["ocr_parser"], components["report_parser"]
+    image_analyzer, data_integrator = components["image_analyzer"], components["data_integrator"]
+    rule_engine, ml_model = components["rule_engine"], components["ml_model"]
+
+    # One untimed pass over the first case: regex compilation, model compilation
+    # and detector warm-up are startup costs, not per-case latency
+    text, _ = ocr_parser.extract_text_from_pdf(reports[0], lazy_images=True, ocr_fallback=ocr_fallback)
+    record = data_integrator.integrate_record(report_parser.parse_text(text), image_analyzer.analyze_property_image(photos[0]))
+    rule_engine.apply_rules(record)
+    ml_model.predict_risk(record)
+
+    timings = {stage: [] for stage in STAGE_ORDER}
+    pages = ocr_pages = 0
+    for round_index in range(repeat):
+        texts, parsed, images, records = [], [], [], []
+        for report in reports:
+            seconds, (text, _) = _timed(lambda: ocr_parser.extract_text_from_pdf(report, lazy_images=True, ocr_fallback=ocr_fallback))
+            timings["ocr"].append(seconds)
+            if round_index == 0:
+                pages += ocr_parser.last_ocr_stats["pages"]
+                ocr_pages += ocr_parser.last_ocr_stats["ocr_pages"]
+            texts.append(text)
+        for text in texts:
+            seconds, result = _timed(report_parser.parse_text, text)
+            timings["parse"].append(seconds)
+            parsed.append(result)
+        for photo in photos:
+            seconds, result = _timed(image_analyzer.analyze_property_image, photo)
+            timings["image"].append(seconds)
+            images.append(result)
+        for text_data, image_data in zip(parsed, images):
+            seconds, record = _timed(data_integrator.integrate_record, text_data, image_data)
+            timings["fuse"].append(seconds)
+            records.append(record)
+        for record in records:
+            timings["rules"].append(_timed(rule_engine.apply_rules, record)[0])
+            timings["ml"].append(_timed(ml_model.predict_risk, record)[0])
+
+    if end_to_end:
+        from main import run_underwriting_case
+        previous_fallback = Config.OCR_FALLBACK_ENABLED
+        Config.OCR_FALLBACK_ENABLED = ocr_fallback
+        try:
+            for _ in range(repeat):
+                for case, report, photo in zip(corpus, reports, photos):
+                    timings["end_to_end"].append(_timed(run_underwriting_case, report, photo, components, case["case_id"])[0])
+        finally:
+            Config.OCR_FALLBACK_ENABLED = previous_fallback
+    image_analyzer.close()
+    ocr_parser.close()
+
+    ocr_seconds = sum(timings["ocr"][:len(reports)])
+    extras = {
+        "ocr": {"pages": pages, "ocr_pages": ocr_pages, "ocr_fallback": ocr_fallback,
+                "pages_per_sec": round(pages / ocr_seconds, 1) if ocr_seconds else None},
+        "parse": {"field_accuracy": _field_accuracy(parsed, corpus, ocr_fallback)},
+        "image": {"photo_size": manifest["params"]["photo_size"]},
+        "end_to_end": {"ocr_fallback": ocr_fallback},
+    }
+    return [_summary(stage, timings[stage], **extras.get(stage, {})) for stage in STAGE_ORDER if timings[stage]]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", default=os.path.join("data", "bench_corpus"), help="corpus directory (generated if missing)")
+    parser.add_argument("--cases", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=1, help="passes over the corpus")
+    parser.add_argument("--no-end-to-end", dest="end_to_end", action="store_false")
+    parser.add_argument("--json", action="store_true", help="print results as JSON lines")
+    args = parser.parse_args(argv)
+
+    results = run(args.corpus, args.cases, args.repeat, args.end_to_end)
+    if args.json:
+        for row in results:
+            print(json.dumps(row))
+    else:
+        print(f"{'stage':>12} {'count':>6} {'p50 ms':>10} {'p95 ms':>10} {'mean ms':>10} {'per sec':>10}")
+        for row in results:
+            print(f"{row['stage']:>12} {row['count']:>6} {row['p50_ms']:>10} {row['p95_ms']:>10} "
+                  f"{row['mean_ms']:>10} {row['per_sec']:>10}")
+        for row in results:
+            extra = {k: v for k, v in row.items() if k not in ("stage", "count", "p50_ms", "p95_ms", "mean_ms", "max_ms", "per_sec")}
+            if extra:
+                print(f"{row['stage']}: {extra}")
+    return results
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Parse time of ReportParser against field count and document size.
+
+Compares the single-pass compiled extractor with the previous approach of one
+re.search per field over the whole document. Fields are placed near the end of
+the document, which is the worst case for both. tests/test_report_parser.py
+checks that both extract the same values.
+
+    python -m benchmarks.bench_report_parser
+    python -m benchmarks.bench_report_parser --fields 6 50 200 --pages 1 20 200 --json
+"""
+import argparse
+import json
+import re
+import time
+from report_parser import ReportParser, default_field_registry
+
+FILLER_LINE = "The subject property is located in an established neighborhood with average market appeal.\n"
+LINES_PER_PAGE = 50
+
+def _field_word(i):
+    # aa, ab, ... so no synthetic label is a prefix of another
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    return letters[i // 26 % 26] + letters[i % 26]
+
+def build_parser(num_fields):
+    registry = default_field_registry()
+    for i in range(max(0, num_fields - len(registry.names()))):
+        registry.register(f"attr_{i}", rf"attribute\s+{_field_word(i)}\b", r"[:\s]*(.*?)(?:\n|$)")
+    return ReportParser(registry)
+
+def build_document(num_pages, num_fields):
+    body = FILLER_LINE * (LINES_PER_PAGE * num_pages)
+    fields = [
+        "Property Address: 123 Elm Street, Springfield, IL 62704\n",
+        "Property Type: Single Family Home\n",
+        "Year Built: 1985\n",
+        "Total Living Area: 1850 sq ft\n",
+        "Roof Condition: Fair, some granular loss.\n",
+        "Foundation Condition: Solid, no visible cracks.\n",
+    ]
+    fields += [f"Attribute {_field_word(i).upper()}: value {i}\n" for i in range(max(0, num_fields - 6))]
+    return body + "".join(fields)
+
+def legacy_parse(patterns, text):
+    extracted_data = {}
+    for key, pattern in patterns.items():
+        match = re.search(pattern, text, re.IGNORECASE)
+        extracted_data[key] = match.group(1).strip() if match else None
+    return extracted_data
+
+def _best_of(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+def run(field_counts=(6, 25, 100, 200), page_counts=(1, 20, 200), repeat=5):
+    results = []
+    for num_fields in field_counts:
+        parser = build_parser(num_fields)
+        patterns = parser.patterns
+        for num_pages in page_counts:
+            text = build_document(num_pages, num_fields)
+            legacy = _best_of(lambda: legacy_parse(patterns, text), repeat)
+            compiled = _best_of(lambda: parser.parse_text(text), repeat)
+            results.append({
+                "fields": num_fields,
+                "pages": num_pages,
+                "doc_chars": len(text),
+                "legacy_ms": round(legacy * 1000, 3),
+                "compiled_ms": round(compiled * 1000, 3),
+                "speedup": round(legacy / compiled, 2) if compiled else None,
+            })
+    return results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--fields", type=int, nargs="+", default=[6, 25, 100, 200])
+    parser.add_argument("--pages", type=int, nargs="+", default=[1, 20, 200])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--json", action="store_true", help="print results as JSON lines")
+    args = parser.parse_args(argv)
+
+    results = run(args.fields, args.pages, args.repeat)
+    if args.json:
+        for row in results:
+            print(json.dumps(row))
+    else:
+        print(f"{'fields':>6} {'pages':>6} {'chars':>10} {'legacy ms':>10} {'compiled ms':>12} {'speedup':>8}")
+        for row in results:
+            print(f"{row['fields']:>6} {row['pages']:>6} {row['doc_chars']:>10} {row['legacy_ms']:>10} {row['compiled_ms']:>12} {row['speedup']:>8}")
+    return results
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Re-deciding stored cases after a rules change: rescoring.Rescorer (the
+features table in batches through RuleEngine.apply_rules_batch and
+MLRiskModel.predict_batch) versus re-running the rules and model one case at
+a time, as run_underwriting_case would after OCR and image analysis (which
+neither pays). tests/test_rescoring.py checks that both reach the same
+decisions.
+
+Each case count gets a fresh feature store of synthetic cases
+(bench_forest_scorer.synthetic_features), decided with
+Config.UNDERWRITING_RULES and a forest fitted on synthetic cases, then
+re-decided with medium flood zones made HIGH_RISK. A second Rescorer run
+should find every case up to date.
+
+    python -m benchmarks.bench_rescoring
+    python -m benchmarks.bench_rescoring --cases 1000 100000 --json
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+from config import Config
+from feature_store import FeatureStore
+from main import final_underwriting_decision
+from rescoring import Rescorer
+from rule_engine import RuleEngine
+from benchmarks.bench_forest_scorer import fit_model, synthetic_features
+
+CHANGED_RULES = dict(Config.UNDERWRITING_RULES,
+                     flood_zone={"high": "DECLINE", "medium": "HIGH_RISK", "low": "STANDARD"})
+
+def build_store(root, batch, rule_engine, ml_model):
+    """Feature store holding batch as processed cases, decided by rule_engine and ml_model."""
+    rules = RuleEngine.batch_to_records(rule_engine.apply_rules_batch(batch.rule_columns()))
+    labels, probabilities = ml_model.predict_batch(batch.to_ml_matrix(ml_model.feature_columns))
+    versions = {"rules": rule_engine.version, "model": ml_model.model_version, "model_hash": ml_model.model_hash}
+    with FeatureStore(root) as store:
+        for i in range(len(batch)):
+            ml_prediction = {"predicted_label": labels[i],
+                             "probabilities": dict(zip(ml_model.classes, probabilities[i]))}
+            store.append_case({
+                "case_id": f"case_{i:07d}", "features": batch.values[i], "versions": versions,
+                "rule_based_assessment": rules[i], "ml_prediction": ml_prediction,
+                "decision": final_underwriting_decision(rules[i]["decision"], labels[i]),
+            })
+
+def per_case(batch, rule_engine, ml_model):
+    decisions = []
+    for i in range(len(batch)):
+        record = batch.record(i)
+        rules = rule_engine.apply_rules(record)
+        ml_prediction = ml_model.predict_risk(record)
+        decisions.append(final_underwriting_decision(rules["decision"], ml_prediction["predicted_label"]))
+    return decisions
+
+def run(case_counts=(1000, 10000, 100000)):
+    ml_model = fit_model()
+    ml_model.model_version, ml_model.model_hash = "bench", "bench"
+    old_rules, new_rules = RuleEngine(Config.UNDERWRITING_RULES), RuleEngine(CHANGED_RULES)
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in case_counts:
+            batch = synthetic_features(n)
+            root = os.path.join(tmp, f"store_{n}")
+            build_store(root, batch, old_rules, ml_model)
+
+            started = time.perf_counter()
+            per_case(batch, new_rules, ml_model)
+            per_case_sec = time.perf_counter() - started
+
+            output_path = os.path.join(tmp, f"changed_{n}.jsonl")
+            rescorer = Rescorer(FeatureStore(root), new_rules, ml_model, output_path=output_path)
+            started = time.perf_counter()
+            summary = rescorer.run()
+            rescore_sec = time.perf_counter() - started
+            second = Rescorer(FeatureStore(root), new_rules, ml_model, output_path=output_path).run()
+
+            results.append({
+                "cases": n,
+                "rescored": summary["rescored"],
+                "changed": summary["changed"],
+                "per_case_cases_per_sec": round(n / per_case_sec),
+                "rescore_cases_per_sec": round(n / rescore_sec),
+                "speedup": round(per_case_sec / rescore_sec, 1),
+                "up_to_date_ms": round(second["elapsed_sec"] * 1000, 1),
+            })
+    return results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cases", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--json", action="store_true", help="print results as JSON lines")
+    args = parser.parse_args(argv)
+
+    results = run(args.cases)
+    if args.json:
+        for row in results:
+            print(json.dumps(row))
+    else:
+        print(f"{'cases':>8} {'rescored':>9} {'changed':>8} {'per-case/s':>11} {'rescore/s':>10} {'speedup':>8} {'2nd run ms':>11}")
+        for row in results:
+            print(f"{row['cases']:>8} {row['rescored']:>9} {row['changed']:>8} {row['per_case_cases_per_sec']:>11} "
+                  f"{row['rescore_cases_per_sec']:>10} {row['speedup']:>8} {row['up_to_date_ms']:>11}")
+    return results
+
+if __name__ == "__main__":
+    main()
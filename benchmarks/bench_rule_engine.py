@@ -0,0 +1,75 @@
+"""
+Batch throughput of RuleEngine: one apply_rules call per case versus one
+vectorized apply_rules_batch call over the whole batch. That both modes give
+identical results for every case is checked by tests/test_rule_engine.py.
+
+    python -m benchmarks.bench_rule_engine
+    python -m benchmarks.bench_rule_engine --cases 1000 10000 100000 --json
+"""
+import argparse
+import json
+import time
+import numpy as np
+from rule_engine import RuleEngine
+
+def synthetic_cases(n, seed=42):
+    # Columns as they come out of DataIntegrator, including missing values
+    rng = np.random.default_rng(seed)
+    def pick(values, p=None):
+        column = np.empty(n, dtype=object)
+        column[:] = [values[i] for i in rng.choice(len(values), size=n, p=p)]
+        return column
+    return {
+        "text_roof_condition_classified": pick(["good", "fair", "poor", "unknown"]),
+        "text_foundation_cracks_detected": pick(["yes", "no"], p=[0.1, 0.9]),
+        "text_year_built": pick([None, "1925", "1960", "1985", "2001", "2019", "1,999"]),
+        "text_flood_zone": pick(["low", "medium", "high", "unknown"], p=[0.7, 0.15, 0.05, 0.1]),
+        "image_overall_condition_ai": pick(["good", "fair", "poor", None]),
+        "multimodal_roof_conflict": pick([True, False], p=[0.1, 0.9]),
+    }
+
+def _case(columns, i):
+    return {name: column[i] for name, column in columns.items()}
+
+def run(case_counts=(1000, 10000, 100000), rules_path=None):
+    engine = RuleEngine(rules_path=rules_path) if rules_path else RuleEngine()
+    results = []
+    for n in case_counts:
+        columns = synthetic_cases(n)
+        cases = [_case(columns, i) for i in range(n)]
+
+        started = time.perf_counter()
+        [engine.apply_rules(case) for case in cases]
+        single_sec = time.perf_counter() - started
+
+        started = time.perf_counter()
+        engine.apply_rules_batch(columns)
+        batch_sec = time.perf_counter() - started
+
+        results.append({
+            "cases": n,
+            "single_cases_per_sec": round(n / single_sec),
+            "batch_cases_per_sec": round(n / batch_sec),
+            "speedup": round(single_sec / batch_sec, 1),
+        })
+    return results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cases", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--rules", default=None, help="rules file (defaults to RuleEngine's default)")
+    parser.add_argument("--json", action="store_true", help="print results as JSON lines")
+    args = parser.parse_args(argv)
+
+    results = run(args.cases, args.rules)
+    if args.json:
+        for row in results:
+            print(json.dumps(row))
+    else:
+        print(f"{'cases':>8} {'single/s':>12} {'batch/s':>12} {'speedup':>8}")
+        for row in results:
+            print(f"{row['cases']:>8} {row['single_cases_per_sec']:>12} {row['batch_cases_per_sec']:>12} {row['speedup']:>8}")
+    return results
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+"""
+Synthetic appraisal corpus for benchmarks: multi-page PDF reports with a mix
+of text-layer and scanned (image-only) pages and embedded photo addendum
+pages, plus a full-resolution property photo per case. Everything is derived
+from the seed, so the same arguments always produce the same files.
+
+Each case's true field values and page layout go into manifest.json, so
+benchmarks can check what they extracted, not just how fast. A corpus that
+already exists with the same parameters is reused rather than regenerated.
+
+    python -m benchmarks.corpus --out data/bench_corpus
+    python -m benchmarks.corpus --out data/bench_corpus --cases 50 --pages 2 40 --scanned 0.3
+"""
+import argparse
+import io
+import json
+import os
+import textwrap
+import time
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfgen import canvas
+
+MANIFEST = "manifest.json"
+CORPUS_VERSION = "1" # Bump when the generated files change for the same parameters
+
+PHOTO_SIZE = (4032, 3024) # 12 MP, a typical phone camera photo
+EMBEDDED_PHOTO_SIZE = (1600, 1200)
+SCAN_DPI = 150
+
+STREETS = ["Elm Street", "Oak Avenue", "Maple Drive", "Cedar Lane", "Pine Court", "Lakeview Road", "Hillcrest Blvd"]
+CITIES = ["Springfield, IL 62704", "Madison, WI 53703", "Columbus, OH 43215", "Austin, TX 78701", "Raleigh, NC 27601"]
+PROPERTY_TYPES = ["Single Family Home", "Townhouse", "Condominium", "Duplex", "Manufactured Home"]
+ROOF_TEXTS = [
+    "Good, replaced in the last five years.", "Good, new architectural shingles.", "Fair, some granular loss.",
+    "Average wear consistent with age.", "Poor, several missing shingles.", "Damaged, active leaking over the garage.",
+]
+FOUNDATION_TEXTS = [
+    "Solid, no visible cracks.", "Poured concrete, dry basement.", "Minor settlement crack at the northeast corner.",
+    "Block foundation with a horizontal crack along the rear wall.", "Slab on grade, no issues noted.",
+]
+FLOOD_ZONE_TEXTS = ["X (unshaded)", "Zone X", "X (shaded)", "Zone B", "Zone AE", "VE", "C", "Minimal flood hazard"]
+NARRATIVE = (
+    "The subject property is located in an established residential neighborhood with average market appeal. "
+    "Comparable sales were selected from the immediate market area and adjusted for differences in gross "
+    "living area, condition, site size and amenities. Marketing time is estimated at three to six months. "
+    "No adverse easements, encroachments or environmental conditions were observed at the time of inspection. "
+    "The highest and best use of the site as improved is its present use. "
+)
+
+def case_fields(rng, i):
+    """True values of the appraisal fields ReportParser extracts, for case i."""
+    return {
+        "property_address": f"{int(rng.integers(10, 9999))} {STREETS[rng.integers(len(STREETS))]}, "
+                            f"{CITIES[rng.integers(len(CITIES))]}",
+        "property_type": PROPERTY_TYPES[rng.integers(len(PROPERTY_TYPES))],
+        "year_built": str(int(rng.integers(1900, 2024))),
+        "square_footage": f"{int(rng.integers(600, 5000)):,}",
+        "roof_condition_text": ROOF_TEXTS[rng.integers(len(ROOF_TEXTS))],
+        "foundation_condition_text": FOUNDATION_TEXTS[rng.integers(len(FOUNDATION_TEXTS))],
+        "flood_zone_text": FLOOD_ZONE_TEXTS[rng.integers(len(FLOOD_ZONE_TEXTS))],
+    }
+
+def _subject_lines(fields):
+    return [
+        "UNIFORM RESIDENTIAL APPRAISAL REPORT", "", "SUBJECT",
+        f"Property Address: {fields['property_address']}",
+        f"Property Type: {fields['property_type']}",
+        f"Year Built: {fields['year_built']}",
+        f"Total Living Area: {fields['square_footage']} sq ft",
+    ]
+
+def _improvement_lines(fields):
+    return [
+        "IMPROVEMENTS AND SITE", "",
+        f"Roof Condition: {fields['roof_condition_text']}",
+        f"Foundation Condition: {fields['foundation_condition_text']}",
+        f"Flood Zone: {fields['flood_zone_text']}",
+    ]
+
+def _narrative_lines(rng, n_paragraphs):
+    lines = []
+    for _ in range(n_paragraphs):
+        sentences = [s.strip(". ") for s in NARRATIVE.split(". ") if s.strip(". ")]
+        rng.shuffle(sentences)
+        lines += textwrap.wrap(". ".join(sentences) + ".", 95) + [""]
+    return lines
+
+def synthetic_photo(rng, size):
+    """A house-like scene with sensor noise, so it compresses (and decodes) like a real photo."""
+    width, height = size
+    # Coarse scene at 1/8 scale: sky gradient, a house block with a roof band, lawn
+    w, h = width // 8, height // 8
+    scene = np.empty((h, w, 3), dtype=np.float32)
+    horizon = int(h * rng.uniform(0.55, 0.7))
+    scene[:horizon] = np.linspace([120, 170, 230], [200, 220, 240], horizon)[:, None, :]
+    scene[horizon:] = np.array([70, 120, 60]) + rng.normal(0, 10, (h - horizon, w, 3))
+    left, right = sorted(rng.integers(w // 8, 7 * w // 8, 2))
+    top = int(horizon * rng.uniform(0.3, 0.5))
+    scene[top:horizon, left:right] = rng.uniform(120, 220, 3)
+    scene[top:top + max(1, (horizon - top) // 4), left:right] = rng.uniform(40, 100, 3)
+    image = Image.fromarray(scene.clip(0, 255).astype(np.uint8)).resize(size, Image.BILINEAR)
+    pixels = np.asarray(image, dtype=np.int16) + rng.integers(-12, 13, (height, width, 1), dtype=np.int16)
+    return Image.fromarray(pixels.clip(0, 255).astype(np.uint8))
+
+def _jpeg_bytes(image, quality):
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=quality)
+    return buffer.getvalue()
+
+def _scanned_page(rng, lines):
+    """A page of text rendered to a slightly skewed, noisy grayscale bitmap (no text layer)."""
+    width, height = int(8.5 * SCAN_DPI), int(11 * SCAN_DPI)
+    page = Image.new("L", (width, height), 245)
+    draw = ImageDraw.Draw(page)
+    font = ImageFont.load_default(size=int(SCAN_DPI / 7))
+    y = SCAN_DPI
+    for line in lines:
+        draw.text((SCAN_DPI, y), line, fill=20, font=font)
+        y += int(SCAN_DPI / 5)
+    page = page.rotate(rng.uniform(-0.8, 0.8), fillcolor=245)
+    pixels = np.asarray(page, dtype=np.int16) + rng.integers(-15, 16, (height, width), dtype=np.int16)
+    return Image.fromarray(pixels.clip(0, 255).astype(np.uint8))
+
+def _draw_text_page(pdf, lines):
+    pdf.setFont("Helvetica", 10)
+    y = letter[1] - 72
+    for line in lines:
+        pdf.drawString(72, y, line)
+        y -= 14
+
+def _draw_image_page(pdf, jpeg, caption=None):
+    # JPEG bytes are embedded as they are (DCTDecode), like a scanner or camera would produce
+    reader = ImageReader(io.BytesIO(jpeg))
+    image_width, image_height = reader.getSize()
+    scale = min((letter[0] - 72) / image_width, (letter[1] - 108) / image_height)
+    pdf.drawImage(reader, 36, letter[1] - 36 - image_height * scale, image_width * scale, image_height * scale)
+    if caption:
+        pdf.setFont("Helvetica", 10)
+        pdf.drawString(36, 40, caption)
+
+def write_report(path, fields, rng, n_pages, scanned_fraction, n_photos):
+    """
+    Writes one report and returns its page layout. Page 1 (subject fields) always
+    has a text layer; the improvements page and narrative pages are scanned with
+    probability scanned_fraction; the last n_photos pages are photo addenda.
+    """
+    layout = []
+    pdf = canvas.Canvas(path, pagesize=letter, invariant=1) # invariant: no timestamps, byte-identical reruns
+    n_text_pages = max(2, n_pages - n_photos)
+    for page_index in range(n_text_pages):
+        if page_index == 0:
+            lines, kind = _subject_lines(fields), "text"
+        else:
+            lines = (_improvement_lines(fields) + [""] if page_index == 1 else []) + _narrative_lines(rng, 4)
+            kind = "scanned" if rng.random() < scanned_fraction else "text"
+        if kind == "scanned":
+            _draw_image_page(pdf, _jpeg_bytes(_scanned_page(rng, lines), 75))
+        else:
+            _draw_text_page(pdf, lines)
+        layout.append(kind)
+        pdf.showPage()
+    for photo_index in range(n_photos):
+        _draw_image_page(pdf, _jpeg_bytes(synthetic_photo(rng, EMBEDDED_PHOTO_SIZE), 85), f"Photo {photo_index + 1}")
+        layout.append("photo")
+        pdf.showPage()
+    pdf.save()
+    return layout
+
+def _load_manifest(output_dir):
+    try:
+        with open(os.path.join(output_dir, MANIFEST)) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+def generate_corpus(output_dir, cases=20, seed=0, pages=(2, 12), scanned_fraction=0.25, photos=(0, 2),
+                    photo_size=PHOTO_SIZE):
+    """
+    Generates (or reuses) a corpus in output_dir and returns its manifest:
+    {"params": {...}, "cases": [{"case_id", "report", "photo", "layout", "fields"}, ...]}
+    with report/photo paths relative to output_dir.
+    """
+    params = {"version": CORPUS_VERSION, "cases": cases, "seed": seed, "pages": list(pages),
+              "scanned_fraction": scanned_fraction, "photos": list(photos), "photo_size": list(photo_size)}
+    manifest = _load_manifest(output_dir)
+    if manifest is not None and manifest["params"] == params and all(
+            os.path.exists(os.path.join(output_dir, case[name])) for case in manifest["cases"] for name in ("report", "photo")):
+        return manifest
+
+    os.makedirs(output_dir, exist_ok=True)
+    started = time.perf_counter()
+    entries = []
+    for i in range(cases):
+        rng = np.random.default_rng([seed, i])
+        case_id = f"case_{i:04d}"
+        fields = case_fields(rng, i)
+        n_photos = int(rng.integers(photos[0], photos[1] + 1))
+        n_pages = int(rng.integers(pages[0], pages[1] + 1))
+        report, photo = f"{case_id}.pdf", f"{case_id}.jpg"
+        layout = write_report(os.path.join(output_dir, report), fields, rng, n_pages, scanned_fraction, n_photos)
+        synthetic_photo(rng, tuple(photo_size)).save(os.path.join(output_dir, photo), format="JPEG", quality=90)
+        entries.append({"case_id": case_id, "report": report, "photo": photo, "layout": layout, "fields": fields})
+
+    manifest = {"params": params, "cases": entries}
+    with open(os.path.join(output_dir, MANIFEST), "w") as f:
+        json.dump(manifest, f, indent=2)
+    print(f"Generated {cases} cases in {output_dir} ({time.perf_counter() - started:.1f}s)")
+    return manifest
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--out", default=os.path.join("data", "bench_corpus"))
+    parser.add_argument("--cases", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--pages", type=int, nargs=2, default=[2, 12], metavar=("MIN", "MAX"))
+    parser.add_argument("--scanned", type=float, default=0.25, help="fraction of pages after the first that are scanned")
+    parser.add_argument("--photos", type=int, nargs=2, default=[0, 2], metavar=("MIN", "MAX"),
+                        help="photo addendum pages per report")
+    parser.add_argument("--photo-size", type=int, nargs=2, default=list(PHOTO_SIZE), metavar=("WIDTH", "HEIGHT"))
+    args = parser.parse_args(argv)
+
+    manifest = generate_corpus(args.out, args.cases, args.seed, tuple(args.pages), args.scanned, tuple(args.photos),
+                               tuple(args.photo_size))
+    pages = [kind for case in manifest["cases"] for kind in case["layout"]]
+    print(f"{len(manifest['cases'])} cases, {len(pages)} pages "
+          f"({pages.count('text')} text, {pages.count('scanned')} scanned, {pages.count('photo')} photo)")
+    return manifest
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""
+Runs the benchmark suites, writes all results to one JSON file (with the git
+commit, Python and library versions and machine they came from) and checks
+them against the regression thresholds in benchmarks/thresholds.json.
+Exits with status 1 when any threshold is violated, so CI can gate on it.
+
+    python -m benchmarks.run_benchmarks
+    python -m benchmarks.run_benchmarks --quick --suites pipeline rule_engine
+    python -m benchmarks.run_benchmarks --output results.json --thresholds my_thresholds.json
+
+Thresholds are per suite: a row filter, a metric and a bound, e.g.
+    {"pipeline": [{"where": {"stage": "parse"}, "metric": "p95_ms", "max": 5}]}
+Thresholds whose rows a run didn't produce (e.g. sizes --quick skips) are
+reported as skipped, not failed.
+"""
+import argparse
+import importlib
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+THRESHOLDS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "thresholds.json")
+RESULTS_DIR = os.path.join("data", "benchmarks")
+
+# suite -> (module, run() keyword arguments, --quick overrides)
+SUITES = {
+    "report_parser": ("benchmarks.bench_report_parser",
+                      {"field_counts": (6, 25, 100, 200), "page_counts": (1, 20, 200), "repeat": 5},
+                      {"field_counts": (6, 100), "page_counts": (1, 20), "repeat": 3}),
+    "rule_engine": ("benchmarks.bench_rule_engine",
+                    {"case_counts": (1000, 10000, 100000)},
+                    {"case_counts": (1000, 10000)}),
+    "forest_scorer": ("benchmarks.bench_forest_scorer",
+                      {"case_counts": (1, 100, 1000, 100000), "repeat": 5},
+                      {"case_counts": (1, 100, 1000), "repeat": 3}),
+    "pipeline": ("benchmarks.bench_pipeline",
+                 {"cases": 20, "repeat": 2},
+                 {"cases": 6, "repeat": 1}),
+    "multi_image": ("benchmarks.bench_multi_image",
+                    {"photo_counts": (1, 4, 16, 64, 128), "repeat": 3},
+                    {"photo_counts": (1, 16, 128), "repeat": 1}),
+    "rescoring": ("benchmarks.bench_rescoring",
+                  {"case_counts": (1000, 10000, 100000)},
+                  {"case_counts": (1000, 10000)}),
+    "cold_start": ("benchmarks.bench_cold_start",
+                   {"workers": 2, "repeat": 3},
+                   {"workers": 2, "repeat": 1}),
+}
+
+def _version(module_name):
+    try:
+        return importlib.import_module(module_name).__version__
+    except Exception:
+        return None
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "git_commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "libraries": {name: _version(name) for name in ("numpy", "sklearn", "PIL", "cv2", "pdfplumber", "pyarrow")},
+    }
+
+def run_suites(names, quick=False, corpus_dir=None):
+    suites = {}
+    for name in names:
+        module_name, kwargs, quick_kwargs = SUITES[name]
+        kwargs = dict(kwargs, **(quick_kwargs if quick else {}))
+        if name == "pipeline" and corpus_dir:
+            kwargs["corpus_dir"] = corpus_dir
+        print(f"Running {name} ...", file=sys.stderr)
+        started = time.perf_counter()
+        results = importlib.import_module(module_name).run(**kwargs)
+        suites[name] = {"seconds": round(time.perf_counter() - started, 2), "params": kwargs, "results": results}
+    return suites
+
+def check_thresholds(suites, thresholds):
+    """Returns one entry per (threshold, matching row) with status passed/failed/skipped."""
+    checks = []
+    for suite, suite_thresholds in thresholds.items():
+        rows = suites.get(suite, {}).get("results")
+        for threshold in suite_thresholds:
+            where = threshold.get("where", {})
+            matches = [row for row in rows or [] if all(row.get(k) == v for k, v in where.items())]
+            base = {"suite": suite, "where": where, "metric": threshold["metric"],
+                    "min": threshold.get("min"), "max": threshold.get("max")}
+            if not matches:
+                checks.append(dict(base, value=None, status="skipped"))
+                continue
+            for row in matches:
+                value = row.get(threshold["metric"])
+                if value is None:
+                    status = "skipped"
+                elif ("min" in threshold and value < threshold["min"]) or ("max" in threshold and value > threshold["max"]):
+                    status = "failed"
+                else:
+                    status = "passed"
+                checks.append(dict(base, value=value, status=status))
+    return checks
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--suites", nargs="+", choices=list(SUITES), default=list(SUITES))
+    parser.add_argument("--quick", action="store_true", help="smaller sizes (e.g. for CI)")
+    parser.add_argument("--corpus", default=None, help="synthetic corpus directory for the pipeline suite")
+    parser.add_argument("--thresholds", default=THRESHOLDS_PATH)
+    parser.add_argument("--output", default=None, help=f"results file (default: {RESULTS_DIR}/<timestamp>.json)")
+    args = parser.parse_args(argv)
+
+    report = {"environment": environment(), "quick": args.quick}
+    report["suites"] = run_suites(args.suites, args.quick, args.corpus)
+
+    thresholds = {}
+    if args.thresholds and os.path.exists(args.thresholds):
+        with open(args.thresholds) as f:
+            thresholds = json.load(f)
+    report["checks"] = check_thresholds(report["suites"], thresholds)
+    failed = [c for c in report["checks"] if c["status"] == "failed"]
+    report["passed"] = not failed
+
+    output = args.output or os.path.join(RESULTS_DIR, report["environment"]["timestamp"].replace(":", "") + ".json")
+    if os.path.dirname(output):
+        os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2, default=str)
+
+    for check in report["checks"]:
+        bound = " ".join(f"{k} {check[k]}" for k in ("min", "max") if check[k] is not None)
+        print(f"{check['status']:>8}  {check['suite']:<14} {json.dumps(check['where']):<40} "
+              f"{check['metric']:<22} {check['value']!s:>12}  ({bound})")
+    counts = {status: sum(c["status"] == status for c in report["checks"]) for status in ("passed", "failed", "skipped")}
+    print(f"Results written to {output}: {counts['passed']} passed, {counts['failed']} failed, {counts['skipped']} skipped")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
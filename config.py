@@ -1,26 +1,104 @@
-import os
-
-class Config:
-    # Directories
-    RAW_DATA_DIR = os.path.join("data", "raw_appraisals")
-    PROCESSED_TEXT_DIR = os.path.join("data", "processed_text")
-    PROCESSED_IMAGES_DIR = os.path.join("data", "processed_images")
-    MODELS_DIR = "models"
-
-    # OCR Settings
-    TESSERACT_CMD = r'/usr/local/bin/tesseract' # Adjust path as needed for your OS
-
-    # Image Analysis Settings (Dummy values)
-    IMAGE_MODEL_PATH = os.path.join(MODELS_DIR, "defect_detector_model.pth")
-    DEFECT_THRESHOLD = 0.7
-
-    # Risk Assessment Settings
-    RISK_MODEL_PATH = os.path.join(MODELS_DIR, "risk_scorer_model.pkl")
-    # Example underwriting rules (can be more complex, e.g., in a JSON file)
-    UNDERWRITING_RULES = {
-        "roof_condition": {"poor": "HIGH_RISK", "fair": "MEDIUM_RISK", "good": "LOW_RISK"},
-        "foundation_cracks_detected": {"yes": "HIGH_RISK", "no": "LOW_RISK"},
-        "property_age": {"gt_50_years": "MEDIUM_RISK", "lt_10_years": "LOW_RISK"},
-        "flood_zone": {"high": "DECLINE", "medium": "ADDITIONAL_PREMIUM", "low": "STANDARD"},
-        # Add more rules as needed
+import os
+
+class Config:
+    # Directories
+    RAW_DATA_DIR = os.path.join("data", "raw_appraisals")
+    PROCESSED_TEXT_DIR = os.path.join("data", "processed_text")
+    PROCESSED_IMAGES_DIR = os.path.join("data", "processed_images")
+    MODELS_DIR = "models"
+
+    # OCR Settings
+    TESSERACT_CMD = r'/usr/local/bin/tesseract' # Adjust path as needed for your OS
+    OCR_FALLBACK_ENABLED = True # OCR pages that have no usable text layer (scanned pages)
+    OCR_MIN_TEXT_CHARS = 25 # Fewer non-whitespace chars than this = no usable text layer
+    OCR_RASTER_DPI = 300
+    OCR_LANG = "eng"
+    OCR_MAX_WORKERS = min(4, os.cpu_count() or 1) # Tesseract is CPU-bound; 1 = OCR inline
+    OCR_CACHE_DIR = os.path.join(PROCESSED_TEXT_DIR, "ocr_cache")
+
+    # Image Analysis Settings (Dummy values)
+    IMAGE_MODEL_PATH = os.path.join(MODELS_DIR, "defect_detector_model.pth")
+    DEFECT_THRESHOLD = 0.7
+    IMAGE_INPUT_SIZE = (224, 224) # (width, height) every photo is normalized to before analysis
+    IMAGE_DECODE_WORKERS = 4 # Threads decoding photos concurrently
+    DEFECT_BACKEND = "auto" # "onnx", "torchscript", "stub" or "auto" (by IMAGE_MODEL_PATH extension)
+    DEFECT_STUB_SEED = 0 # Seed for the deterministic stub detector used when no model is deployed
+    DEFECT_MICRO_BATCHING = False # Share one inference queue between concurrent cases (threads)
+    DEFECT_MAX_BATCH_SIZE = 16
+    DEFECT_MAX_WAIT_MS = 5
+    DEFECT_BATCH_TIMEOUT_S = 60 # Longest a case waits on a micro-batch (and close() on the batching thread)
+    # Multi-photo cases (ImageAnalyzer.analyze_property_images)
+    IMAGE_TRIAGE_ENABLED = True # Skip logos, banners, blank and scanned-document images before the detector
+    IMAGE_MIN_PHOTO_SIDE = 200 # px; smaller embedded images are logos, signatures, icons
+    IMAGE_MAX_ASPECT_RATIO = 3.0 # Wider/taller than this is a banner or letterhead strip
+    IMAGE_MIN_DETAIL = 6.0 # Gray-level standard deviation below this = blank
+    IMAGE_DEDUP_MAX_DISTANCE = 6 # Perceptual-hash bits (of 63) two photos may differ in and still be the same photo (None = off)
+    IMAGE_MAX_PHOTOS_PER_CASE = 32 # Detector budget per case: unique relevant photos analyzed at most
+
+    # Batch Processing Settings
+    BATCH_MAX_WORKERS = os.cpu_count() or 1
+    BATCH_QUEUE_FACTOR = 2 # Max in-flight cases per worker before we stop submitting
+    BATCH_RESULTS_PATH = os.path.join("data", "batch_results.jsonl")
+    WORKER_PRELOAD = True # Import libraries and load the risk model once in the parent, then fork workers (shared copy-on-write)
+    WORKER_RESTART_START_METHOD = "spawn" # Pools started after a worker died: the parent has threads by then, so never fork
+
+    # HTTP Service Settings (service.py)
+    SERVICE_SPOOL_DIR = os.path.join("data", "spool")
+    SERVICE_PROCESS_WORKERS = BATCH_MAX_WORKERS # Processes running OCR/CV/scoring for uploaded cases
+    SERVICE_MAX_PENDING = 64 # Admitted-but-unfinished cases before new uploads get 503
+    SERVICE_JOB_RETENTION = 10000 # Finished job statuses kept for GET /jobs/{id}
+    SERVICE_UPLOAD_CHUNK_BYTES = 1024 * 1024
+
+    # Feature Store Settings (feature_store.py; Parquet tables partitioned by date)
+    FEATURE_STORE_ENABLED = True
+    FEATURE_STORE_DIR = os.path.join("data", "feature_store") # features + decisions; parsed text / image results go under PROCESSED_*_DIR
+    FEATURE_STORE_ROW_GROUP_SIZE = 10000 # Rows buffered per table before a row group is written
+    FEATURE_STORE_FILE_ROW_GROUPS = 16 # Row groups per Parquet file before starting a new one
+    FEATURE_STORE_COMPRESSION = "snappy"
+    FEATURE_STORE_FLUSH_INTERVAL_SEC = 60 # Service only: also flush (and finish files) this often
+
+    # Training Pipeline Settings (train_pipeline.py)
+    TRAIN_ESTIMATOR = "hist" # "hist" (HistGradientBoosting), "forest" (RandomForest, n_jobs) or "sgd" (partial_fit, out-of-core)
+    TRAIN_BATCH_SIZE = 100000 # Feature store rows read per batch
+    TRAIN_N_JOBS = -1 # Parallel tree building for "forest" (-1 = all cores)
+    TRAIN_TEST_FRACTION = 0.1 # Holdout share, split by case id hash
+    TRAIN_LABEL_COLUMN = "label" # Outcome column of the labels file (case_id + label, e.g. claims history)
+    TRAIN_DECISIONS_LABEL_COLUMN = None # Opt-in: train on a decisions-table column instead (e.g. "overall_rule_based_risk": the model then learns to copy the rules)
+
+    # Re-scoring Settings (rescoring.py)
+    RESCORE_BATCH_SIZE = 100000 # Feature store rows re-scored per batch
+    RESCORE_RESULTS_PATH = os.path.join("data", "rescored_decisions.jsonl") # Cases whose decision changed; one file per run, stamped with its start time
+
+    # Instrumentation Settings (instrumentation.py)
+    METRICS_JSON_PATH = os.path.join("data", "metrics.jsonl") # Snapshots appended by the batch runner
+    PROFILE_SAMPLE_RATE = 0.0 # Fraction of cases to profile (0 = off)
+    PROFILE_MODE = "cprofile" # "cprofile" (CPU hot spots) or "tracemalloc" (allocation sites)
+    PROFILE_DIR = os.path.join("data", "profiles")
+
+    # Result Cache Settings (content-addressed, per pipeline stage)
+    CACHE_ENABLED = True
+    CACHE_DB_PATH = os.path.join("data", "cache", "stage_cache.sqlite3")
+    CACHE_MEMORY_MAX_BYTES = 256 * 1024 * 1024
+    CACHE_DISK_MAX_BYTES = 10 * 1024 * 1024 * 1024
+    CACHE_ACCESS_FLUSH_ENTRIES = 256 # Disk-cache hits whose access times are written back in one transaction
+    CACHE_ACCESS_FLUSH_INTERVAL_S = 60 # ...or at least this often
+
+    # Risk Assessment Settings
+    RISK_MODEL_PATH = os.path.join(MODELS_DIR, "risk_scorer_model.pkl")
+    RISK_MODEL_MMAP_MODE = "r" # Memory-map model arrays read-only on load (None = load into memory)
+    RISK_MODEL_COMPILED = True # Score forests with the flat-array evaluator in forest_compiler.py (same results as sklearn)
+    # Larger batches go through sklearn, whose compiled tree code (and threads) wins
+    # once per-call overhead stops mattering; see benchmarks/bench_forest_scorer.py
+    RISK_MODEL_COMPILED_MAX_BATCH = 1000
+    # Declarative rules file (JSON or YAML); see rule_engine.py for the format and
+    # underwriting_rules.example.json. When set, it replaces UNDERWRITING_RULES below
+    # (one source of truth: edit whichever is in use, not both).
+    UNDERWRITING_RULES_PATH = None
+    # Example underwriting rules (can be more complex, e.g., in a JSON file)
+    UNDERWRITING_RULES = {
+        "roof_condition": {"poor": "HIGH_RISK", "fair": "MEDIUM_RISK", "good": "LOW_RISK"},
+        "foundation_cracks_detected": {"yes": "HIGH_RISK", "no": "LOW_RISK"},
+        "property_age": {"gt_50_years": "MEDIUM_RISK", "lt_10_years": "LOW_RISK"},
+        "flood_zone": {"high": "DECLINE", "medium": "ADDITIONAL_PREMIUM", "low": "STANDARD"},
+        # Add more rules as needed
     }
\ No newline at end of file
@@ -1,48 +1,83 @@
-import pandas as pd
-
-class DataIntegrator:
-    def __init__(self):
-        pass
-
-    def integrate_data(self, text_data, image_data):
-        """
-        Combines extracted data from text and image analysis.
-        This is where you'd merge features, handle conflicts, and create
-        a unified feature set for risk assessment.
-        """
-        integrated_features = {}
-
-        # Merge text data
-        for k, v in text_data.items():
-            integrated_features[f"text_{k}"] = v
-
-        # Merge image data
-        for k, v in image_data.items():
-            integrated_features[f"image_{k}"] = v
-
-        # Example of multimodal conflict resolution or feature creation:
-        # If text says roof is "good" but image analysis says "poor",
-        # you might flag it for human review or use the more conservative estimate.
-        if (integrated_features.get("text_roof_condition_classified") == "good" and
-            integrated_features.get("image_overall_condition_ai") == "poor"):
-            integrated_features["multimodal_roof_conflict"] = True
-        else:
-            integrated_features["multimodal_roof_conflict"] = False
-
-        # Create a combined property condition score (simple example)
-        condition_score = 0
-        if integrated_features.get("text_roof_condition_classified") == "good": condition_score += 1
-        if integrated_features.get("image_overall_condition_ai") == "good": condition_score += 1
-        if integrated_features.get("text_foundation_cracks_detected") == "no": condition_score += 1
-        if integrated_features.get("image_num_defects", 0) < 2: condition_score += 1
-        
-        integrated_features["combined_property_condition_score"] = condition_score
-
-        # Convert to a format suitable for ML model if needed (e.g., one-hot encode categorical)
-        # For simplicity, returning as a dict for now.
-        return integrated_features
-
-# Example Usage:
-# integrator = DataIntegrator()
-# combined_data = integrator.integrate_data(parsed_info, analysis_results)
-# print("Combined Data:", combined_data)
\ No newline at end of file
+from feature_record import FeatureRecord, category_code, parse_number
+
+class DataIntegrator:
+    VERSION = "3" # Bump when the fusion logic below (or the feature schema's category codes) changes
+
+    def __init__(self):
+        pass
+
+    def integrate_data(self, text_data, image_data):
+        """
+        Combines extracted data from text and image analysis.
+        This is where you'd merge features, handle conflicts, and create
+        a unified feature set for risk assessment.
+        """
+        integrated_features = {}
+
+        # Merge text data
+        for k, v in text_data.items():
+            integrated_features[f"text_{k}"] = v
+
+        # Merge image data
+        for k, v in image_data.items():
+            integrated_features[f"image_{k}"] = v
+
+        # Example of multimodal conflict resolution or feature creation:
+        # If text says roof is "good" but image analysis says "poor",
+        # you might flag it for human review or use the more conservative estimate.
+        if (integrated_features.get("text_roof_condition_classified") == "good" and
+            integrated_features.get("image_overall_condition_ai") == "poor"):
+            integrated_features["multimodal_roof_conflict"] = True
+        else:
+            integrated_features["multimodal_roof_conflict"] = False
+
+        # Create a combined property condition score (simple example)
+        condition_score = 0
+        if integrated_features.get("text_roof_condition_classified") == "good": condition_score += 1
+        if integrated_features.get("image_overall_condition_ai") == "good": condition_score += 1
+        if integrated_features.get("text_foundation_cracks_detected") == "no": condition_score += 1
+        if integrated_features.get("image_num_defects", 0) < 2: condition_score += 1
+        
+        integrated_features["combined_property_condition_score"] = condition_score
+
+        # Convert to a format suitable for ML model if needed (e.g., one-hot encode categorical)
+        # For simplicity, returning as a dict for now.
+        return integrated_features
+
+    def integrate_record(self, text_data, image_data):
+        """
+        Same fusion as integrate_data, but fills a FeatureRecord (fixed schema,
+        typed values) instead of copying every key into a new dict. Strings
+        such as "1,850" are parsed here, once per case.
+        """
+        roof = text_data.get("roof_condition_classified")
+        image_condition = image_data.get("overall_condition_ai")
+        # Distinct defect types across the case's photos (see ImageAnalyzer.analyze_property_images)
+        num_defects = parse_number(image_data.get("num_defects", 0))
+        roof_conflict = roof == "good" and image_condition == "poor"
+
+        condition_score = 0
+        if roof == "good": condition_score += 1
+        if image_condition == "good": condition_score += 1
+        if text_data.get("foundation_cracks_detected") == "no": condition_score += 1
+        if num_defects < 2: condition_score += 1
+
+        return FeatureRecord(
+            square_footage=parse_number(text_data.get("square_footage")),
+            year_built=parse_number(text_data.get("year_built")),
+            image_num_defects=num_defects,
+            multimodal_roof_conflict=float(roof_conflict),
+            combined_property_condition_score=float(condition_score),
+            roof_condition=category_code("roof_condition", roof),
+            foundation_cracks=category_code("foundation_cracks", text_data.get("foundation_cracks_detected")),
+            flood_zone=category_code("flood_zone", text_data.get("flood_zone")),
+            image_condition=category_code("image_condition", image_condition),
+        )
+
+# Example Usage:
+# integrator = DataIntegrator()
+# combined_data = integrator.integrate_data(parsed_info, analysis_results)
+# print("Combined Data:", combined_data)
+#
+# record = integrator.integrate_record(parsed_info, analysis_results) # typed FeatureRecord
+# print("Features:", record.to_dict())
\ No newline at end of file
@@ -0,0 +1,334 @@
+import hashlib
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+import numpy as np
+from config import Config
+
+# Output columns of every defect backend, in order
+DEFECT_CLASSES = ["potential_exterior_crack", "potential_roof_stain"]
+
+class LatencyWindow:
+    """
+    Rolling window of per-batch inference timings: (batch_size, latency_ms, wait_ms).
+    wait_ms is how long the oldest request in the batch queued before inference.
+    """
+    def __init__(self, size=1000):
+        self._batches = deque(maxlen=size)
+        self._lock = threading.Lock()
+        self.total_batches = 0
+        self.total_images = 0
+
+    def record(self, batch_size, latency_ms, wait_ms=0.0):
+        with self._lock:
+            self._batches.append((batch_size, latency_ms, wait_ms))
+            self.total_batches += 1
+            self.total_images += batch_size
+
+    def summary(self):
+        with self._lock:
+            batches = list(self._batches)
+            summary = {"batches": self.total_batches, "images": self.total_images}
+        if batches:
+            sizes, latencies, waits = (np.array(column, dtype=np.float64) for column in zip(*batches))
+            summary.update({
+                "mean_batch_size": round(float(sizes.mean()), 2),
+                "latency_ms_p50": round(float(np.percentile(latencies, 50)), 3),
+                "latency_ms_p99": round(float(np.percentile(latencies, 99)), 3),
+                "latency_ms_per_image": round(float(latencies.sum() / sizes.sum()), 3),
+                "wait_ms_p50": round(float(np.percentile(waits, 50)), 3),
+                "wait_ms_p99": round(float(np.percentile(waits, 99)), 3),
+            })
+        return summary
+
+class DefectDetectorBackend:
+    """
+    CPU defect detector. predict() takes a normalized (N, height, width, 3) uint8
+    RGB batch and returns (N, len(DEFECT_CLASSES)) scores in [0, 1].
+    """
+    name = "base"
+
+    def __init__(self, model_path=None, input_size=Config.IMAGE_INPUT_SIZE):
+        self.model_path = model_path
+        self.input_size = tuple(input_size)
+        self.version = self.name
+
+    def load(self):
+        pass
+
+    def preload(self):
+        # Imports whatever load() needs without creating sessions or threads, so
+        # it's safe to run in a parent process before forking workers
+        pass
+
+    def predict(self, batch):
+        raise NotImplementedError
+
+    def warmup(self, batch_sizes=(1, Config.DEFECT_MAX_BATCH_SIZE)):
+        # First calls pay for lazy allocation / graph optimization; do it before real traffic
+        width, height = self.input_size
+        for batch_size in batch_sizes:
+            self.predict(np.zeros((batch_size, height, width, 3), dtype=np.uint8))
+
+    def _file_version(self):
+        digest = hashlib.sha256()
+        with open(self.model_path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+        return f"{self.name}:{digest.hexdigest()[:12]}"
+
+    @staticmethod
+    def _to_nchw_float(batch):
+        return np.ascontiguousarray(batch.transpose(0, 3, 1, 2), dtype=np.float32) / 255.0
+
+class StubDefectBackend(DefectDetectorBackend):
+    """
+    Stand-in until a trained detector is deployed. Scores are pseudo-random but
+    derived from the image pixels and a seed, so the same photo always gets the
+    same result, in any batch and in any process.
+    """
+    name = "stub"
+
+    def __init__(self, model_path=None, input_size=Config.IMAGE_INPUT_SIZE, seed=Config.DEFECT_STUB_SEED):
+        super().__init__(model_path, input_size)
+        self.seed = seed
+        self.version = f"stub:{seed}"
+
+    def predict(self, batch):
+        scores = np.empty((len(batch), len(DEFECT_CLASSES)))
+        for i, image in enumerate(batch):
+            digest = hashlib.blake2b(np.ascontiguousarray(image).data, digest_size=8).digest()
+            rng = np.random.default_rng([self.seed, int.from_bytes(digest, "little")])
+            scores[i] = rng.random(len(DEFECT_CLASSES))
+        return scores
+
+class OnnxDefectBackend(DefectDetectorBackend):
+    """
+    ONNX Runtime model taking float32 NCHW input in [0, 1] and returning
+    per-class probabilities (apply_sigmoid=True if it returns logits).
+    """
+    name = "onnx"
+
+    def __init__(self, model_path, input_size=Config.IMAGE_INPUT_SIZE, apply_sigmoid=False, intra_op_threads=None):
+        super().__init__(model_path, input_size)
+        self.apply_sigmoid = apply_sigmoid
+        self.intra_op_threads = intra_op_threads
+        self.session = None
+
+    def preload(self):
+        import onnxruntime # sessions own thread pools, so load() still runs per process
+
+    def load(self):
+        import onnxruntime as ort # Optional dependency, only needed for .onnx models
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if self.intra_op_threads:
+            options.intra_op_num_threads = self.intra_op_threads
+        self.session = ort.InferenceSession(self.model_path, options, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+        self.version = self._file_version()
+
+    def predict(self, batch):
+        scores = self.session.run(None, {self.input_name: self._to_nchw_float(batch)})[0]
+        return 1.0 / (1.0 + np.exp(-scores)) if self.apply_sigmoid else scores
+
+class TorchScriptDefectBackend(DefectDetectorBackend):
+    """
+    TorchScript model (torch.jit.save) with the same input/output contract as
+    OnnxDefectBackend.
+    """
+    name = "torchscript"
+
+    def __init__(self, model_path, input_size=Config.IMAGE_INPUT_SIZE, apply_sigmoid=False, num_threads=None):
+        super().__init__(model_path, input_size)
+        self.apply_sigmoid = apply_sigmoid
+        self.num_threads = num_threads
+        self.model = None
+
+    def preload(self):
+        import torch # the model itself is still loaded per process by load()
+
+    def load(self):
+        import torch # Optional dependency, only needed for TorchScript models
+        self._torch = torch
+        if self.num_threads:
+            torch.set_num_threads(self.num_threads)
+        self.model = torch.jit.load(self.model_path, map_location="cpu").eval()
+        self.version = self._file_version()
+
+    def predict(self, batch):
+        torch = self._torch
+        with torch.inference_mode():
+            scores = self.model(torch.from_numpy(self._to_nchw_float(batch)))
+            if self.apply_sigmoid:
+                scores = torch.sigmoid(scores)
+        return scores.numpy()
+
+def create_backend(model_path=Config.IMAGE_MODEL_PATH, backend=Config.DEFECT_BACKEND, input_size=Config.IMAGE_INPUT_SIZE):
+    """
+    backend: "onnx", "torchscript", "stub" or "auto" (pick by file extension,
+    falling back to the stub when no model file is deployed).
+    """
+    if backend == "auto":
+        if not model_path or not os.path.exists(model_path):
+            print(f"No defect model found at {model_path}; using the deterministic stub detector.")
+            backend = "stub"
+        elif model_path.endswith(".onnx"):
+            backend = "onnx"
+        else:
+            backend = "torchscript"
+    if backend == "onnx":
+        return OnnxDefectBackend(model_path, input_size)
+    if backend == "torchscript":
+        return TorchScriptDefectBackend(model_path, input_size)
+    if backend == "stub":
+        return StubDefectBackend(model_path, input_size)
+    raise ValueError(f"Unknown defect detector backend '{backend}'")
+
+class _Request:
+    __slots__ = ("images", "future", "enqueued")
+
+    def __init__(self, images):
+        self.images = images
+        self.future = Future()
+        self.enqueued = time.perf_counter()
+
+class MicroBatcher:
+    """
+    Collects image batches submitted by concurrent cases (threads) into larger
+    inference batches. A batch is sent to the backend once it holds
+    max_batch_size images or the oldest request has waited max_wait_ms,
+    whichever comes first. A single request larger than max_batch_size runs
+    on its own.
+
+    close() runs whatever is still queued (including a partial batch) right
+    away; submitting after close() raises RuntimeError. predict() and close()
+    give up after timeout seconds.
+    """
+    def __init__(self, backend, max_batch_size=Config.DEFECT_MAX_BATCH_SIZE, max_wait_ms=Config.DEFECT_MAX_WAIT_MS,
+                 timeout=Config.DEFECT_BATCH_TIMEOUT_S):
+        self.backend = backend
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.timeout = timeout
+        self.metrics = LatencyWindow()
+        self._queue = queue.Queue()
+        self._carry = None
+        self._lock = threading.Lock()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="defect-micro-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, images):
+        request = _Request(images)
+        with self._lock: # nothing gets queued behind close()'s sentinel
+            if self._closed:
+                raise RuntimeError("MicroBatcher is closed")
+            self._queue.put(request)
+        return request.future
+
+    def predict(self, images):
+        return self.submit(images).result(timeout=self.timeout)
+
+    def close(self):
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(None)
+        self._thread.join(self.timeout)
+        if self._thread.is_alive():
+            # The backend is stuck: fail whatever it hasn't picked up instead of hanging the caller
+            error = TimeoutError(f"micro-batcher still busy after {self.timeout}s")
+            for request in self._drain():
+                request.future.set_exception(error)
+            self._queue.put(None) # _drain took the sentinel; the thread still stops once the backend returns
+
+    def _drain(self):
+        # Everything not yet batched, oldest first (the sentinel excluded)
+        requests = []
+        if self._carry is not None:
+            requests.append(self._carry)
+            self._carry = None
+        while True:
+            try:
+                request = self._queue.get_nowait()
+            except queue.Empty:
+                return requests
+            if request is not None:
+                requests.append(request)
+
+    def _next_request(self, timeout=None):
+        if self._carry is not None:
+            request, self._carry = self._carry, None
+            return request
+        return self._queue.get(timeout=timeout) if timeout is not None else self._queue.get()
+
+    def _run(self):
+        while True:
+            first = self._next_request()
+            if first is None:
+                return self._flush()
+            requests = [first]
+            count = len(first.images)
+            deadline = first.enqueued + self.max_wait
+            stopping = False
+            while count < self.max_batch_size:
+                timeout = deadline - time.perf_counter()
+                if timeout <= 0:
+                    break
+                try:
+                    request = self._next_request(timeout)
+                except queue.Empty:
+                    break
+                if request is None:
+                    stopping = True
+                    break
+                if count + len(request.images) > self.max_batch_size:
+                    self._carry = request # starts the next batch
+                    break
+                requests.append(request)
+                count += len(request.images)
+
+            self._run_batch(requests, count)
+            if stopping:
+                return self._flush()
+
+    def _flush(self):
+        # Closing: run what's left now, in batches of up to max_batch_size, without waiting out max_wait
+        requests, count = [], 0
+        for request in self._drain():
+            if requests and count + len(request.images) > self.max_batch_size:
+                self._run_batch(requests, count)
+                requests, count = [], 0
+            requests.append(request)
+            count += len(request.images)
+        if requests:
+            self._run_batch(requests, count)
+
+    def _run_batch(self, requests, count):
+        started = time.perf_counter()
+        try:
+            batch = requests[0].images if len(requests) == 1 else np.concatenate([r.images for r in requests])
+            scores = self.backend.predict(batch)
+        except Exception as e:
+            for request in requests:
+                request.future.set_exception(e)
+            return
+        finished = time.perf_counter()
+        self.metrics.record(count, (finished - started) * 1000, (started - requests[0].enqueued) * 1000)
+        offset = 0
+        for request in requests:
+            request.future.set_result(scores[offset:offset + len(request.images)])
+            offset += len(request.images)
+
+# Example Usage:
+# backend = create_backend("models/defect_detector_model.onnx")
+# backend.load()
+# backend.warmup()
+# batcher = MicroBatcher(backend, max_batch_size=16, max_wait_ms=5)
+# scores = batcher.predict(normalized_batch) # (N, len(DEFECT_CLASSES))
+# print("Batch latency:", batcher.metrics.summary())
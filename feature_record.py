@@ -0,0 +1,230 @@
+from operator import attrgetter
+import numpy as np
+
+# The fixed feature schema: (field, combined-feature key, categories).
+# Numeric fields have categories=None and are stored as floats (missing = 0,
+# which is also what the risk model was trained with). Categorical fields are
+# stored as an index into their categories; index 0 is the "missing" value.
+# The combined-feature keys are the names DataIntegrator.integrate_data used,
+# so rule files and trained models keep working unchanged.
+FEATURE_SCHEMA = [
+    ("square_footage", "text_square_footage", None),
+    ("year_built", "text_year_built", None),
+    ("image_num_defects", "image_num_defects", None),
+    ("multimodal_roof_conflict", "multimodal_roof_conflict", None), # 0 or 1
+    ("combined_property_condition_score", "combined_property_condition_score", None),
+    ("roof_condition", "text_roof_condition_classified", ("unknown", "good", "fair", "poor")),
+    ("foundation_cracks", "text_foundation_cracks_detected", ("unknown", "no", "yes")),
+    ("flood_zone", "text_flood_zone", ("unknown", "low", "medium", "high")),
+    ("image_condition", "image_overall_condition_ai", ("unknown", "good", "fair", "poor")),
+]
+
+FIELDS = [field for field, _, _ in FEATURE_SCHEMA]
+FIELD_INDEX = {field: i for i, field in enumerate(FIELDS)}
+FEATURE_KEYS = {key: field for field, key, _ in FEATURE_SCHEMA}
+CATEGORIES = {field: categories for field, _, categories in FEATURE_SCHEMA if categories}
+CATEGORY_CODES = {field: {value: code for code, value in enumerate(categories)} for field, categories in CATEGORIES.items()}
+
+# Risk model input columns: numeric fields under their combined-feature key,
+# categorical fields one-hot encoded as <key>_<category>. This is the one place
+# the encoding is defined; training (FeatureBatch.to_ml_frame) and scoring
+# (to_ml_row / to_ml_matrix) both go through it. A model may use any subset
+# (e.g. with one category per field dropped), in any order.
+ML_FEATURE_COLUMNS = []
+_ML_ENCODING = {} # column -> (field index, category code or None for numeric)
+for _field, _key, _categories in FEATURE_SCHEMA:
+    if _categories is None:
+        ML_FEATURE_COLUMNS.append(_key)
+        _ML_ENCODING[_key] = (FIELD_INDEX[_field], None)
+    else:
+        for _code, _category in enumerate(_categories):
+            ML_FEATURE_COLUMNS.append(f"{_key}_{_category}")
+            _ML_ENCODING[f"{_key}_{_category}"] = (FIELD_INDEX[_field], _code)
+
+def parse_number(value):
+    """Float from a parsed report value ("1,850", "1985", 3, True, None); 0.0 when missing or unparseable."""
+    if value is None:
+        return 0.0
+    if isinstance(value, (bool, np.bool_)): # multimodal_roof_conflict, as integrate_record stores it
+        return float(value)
+    if isinstance(value, (int, float)):
+        return 0.0 if value != value else float(value) # NaN counts as missing
+    try:
+        return float(str(value).replace(",", "").strip())
+    except ValueError:
+        return 0.0
+
+def category_code(field, value):
+    return CATEGORY_CODES[field].get(value, 0)
+
+_encodings = {} # tuple(columns) -> [(field index, category code or None), ...]
+
+def _encoding(columns):
+    key = tuple(columns)
+    encoding = _encodings.get(key)
+    if encoding is None:
+        missing = [column for column in columns if column not in _ML_ENCODING]
+        if missing:
+            raise KeyError(f"Model columns not in the feature schema: {missing}")
+        encoding = _encodings[key] = [_ML_ENCODING[column] for column in columns]
+    return encoding
+
+_field_values = attrgetter(*FIELDS)
+
+class FeatureRecord:
+    """
+    One case's features in the fixed schema, filled once with typed values
+    (floats, and category codes for categorical fields).
+
+    get() answers combined-feature keys ("text_roof_condition_classified", ...)
+    with the same values the old feature dicts held, so RuleEngine.apply_rules
+    takes a record directly.
+    """
+    __slots__ = FIELDS
+
+    def __init__(self, square_footage=0.0, year_built=0.0, image_num_defects=0.0, multimodal_roof_conflict=0.0,
+                 combined_property_condition_score=0.0, roof_condition=0, foundation_cracks=0, flood_zone=0,
+                 image_condition=0):
+        self.square_footage = square_footage
+        self.year_built = year_built
+        self.image_num_defects = image_num_defects
+        self.multimodal_roof_conflict = multimodal_roof_conflict
+        self.combined_property_condition_score = combined_property_condition_score
+        self.roof_condition = roof_condition
+        self.foundation_cracks = foundation_cracks
+        self.flood_zone = flood_zone
+        self.image_condition = image_condition
+
+    # FeatureRecord(*record.as_tuple()) == record; keep __init__'s parameters in FIELDS order
+    def __getstate__(self):
+        return self.as_tuple()
+
+    def __setstate__(self, state):
+        for field, value in zip(FIELDS, state):
+            setattr(self, field, value)
+
+    def __eq__(self, other):
+        return isinstance(other, FeatureRecord) and self.as_tuple() == other.as_tuple()
+
+    def __repr__(self):
+        return f"FeatureRecord({self.to_dict()})"
+
+    def as_tuple(self):
+        """Field values in FIELDS order (category codes for categorical fields)."""
+        return _field_values(self)
+
+    def category(self, field):
+        return CATEGORIES[field][getattr(self, field)]
+
+    def get(self, key, default=None):
+        field = FEATURE_KEYS.get(key)
+        if field is None:
+            return default
+        if field in CATEGORIES:
+            return self.category(field)
+        if field == "multimodal_roof_conflict":
+            return bool(self.multimodal_roof_conflict)
+        return getattr(self, field)
+
+    def __getitem__(self, key):
+        if key not in FEATURE_KEYS:
+            raise KeyError(key)
+        return self.get(key)
+
+    def to_dict(self):
+        """Combined-feature dict (for JSON output and display)."""
+        return {key: self.get(key) for _, key, _ in FEATURE_SCHEMA}
+
+    def to_ml_row(self, columns=ML_FEATURE_COLUMNS, out=None):
+        """Risk model input row for columns, written into out (float64) when given."""
+        values = self.as_tuple()
+        row = [values[index] if code is None else float(values[index] == code) for index, code in _encoding(columns)]
+        if out is None:
+            return np.array(row, dtype=np.float64)
+        out[:] = row
+        return out
+
+class FeatureBatch:
+    """
+    Many cases in the fixed schema as one (n_cases, len(FIELDS)) float64 array;
+    column(field) is a view into it. to_ml_matrix encodes straight from that
+    array into the model's input matrix, in one pass and one allocation.
+    """
+    def __init__(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        if values.ndim != 2 or values.shape[1] != len(FIELDS):
+            raise ValueError(f"Expected an (n, {len(FIELDS)}) array, got shape {values.shape}")
+        self.values = values
+
+    def __len__(self):
+        return len(self.values)
+
+    @classmethod
+    def from_records(cls, records):
+        if not records:
+            return cls(np.empty((0, len(FIELDS)), dtype=np.float64))
+        return cls(np.array([_field_values(record) for record in records], dtype=np.float64))
+
+    @classmethod
+    def from_columns(cls, columns):
+        """
+        From combined-feature columns, e.g. a training DataFrame or a dict of
+        lists keyed "text_square_footage", "text_roof_condition_classified", ...
+        Numbers are parsed and categories encoded exactly as DataIntegrator does.
+        """
+        if hasattr(columns, "columns"): # DataFrame
+            n, keys = len(columns), set(columns.columns)
+        else:
+            n, keys = (len(next(iter(columns.values()))) if columns else 0), columns
+        values = np.zeros((n, len(FIELDS)), dtype=np.float64)
+        for field, key, categories in FEATURE_SCHEMA:
+            if key not in keys:
+                continue
+            column = columns[key]
+            if categories is None:
+                values[:, FIELD_INDEX[field]] = [parse_number(v) for v in column]
+            else:
+                codes = CATEGORY_CODES[field]
+                values[:, FIELD_INDEX[field]] = [codes.get(v, 0) for v in column]
+        return cls(values)
+
+    def column(self, field):
+        return self.values[:, FIELD_INDEX[field]]
+
+    def record(self, i):
+        return FeatureRecord(*(int(v) if field in CATEGORIES else float(v) for field, v in zip(FIELDS, self.values[i])))
+
+    def to_ml_matrix(self, columns=ML_FEATURE_COLUMNS):
+        matrix = np.empty((len(self.values), len(columns)), dtype=np.float64)
+        for j, (index, code) in enumerate(_encoding(columns)):
+            if code is None:
+                matrix[:, j] = self.values[:, index]
+            else:
+                np.equal(self.values[:, index], code, out=matrix[:, j], casting="unsafe")
+        return matrix
+
+    def to_ml_frame(self, columns=ML_FEATURE_COLUMNS):
+        """Training-time DataFrame with the model's column names."""
+        import pandas as pd # only needed for training
+        return pd.DataFrame(self.to_ml_matrix(columns), columns=list(columns))
+
+    def rule_columns(self):
+        """Combined-feature columns for RuleEngine.apply_rules_batch."""
+        columns = {}
+        for field, key, categories in FEATURE_SCHEMA:
+            column = self.column(field)
+            if categories is not None:
+                columns[key] = np.array(categories, dtype=object)[column.astype(np.int64)]
+            elif field == "multimodal_roof_conflict":
+                columns[key] = column != 0
+            else:
+                columns[key] = column
+        return columns
+
+# Example Usage:
+# record = DataIntegrator().integrate_record(parsed_info, analysis_results)
+# rule_results = RuleEngine().apply_rules(record) # record.get() speaks the combined-feature keys
+# row = record.to_ml_row(ml_model.feature_columns)
+#
+# batch = FeatureBatch.from_records(records)
+# labels, probabilities = ml_model.predict_batch(batch.to_ml_matrix(ml_model.feature_columns))
@@ -0,0 +1,303 @@
+import json
+import os
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.fs as pafs
+import pyarrow.parquet as pq
+from config import Config
+from feature_record import CATEGORIES, FEATURE_SCHEMA, FIELDS, FeatureBatch
+
+# Parsed report fields stored as their own columns; anything else a custom
+# field registry extracts goes into extra_fields as a JSON object
+PARSED_TEXT_FIELDS = [
+    "property_address", "property_type", "square_footage", "year_built", "roof_condition_text",
+    "foundation_condition_text", "flood_zone_text", "roof_condition_classified", "foundation_cracks_detected",
+    "flood_zone",
+]
+
+_CASE_COLUMNS = [("case_id", pa.string()), ("processed_at", pa.timestamp("ms", tz="UTC"))]
+
+TABLE_SCHEMAS = {
+    "parsed_text": pa.schema(
+        _CASE_COLUMNS + [("report_hash", pa.string()), ("parser_version", pa.string())]
+        + [(field, pa.string()) for field in PARSED_TEXT_FIELDS] + [("extra_fields", pa.string())]
+    ),
+    "image_results": pa.schema(_CASE_COLUMNS + [
+        ("image_hash", pa.string()), ("image_version", pa.string()), ("overall_condition_ai", pa.string()),
+        ("num_defects", pa.int32()), ("defects_found", pa.list_(pa.string())),
+        # Multi-photo cases: photos seen, photos the detector ran on, and the rest
+        # of ImageAnalyzer.analyze_property_images' photo_stats as JSON
+        ("photos", pa.int32()), ("photos_analyzed", pa.int32()), ("photo_stats", pa.string()),
+    ]),
+    # FeatureRecord fields: numeric as float64, categorical as int8 codes into
+    # the categories listed in the schema metadata (see feature_record.py)
+    "features": pa.schema(
+        _CASE_COLUMNS + [("report_hash", pa.string()), ("feature_version", pa.string())]
+        + [(field, pa.float64() if categories is None else pa.int8()) for field, _, categories in FEATURE_SCHEMA],
+        metadata={"categories": json.dumps(CATEGORIES)},
+    ),
+    "decisions": pa.schema(_CASE_COLUMNS + [
+        ("decision", pa.string()), ("rule_decision", pa.string()), ("overall_rule_based_risk", pa.string()),
+        ("risk_flags", pa.map_(pa.string(), pa.string())), ("rule_version", pa.string()),
+        ("ml_label", pa.string()), ("ml_probabilities", pa.map_(pa.string(), pa.float64())),
+        ("model_version", pa.string()), ("model_hash", pa.string()),
+    ]),
+}
+
+DATE_PARTITIONING = ds.partitioning(pa.schema([("date", pa.string())]), flavor="hive")
+
+def latest_per_case(table):
+    """The most recent row (by processed_at) of each case_id in an Arrow table."""
+    if table.num_rows == 0:
+        return table
+    table = table.sort_by([("case_id", "ascending"), ("processed_at", "ascending")])
+    case_ids = table.column("case_id").combine_chunks()
+    last = np.ones(table.num_rows, dtype=bool)
+    last[:-1] = pc.not_equal(case_ids[:-1], case_ids[1:]).fill_null(True).to_numpy(zero_copy_only=False)
+    return table.filter(pa.array(last))
+
+def default_table_dirs():
+    return {
+        "parsed_text": os.path.join(Config.PROCESSED_TEXT_DIR, "parsed_text"),
+        "image_results": os.path.join(Config.PROCESSED_IMAGES_DIR, "image_results"),
+        "features": os.path.join(Config.FEATURE_STORE_DIR, "features"),
+        "decisions": os.path.join(Config.FEATURE_STORE_DIR, "decisions"),
+    }
+
+def _text(value):
+    return None if value is None else str(value)
+
+class FeatureStore:
+    """
+    Append-only columnar store for processed cases: parsed report fields, image
+    analysis results, fused features and decisions (with the rule and model
+    versions that made them).
+
+    Rows are buffered and written as one Parquet row group per
+    row_group_size rows, into hive-style date partitions
+    (<table>/date=YYYY-MM-DD/part-*.parquet). A file is finished (renamed from
+    its hidden temporary name, so readers never see a half-written file)
+    after file_row_groups row groups and on flush(final=True)/close(). Files
+    are never modified afterwards.
+
+    Reads go through pyarrow.dataset with memory-mapped files, so scanning a
+    few columns of millions of cases only touches those columns' pages.
+    One process should own the writer (e.g. the batch runner's parent).
+    """
+    def __init__(self, root=None, row_group_size=Config.FEATURE_STORE_ROW_GROUP_SIZE,
+                 file_row_groups=Config.FEATURE_STORE_FILE_ROW_GROUPS, flush_interval_sec=None,
+                 compression=Config.FEATURE_STORE_COMPRESSION):
+        if root is None:
+            self.table_dirs = default_table_dirs()
+        else:
+            self.table_dirs = {table: os.path.join(root, table) for table in TABLE_SCHEMAS}
+        self.row_group_size = row_group_size
+        self.file_row_groups = file_row_groups
+        self.flush_interval_sec = flush_interval_sec
+        self.compression = compression
+        self._buffers = {table: [] for table in TABLE_SCHEMAS}
+        self._writers = {} # (table, date) -> [ParquetWriter, temp path, final path, row groups written]
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+        self._filesystem = pafs.LocalFileSystem(use_mmap=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # --- writing ---
+
+    def append_case(self, outputs, processed_at=None):
+        """
+        Buffers one processed case: the dict returned by
+        main.run_underwriting_case, or a batch_runner.run_case result.
+        """
+        processed_at = processed_at or datetime.now(timezone.utc)
+        case = {"case_id": _text(outputs["case_id"]), "processed_at": processed_at}
+        versions = outputs.get("versions", {})
+
+        parsed = outputs.get("parsed_text") or {}
+        extra = {k: v for k, v in parsed.items() if k not in PARSED_TEXT_FIELDS}
+        parsed_row = dict(case, report_hash=outputs.get("report_hash"), parser_version=versions.get("parser"),
+                          extra_fields=json.dumps(extra, default=str) if extra else None)
+        for field in PARSED_TEXT_FIELDS:
+            parsed_row[field] = _text(parsed.get(field))
+
+        rows = {"parsed_text": parsed_row}
+        image = outputs.get("image_analysis") or {}
+        if image:
+            photo_stats = image.get("photo_stats") or {}
+            rows["image_results"] = dict(
+                case, image_hash=outputs.get("image_hash"), image_version=versions.get("image"),
+                overall_condition_ai=image.get("overall_condition_ai", image.get("overall_condition")),
+                num_defects=image.get("num_defects"), defects_found=[str(d) for d in image.get("defects_found", [])],
+                photos=photo_stats.get("photos"), photos_analyzed=photo_stats.get("analyzed"),
+                photo_stats=json.dumps(photo_stats) if photo_stats else None,
+            )
+
+        features = outputs.get("features")
+        if features is not None:
+            values = features.as_tuple() if hasattr(features, "as_tuple") else features
+            features_row = dict(case, report_hash=outputs.get("report_hash"), feature_version=versions.get("fuse"))
+            features_row.update(zip(FIELDS, values))
+            rows["features"] = features_row
+
+        rules = outputs.get("rule_based_assessment") or {}
+        ml = outputs.get("ml_prediction") or {}
+        rows["decisions"] = dict(
+            case, decision=outputs.get("decision"), rule_decision=rules.get("decision"),
+            overall_rule_based_risk=rules.get("overall_rule_based_risk"),
+            risk_flags=[(str(k), _text(v)) for k, v in rules.get("risk_flags", {}).items()],
+            rule_version=rules.get("rule_version", versions.get("rules")),
+            ml_label=_text(ml.get("predicted_label")),
+            ml_probabilities=[(str(k), float(v)) for k, v in (ml.get("probabilities") or {}).items()],
+            model_version=_text(versions.get("model")), model_hash=_text(versions.get("model_hash")),
+        )
+
+        with self._lock:
+            full = False
+            for table, row in rows.items():
+                self._buffers[table].append(row)
+                full = full or len(self._buffers[table]) >= self.row_group_size
+            due = self.flush_interval_sec is not None and time.monotonic() - self._last_flush >= self.flush_interval_sec
+            if full or due:
+                self._flush_locked(final=due)
+
+    def append_rows(self, table, columns, processed_at=None):
+        """
+        Appends many rows to one table at once, given as columns ({name: array
+        or list}; columns of the table left out are null), all stamped
+        processed_at, e.g. a batch of re-scored decisions. Rows go straight out
+        as row groups rather than through the per-case buffers.
+        """
+        processed_at = processed_at or datetime.now(timezone.utc)
+        n = len(columns["case_id"])
+        schema = TABLE_SCHEMAS[table]
+        arrays = []
+        for field in schema:
+            if field.name == "processed_at":
+                arrays.append(pa.array([processed_at] * n, type=field.type))
+            elif field.name in columns:
+                arrays.append(pa.array(columns[field.name], type=field.type))
+            else:
+                arrays.append(pa.nulls(n, field.type))
+        arrow_table = pa.Table.from_arrays(arrays, schema=schema)
+        with self._lock:
+            for start in range(0, n, self.row_group_size):
+                self._write_row_group(table, processed_at.strftime("%Y-%m-%d"), arrow_table.slice(start, self.row_group_size))
+
+    def flush(self, final=False):
+        """Writes buffered rows as row groups; final=True also finishes the open files."""
+        with self._lock:
+            self._flush_locked(final)
+
+    def close(self):
+        self.flush(final=True)
+
+    def _flush_locked(self, final):
+        for table, rows in self._buffers.items():
+            if not rows:
+                continue
+            by_date = {}
+            for row in rows:
+                by_date.setdefault(row["processed_at"].strftime("%Y-%m-%d"), []).append(row)
+            for date, date_rows in by_date.items():
+                self._write_row_group(table, date, pa.Table.from_pylist(date_rows, schema=TABLE_SCHEMAS[table]))
+            rows.clear()
+        if final:
+            for key in list(self._writers):
+                self._finish_file(key)
+        self._last_flush = time.monotonic()
+
+    def _write_row_group(self, table, date, arrow_table):
+        key = (table, date)
+        entry = self._writers.get(key)
+        if entry is None:
+            directory = os.path.join(self.table_dirs[table], f"date={date}")
+            os.makedirs(directory, exist_ok=True)
+            name = f"part-{int(time.time() * 1000)}-{os.getpid()}-{uuid.uuid4().hex[:8]}.parquet"
+            temp_path = os.path.join(directory, "." + name + ".tmp") # hidden from dataset readers
+            writer = pq.ParquetWriter(temp_path, TABLE_SCHEMAS[table], compression=self.compression)
+            entry = self._writers[key] = [writer, temp_path, os.path.join(directory, name), 0]
+        entry[0].write_table(arrow_table, row_group_size=len(arrow_table))
+        entry[3] += 1
+        if entry[3] >= self.file_row_groups:
+            self._finish_file(key)
+
+    def _finish_file(self, key):
+        writer, temp_path, final_path, _ = self._writers.pop(key)
+        writer.close()
+        os.replace(temp_path, final_path)
+
+    # --- reading ---
+
+    def dataset(self, table):
+        directory = self.table_dirs[table]
+        if not os.path.isdir(directory):
+            return None
+        return ds.dataset(directory, schema=TABLE_SCHEMAS[table].append(pa.field("date", pa.string())),
+                          format="parquet", partitioning=DATE_PARTITIONING, filesystem=self._filesystem)
+
+    @staticmethod
+    def _filter(start_date, end_date, filter):
+        expression = filter
+        if start_date is not None:
+            condition = ds.field("date") >= str(start_date)
+            expression = condition if expression is None else expression & condition
+        if end_date is not None:
+            condition = ds.field("date") <= str(end_date)
+            expression = condition if expression is None else expression & condition
+        return expression
+
+    def scan(self, table, columns=None, start_date=None, end_date=None, filter=None):
+        """
+        Reads a table (optionally only some columns / a date range / rows matching
+        a pyarrow.dataset expression) into one Arrow table. Dates are inclusive.
+        """
+        dataset = self.dataset(table)
+        schema = TABLE_SCHEMAS[table]
+        if dataset is None:
+            return (schema if columns is None else pa.schema([schema.field(c) for c in columns])).empty_table()
+        return dataset.to_table(columns=columns, filter=self._filter(start_date, end_date, filter))
+
+    def iter_batches(self, table, columns=None, batch_size=65536, start_date=None, end_date=None, filter=None):
+        """Streams a table as Arrow record batches, so it never has to fit in memory."""
+        dataset = self.dataset(table)
+        if dataset is None:
+            return
+        yield from dataset.to_batches(columns=columns, filter=self._filter(start_date, end_date, filter),
+                                      batch_size=batch_size)
+
+    @staticmethod
+    def feature_batch(record_batch):
+        """FeatureBatch from a features table/record batch (one copy: columns -> matrix)."""
+        if record_batch.num_rows == 0:
+            return FeatureBatch(np.empty((0, len(FIELDS)), dtype=np.float64))
+        return FeatureBatch(np.column_stack([np.asarray(record_batch.column(field), dtype=np.float64) for field in FIELDS]))
+
+    def iter_feature_batches(self, batch_size=65536, start_date=None, end_date=None, filter=None, extra_columns=("case_id",)):
+        """Yields (record batch with extra_columns, FeatureBatch) pairs from the features table."""
+        columns = list(extra_columns) + FIELDS
+        for record_batch in self.iter_batches("features", columns, batch_size, start_date, end_date, filter):
+            yield record_batch.select(list(extra_columns)), self.feature_batch(record_batch)
+
+    def read_features(self, start_date=None, end_date=None, filter=None, extra_columns=("case_id",)):
+        table = self.scan("features", list(extra_columns) + FIELDS, start_date, end_date, filter)
+        return table.select(list(extra_columns)), self.feature_batch(table)
+
+# Example Usage:
+# with FeatureStore() as store:
+#     store.append_case(run_underwriting_case("report_001.pdf", "property_001.jpg", components))
+#
+# store = FeatureStore()
+# decisions = store.scan("decisions", ["case_id", "decision", "rule_version"], start_date="2024-01-01")
+# for ids, batch in store.iter_feature_batches(batch_size=100_000): # retraining without re-running OCR
+#     X = batch.to_ml_matrix(ml_model.feature_columns)
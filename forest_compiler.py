@@ -0,0 +1,209 @@
+from collections import deque
+import numpy as np
+
+# Bump when the layout of the arrays below changes
+COMPILED_FOREST_FORMAT_VERSION = 1
+
+_ARRAY_NAMES = ("feature", "threshold", "children", "missing_left", "is_leaf", "leaf_proba", "roots")
+
+# (case, tree) pairs walked together; keeps the working arrays in cache
+_PAIRS_PER_CHUNK = 1 << 16
+
+class CompiledForest:
+    """
+    A fitted tree classifier (RandomForestClassifier, ExtraTreesClassifier or a
+    single DecisionTreeClassifier) flattened into plain NumPy arrays, with all
+    trees' nodes stacked into one set of arrays:
+
+      feature, threshold   split of each node
+      children             right child of each node; the left child is right + 1
+      missing_left         where NaN goes at each node (sklearn >= 1.3)
+      is_leaf
+      leaf_proba           per-node class probabilities, (n_classes, n_nodes)
+      roots                root node of each tree
+
+    Nodes are renumbered so siblings sit next to each other, and leaves loop
+    back to themselves (they test an always-zero extra column against +inf), so
+    one step for every (case, tree) pair is children[node] + (x <= threshold),
+    with no branching. predict_proba walks all trees for a chunk of cases at
+    once, dropping pairs as they reach a leaf.
+
+    The results are identical to sklearn's predict_proba: X is rounded to
+    float32 like sklearn's tree code does, compared against the float64
+    thresholds, and the trees' probabilities are summed in tree order before
+    dividing by the number of trees (sklearn's n_jobs=1 order).
+    """
+    def __init__(self, feature, threshold, children, missing_left, is_leaf, leaf_proba, roots, max_depth, n_features):
+        self.feature = feature
+        self.threshold = threshold
+        self.children = children
+        self.missing_left = missing_left
+        self.is_leaf = is_leaf
+        self.leaf_proba = leaf_proba
+        self.roots = roots
+        self.max_depth = int(max_depth)
+        self.n_features = int(n_features)
+        self.has_missing_routing = bool(missing_left.any())
+
+    @property
+    def n_trees(self):
+        return len(self.roots)
+
+    @property
+    def n_nodes(self):
+        return len(self.feature)
+
+    @classmethod
+    def from_estimator(cls, estimator):
+        """Compiles a fitted single-output tree classifier; returns None for anything else."""
+        trees = getattr(estimator, "estimators_", None)
+        if trees is None:
+            trees = [estimator]
+        if (not hasattr(estimator, "predict_proba") or getattr(estimator, "n_outputs_", None) != 1
+                or not all(hasattr(tree, "tree_") for tree in trees)):
+            return None
+
+        import sklearn # only needed to compile; scoring loaded arrays never imports it
+        # sklearn >= 1.4 stores class fractions in tree_.value and predict_proba returns
+        # them as they are; older versions store counts and normalize on every call
+        values_are_fractions = tuple(int(part) for part in sklearn.__version__.split(".")[:2]) >= (1, 4)
+        n_features = estimator.n_features_in_
+        features, thresholds, children, missing, leaves, probas, roots = [], [], [], [], [], [], []
+        offset = 0
+        max_depth = 0
+        for tree in trees:
+            t = tree.tree_
+            left, right = t.children_left, t.children_right
+            # Breadth-first renumbering, right child first so that left == right + 1
+            order = np.empty(t.node_count, dtype=np.intp) # new id -> old id
+            new_id = np.empty(t.node_count, dtype=np.intp)
+            order[0], new_id[0] = 0, 0
+            queue = deque([0])
+            next_id = 1
+            while queue:
+                node = queue.popleft()
+                if left[node] != -1:
+                    for child in (right[node], left[node]):
+                        order[next_id], new_id[child] = child, next_id
+                        next_id += 1
+                        queue.append(child)
+
+            is_leaf = left[order] == -1
+            own = np.arange(offset, offset + t.node_count, dtype=np.intp)
+            features.append(np.where(is_leaf, n_features, t.feature[order]).astype(np.intp))
+            thresholds.append(np.where(is_leaf, np.inf, t.threshold[order]).astype(np.float64))
+            children.append(np.where(is_leaf, own - 1, new_id[right[order]] + offset).astype(np.intp))
+            missing_go_to_left = getattr(t, "missing_go_to_left", None)
+            missing.append(np.zeros(t.node_count, dtype=bool) if missing_go_to_left is None
+                           else np.asarray(missing_go_to_left, dtype=bool)[order] & ~is_leaf)
+            leaves.append(is_leaf)
+            # Exactly what DecisionTreeClassifier.predict_proba returns for each node
+            value = t.value[order, 0, :tree.n_classes_].astype(np.float64)
+            if not values_are_fractions:
+                normalizer = value.sum(axis=1)[:, np.newaxis]
+                normalizer[normalizer == 0.0] = 1.0
+                value /= normalizer
+            probas.append(value)
+            roots.append(offset)
+            max_depth = max(max_depth, t.max_depth)
+            offset += t.node_count
+
+        return cls(
+            np.concatenate(features), np.concatenate(thresholds), np.concatenate(children), np.concatenate(missing),
+            np.concatenate(leaves), np.ascontiguousarray(np.concatenate(probas).T), np.array(roots, dtype=np.intp),
+            max_depth, n_features,
+        )
+
+    def to_arrays(self):
+        """Plain dict of arrays for the model artifact (memory-mapped on load)."""
+        arrays = {name: getattr(self, name) for name in _ARRAY_NAMES}
+        arrays.update(format_version=COMPILED_FOREST_FORMAT_VERSION, max_depth=self.max_depth, n_features=self.n_features)
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        if arrays.get("format_version") != COMPILED_FOREST_FORMAT_VERSION:
+            return None
+        return cls(*(arrays[name] for name in _ARRAY_NAMES), arrays["max_depth"], arrays["n_features"])
+
+    def _prepare(self, X):
+        X = np.asarray(X)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        if X.shape[1] != self.n_features:
+            raise ValueError(f"X has {X.shape[1]} features, the forest expects {self.n_features}")
+        # Round to float32 first, as sklearn's tree code does, then compare in float64.
+        # The extra zero column is what leaves test (0 <= inf: stay put).
+        prepared = np.zeros((len(X), self.n_features + 1), dtype=np.float64)
+        prepared[:, :-1] = X.astype(np.float32)
+        return prepared
+
+    def _apply_chunk(self, X):
+        # Leaf of every (tree, case) pair for the prepared rows X, as (n_trees, n_cases)
+        n_cases, n_columns = X.shape
+        flat = X.ravel()
+        nodes = np.repeat(self.roots, n_cases)
+        row_base = np.tile(np.arange(n_cases, dtype=np.intp) * n_columns, self.n_trees)
+        leaves = np.empty_like(nodes)
+        pending = None # positions in leaves of the pairs still walking (None = all)
+        for depth in range(1, self.max_depth + 1):
+            index = self.feature.take(nodes)
+            index += row_base
+            values = flat.take(index)
+            go_left = values <= self.threshold.take(nodes)
+            if self.has_missing_routing:
+                go_left |= np.isnan(values) & self.missing_left.take(nodes)
+            nodes = self.children.take(nodes)
+            nodes += go_left
+            if depth % 4 == 0 or depth == self.max_depth:
+                done = self.is_leaf.take(nodes)
+                n_done = np.count_nonzero(done)
+                if n_done == len(nodes):
+                    break
+                if n_done * 2 >= len(nodes): # drop finished pairs once they're half the work
+                    keep = ~done
+                    if pending is None:
+                        pending = np.arange(len(nodes))
+                    leaves[pending[done]] = nodes[done]
+                    nodes, row_base, pending = nodes[keep], row_base[keep], pending[keep]
+        if pending is None:
+            leaves = nodes
+        else:
+            leaves[pending] = nodes
+        return leaves.reshape(self.n_trees, n_cases)
+
+    def _chunks(self, X):
+        X = self._prepare(X)
+        step = max(1, _PAIRS_PER_CHUNK // self.n_trees)
+        for start in range(0, len(X), step):
+            yield start, self._apply_chunk(X[start:start + step])
+
+    def apply(self, X):
+        """Leaf node of every (case, tree) in the compiled numbering: (n_cases, n_trees)."""
+        X = np.asarray(X)
+        leaves = np.empty((len(X) if X.ndim == 2 else 1, self.n_trees), dtype=np.intp)
+        for start, chunk in self._chunks(X):
+            leaves[start:start + chunk.shape[1]] = chunk.T
+        return leaves
+
+    def predict_proba(self, X):
+        X = np.asarray(X)
+        proba = np.empty((len(X) if X.ndim == 2 else 1, len(self.leaf_proba)), dtype=np.float64)
+        for start, leaves in self._chunks(X):
+            stop = start + leaves.shape[1]
+            for k, class_proba in enumerate(self.leaf_proba):
+                # Summed tree by tree, in order, like sklearn's accumulation. Reducing
+                # over the outer axis does that; a single column would be reduced
+                # pairwise as one contiguous run, so that case accumulates instead.
+                values = class_proba.take(leaves)
+                if leaves.shape[1] == 1:
+                    proba[start:stop, k] = np.add.accumulate(values[:, 0])[-1]
+                else:
+                    proba[start:stop, k] = np.add.reduce(values, axis=0)
+        proba /= self.n_trees
+        return proba
+
+# Example Usage:
+# compiled = CompiledForest.from_estimator(random_forest)
+# probabilities = compiled.predict_proba(X) # identical to random_forest.predict_proba(X)
+# labels = random_forest.classes_.take(probabilities.argmax(axis=1))
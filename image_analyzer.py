@@ -1,56 +1,327 @@
-import cv2
-import numpy as np
-from PIL import Image
-
-class ImageAnalyzer:
-    def __init__(self, model_path=None):
-        # In a real scenario, load a pre-trained model here
-        # self.model = load_model(model_path)
-        pass
-
-    def analyze_property_image(self, image_path_or_pil_image):
-        if isinstance(image_path_or_pil_image, str):
-            image = cv2.imread(image_path_or_pil_image)
-            if image is None:
-                print(f"Error loading image: {image_path_or_pil_image}")
-                return {"defects_found": [], "overall_condition": "unknown"}
-            image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-        else: # Assume PIL Image
-            image = np.array(image_path_or_pil_image)
-
-        # --- Dummy Analysis ---
-        # In a real system, you'd run object detection/segmentation here.
-        # For example, using a pre-trained model to detect roof damage,
-        # wall cracks, mold, overgrown vegetation, etc.
-
-        # Simulate finding a defect based on a simple check (e.g., image brightness for "dullness")
-        gray_image = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
-        mean_brightness = np.mean(gray_image)
-
-        defects_found = []
-        if mean_brightness < 80: # Arbitrary threshold for "dullness"
-            defects_found.append("dull_appearance_or_poor_lighting")
-        
-        # Simulate detection of a "crack" or "stain" by checking pixel values
-        # This is highly oversimplified. Real CV models use features, not raw pixels.
-        if np.random.rand() > 0.8: # 20% chance to "detect" a crack
-             defects_found.append("potential_exterior_crack")
-        if np.random.rand() > 0.7: # 30% chance to "detect" a stain
-             defects_found.append("potential_roof_stain")
-
-        overall_condition = "good"
-        if len(defects_found) > 1:
-            overall_condition = "fair"
-        if "potential_exterior_crack" in defects_found:
-            overall_condition = "poor" # Major defect
-
-        return {
-            "defects_found": defects_found,
-            "overall_condition_ai": overall_condition,
-            "num_defects": len(defects_found)
-        }
-
-# Example Usage:
-# img_analyzer = ImageAnalyzer()
-# analysis_results = img_analyzer.analyze_property_image("data/raw_appraisals/property_photo.jpg")
-# print("Image Analysis:", analysis_results)
\ No newline at end of file
+import time
+import numpy as np
+from PIL import Image
+from concurrent.futures import ThreadPoolExecutor
+from config import Config
+from defect_detector import DEFECT_CLASSES, LatencyWindow, MicroBatcher, create_backend
+
+# ITU-R BT.601 luma weights, the same ones cv2.COLOR_RGB2GRAY uses
+GRAY_WEIGHTS = np.array([0.299, 0.587, 0.114])
+
+# Every defect name a single image can report, in the order they're reported
+POSSIBLE_DEFECTS = ["dull_appearance_or_poor_lighting"] + DEFECT_CLASSES
+
+# Bump when photo selection or aggregation in analyze_property_images changes
+# (including triage_reason's fixed "document" thresholds)
+MULTI_IMAGE_VERSION = "3"
+
+# What an image (or a case) that couldn't be analyzed reports: the keys of _summarize
+UNKNOWN_RESULT = {"defects_found": [], "overall_condition_ai": "unknown", "num_defects": 0}
+
+# 32-point DCT-II basis for perceptual_hash
+_DCT_SIZE = 32
+_DCT = np.cos(np.pi * (2 * np.arange(_DCT_SIZE)[None, :] + 1) * np.arange(_DCT_SIZE)[:, None] / (2 * _DCT_SIZE))
+
+def decode_with_size(source, size):
+    """
+    Like decode_normalized, but returns (original (width, height), array):
+    the size comes from the image header, before anything is decoded.
+    """
+    if isinstance(source, np.ndarray):
+        import cv2 # only arrays need it; paths and PIL images are resized by PIL
+        return (source.shape[1], source.shape[0]), cv2.resize(source, size, interpolation=cv2.INTER_AREA)
+    if not isinstance(source, (str, Image.Image)) and hasattr(source, "load"):
+        source = source.load() # e.g. ocr_parser.LazyPDFImage
+    image = Image.open(source) if isinstance(source, str) else source
+    original_size = image.size
+    image.draft("RGB", size) # no-op for formats without reduced decoding
+    return original_size, np.asarray(image.convert("RGB").resize(size, Image.BILINEAR, reducing_gap=2.0))
+
+def decode_normalized(source, size):
+    """
+    Decodes a path, PIL image, RGB array or lazy PDF image handle into an RGB
+    uint8 array of shape (height, width, 3) for size=(width, height).
+
+    JPEGs are decoded directly at 1/2, 1/4 or 1/8 scale (libjpeg DCT scaling via
+    PIL's draft mode) whenever that still covers the target size, so a 12 MP
+    photo never gets decoded at full resolution just to be shrunk again.
+    """
+    return decode_with_size(source, size)[1]
+
+def perceptual_hash(image):
+    """
+    63-bit perceptual hash (pHash) of an RGB array: whether each of the 8x8
+    lowest-frequency DCT coefficients of a 32x32 gray thumbnail, DC excluded,
+    is above their median. Resized, recompressed or slightly re-exposed copies
+    of a photo differ in only a few bits; different scenes in many.
+    """
+    gray = Image.fromarray((image @ GRAY_WEIGHTS).astype(np.uint8)).resize((_DCT_SIZE, _DCT_SIZE), Image.BOX)
+    coefficients = (_DCT @ np.asarray(gray, dtype=np.float64) @ _DCT.T)[:8, :8].ravel()[1:]
+    return int.from_bytes(np.packbits(coefficients > np.median(coefficients)).tobytes(), "big")
+
+def hash_distance(a, b):
+    return bin(a ^ b).count("1")
+
+def size_triage_reason(original_size, min_side=Config.IMAGE_MIN_PHOTO_SIDE, max_aspect_ratio=Config.IMAGE_MAX_ASPECT_RATIO):
+    """The part of triage_reason that needs only the image's (width, height)."""
+    width, height = original_size
+    if min(width, height) < min_side:
+        return "too_small"
+    if max(width, height) > max_aspect_ratio * min(width, height):
+        return "banner"
+    return None
+
+def triage_reason(original_size, image, min_side=Config.IMAGE_MIN_PHOTO_SIDE,
+                  max_aspect_ratio=Config.IMAGE_MAX_ASPECT_RATIO, min_detail=Config.IMAGE_MIN_DETAIL):
+    """
+    Why an image clearly isn't a property photo worth running the detector on,
+    or None if it may be: "too_small" (logos, signatures, icons), "banner"
+    (letterhead or divider strips), "blank" (almost no detail) or "document"
+    (a scanned page: colorless and mostly paper-white).
+    original_size is the image's (width, height); image its normalized RGB array.
+    """
+    reason = size_triage_reason(original_size, min_side, max_aspect_ratio)
+    if reason is not None:
+        return reason
+    image = image[::4, ::4] # every 4th pixel is plenty for these statistics
+    gray = image @ GRAY_WEIGHTS
+    if gray.std() < min_detail:
+        return "blank"
+    chroma = image.max(axis=2).astype(np.int16) - image.min(axis=2)
+    if chroma.mean() < 10 and (gray > 200).mean() > 0.6:
+        return "document"
+    return None
+
+class ImageAnalyzer:
+    def __init__(self, model_path=None, input_size=Config.IMAGE_INPUT_SIZE, decode_workers=Config.IMAGE_DECODE_WORKERS,
+                 backend=None, defect_threshold=Config.DEFECT_THRESHOLD, micro_batching=Config.DEFECT_MICRO_BATCHING,
+                 triage=Config.IMAGE_TRIAGE_ENABLED, dedup_max_distance=Config.IMAGE_DEDUP_MAX_DISTANCE,
+                 max_photos=Config.IMAGE_MAX_PHOTOS_PER_CASE, triage_thresholds=None):
+        self.input_size = tuple(input_size) # (width, height) every image is normalized to
+        self.decode_workers = decode_workers
+        self.defect_threshold = defect_threshold
+        self.triage = triage
+        # triage_reason's keyword arguments; read here, so Config changes after import apply
+        self.triage_thresholds = triage_thresholds or {
+            "min_side": Config.IMAGE_MIN_PHOTO_SIDE, "max_aspect_ratio": Config.IMAGE_MAX_ASPECT_RATIO,
+            "min_detail": Config.IMAGE_MIN_DETAIL,
+        }
+        self.dedup_max_distance = dedup_max_distance
+        self.max_photos = max_photos
+        self._decode_pool = None
+
+        # The detector is loaded and warmed up once, here, not per image
+        self.backend = backend or create_backend(model_path or Config.IMAGE_MODEL_PATH, input_size=self.input_size)
+        self.backend.load()
+        self.backend.warmup()
+        self.batcher = MicroBatcher(self.backend) if micro_batching else None
+        self._direct_metrics = LatencyWindow()
+
+    @property
+    def version(self):
+        return self.backend.version
+
+    @property
+    def case_version(self):
+        # Everything that changes what analyze_property_images returns for the same photos
+        return (f"{self.version}:{self.input_size}:{self.defect_threshold}:multi={MULTI_IMAGE_VERSION}"
+                f":triage={self.triage}:{sorted(self.triage_thresholds.items())}"
+                f":dedup={self.dedup_max_distance}:max={self.max_photos}")
+
+    def inference_metrics(self):
+        return (self.batcher.metrics if self.batcher else self._direct_metrics).summary()
+
+    def close(self):
+        if self._decode_pool is not None:
+            self._decode_pool.shutdown()
+            self._decode_pool = None
+        if self.batcher is not None:
+            self.batcher.close()
+            self.batcher = None
+
+    def _decode(self, source):
+        try:
+            return decode_with_size(source, self.input_size)
+        except Exception as e:
+            print(f"Error loading image: {source}: {e}")
+            return None
+
+    def _decode_all(self, sources):
+        # Concurrently when there's more than one: PIL/libjpeg release the GIL while decoding
+        if self.decode_workers > 1 and len(sources) > 1:
+            if self._decode_pool is None:
+                self._decode_pool = ThreadPoolExecutor(max_workers=self.decode_workers)
+            return list(self._decode_pool.map(self._decode, sources))
+        return [self._decode(source) for source in sources]
+
+    def preprocess_batch(self, sources):
+        """
+        Decodes sources concurrently (PIL/libjpeg release the GIL while decoding)
+        and stacks them into one (N, height, width, 3) uint8 tensor.
+        Returns (tensor, indexes) where indexes are the positions in sources that
+        decoded successfully; tensor is None when none did.
+        """
+        decoded = [result[1] if result is not None else None for result in self._decode_all(sources)]
+        indexes = [i for i, image in enumerate(decoded) if image is not None]
+        if not indexes:
+            return None, indexes
+        return np.stack([decoded[i] for i in indexes]), indexes
+
+    @staticmethod
+    def batch_statistics(batch):
+        # One vectorized pass over the whole batch: per-channel means -> luma
+        channel_means = batch.mean(axis=(1, 2)) # (N, 3)
+        return {
+            "channel_means": channel_means,
+            "mean_brightness": channel_means @ GRAY_WEIGHTS, # mean of the gray image
+        }
+
+    def detect_defects_batch(self, batch, stats):
+        """
+        Returns a list of defect names per image in the batch: the detector's
+        classes scoring at or above defect_threshold, plus a dull-image flag.
+        """
+        if self.batcher is not None:
+            scores = self.batcher.predict(batch)
+        else:
+            started = time.perf_counter()
+            scores = self.backend.predict(batch)
+            self._direct_metrics.record(len(batch), (time.perf_counter() - started) * 1000)
+
+        defects = []
+        for brightness, image_scores in zip(stats["mean_brightness"], scores):
+            defects_found = []
+            if brightness < 80: # Arbitrary threshold for "dullness"
+                defects_found.append("dull_appearance_or_poor_lighting")
+            for defect, score in zip(DEFECT_CLASSES, image_scores):
+                if score >= self.defect_threshold:
+                    defects_found.append(defect)
+            defects.append(defects_found)
+        return defects
+
+    @staticmethod
+    def _summarize(defects_found):
+        overall_condition = "good"
+        if len(defects_found) > 1:
+            overall_condition = "fair"
+        if "potential_exterior_crack" in defects_found:
+            overall_condition = "poor" # Major defect
+
+        return {
+            "defects_found": defects_found,
+            "overall_condition_ai": overall_condition,
+            "num_defects": len(defects_found)
+        }
+
+    def analyze_images_batch(self, sources):
+        """
+        Analyzes many images (paths, PIL images, RGB arrays or lazy PDF image
+        handles) in one batch. Returns one result dict per source, in order.
+        """
+        sources = list(sources)
+        results = [dict(UNKNOWN_RESULT, defects_found=[]) for _ in sources]
+        batch, indexes = self.preprocess_batch(sources)
+        if batch is None:
+            return results
+
+        stats = self.batch_statistics(batch)
+        for i, defects_found in zip(indexes, self.detect_defects_batch(batch, stats)):
+            results[i] = self._summarize(defects_found)
+        return results
+
+    def analyze_property_image(self, image_path_or_pil_image):
+        return self.analyze_images_batch([image_path_or_pil_image])[0]
+
+    def analyze_property_images(self, sources):
+        """
+        Analyzes every photo of a case (uploaded photos and images extracted from
+        the report) and aggregates them into one case-level result with the same
+        keys as analyze_property_image: defects_found holds every defect seen in
+        any photo, and overall_condition_ai / num_defects follow from it. Also
+        returns photo_stats: photos, analyzed, skipped (by triage reason),
+        duplicates, unreadable, defect_counts (analyzed photos showing each
+        defect) and early_exit ("all_defects_found" or "photo_budget", when
+        selected photos were left unanalyzed). A case without any analyzed
+        photo gets overall_condition_ai "unknown" and num_defects 0.
+
+        num_defects counts distinct defect types, as for a single photo, not
+        photos with a defect: the features (image_num_defects) and the rules
+        stay on the scale they had with one photo per case, however many
+        photos were uploaded. defect_counts is kept in photo_stats (and the
+        feature store's image_results) for review only.
+
+        Detector work grows much slower than the photo count. Each photo is
+        decoded once, at reduced JPEG scale; images that clearly aren't property
+        photos (triage_reason) and near-duplicates of a photo already selected
+        (perceptual_hash within dedup_max_distance bits) never reach the detector. The rest are
+        analyzed in batches, stopping as soon as every possible defect has been
+        seen (no further photo could change the result) or max_photos were analyzed.
+        """
+        sources = list(sources)
+        photo_stats = {"photos": len(sources), "analyzed": 0, "skipped": {}, "duplicates": 0, "unreadable": 0,
+                       "defect_counts": {}, "early_exit": None}
+        selected, hashes = [], []
+        if self.triage:
+            # Images from a PDF know their size up front: logos and banners are skipped without decoding
+            undecoded = []
+            for source in sources:
+                size = getattr(source, "size", None) if hasattr(source, "load") else None
+                reason = size_triage_reason(size, self.triage_thresholds["min_side"],
+                                            self.triage_thresholds["max_aspect_ratio"]) if size else None
+                if reason is not None:
+                    photo_stats["skipped"][reason] = photo_stats["skipped"].get(reason, 0) + 1
+                else:
+                    undecoded.append(source)
+            sources = undecoded
+        for decoded in self._decode_all(sources):
+            if decoded is None:
+                photo_stats["unreadable"] += 1
+                continue
+            original_size, image = decoded
+            reason = triage_reason(original_size, image, **self.triage_thresholds) if self.triage else None
+            if reason is not None:
+                photo_stats["skipped"][reason] = photo_stats["skipped"].get(reason, 0) + 1
+                continue
+            if self.dedup_max_distance is not None:
+                image_hash = perceptual_hash(image)
+                if any(hash_distance(image_hash, seen) <= self.dedup_max_distance for seen in hashes):
+                    photo_stats["duplicates"] += 1
+                    continue
+                hashes.append(image_hash)
+            selected.append(image)
+
+        seen = set()
+        batch_size = Config.DEFECT_MAX_BATCH_SIZE
+        budget = len(selected) if self.max_photos is None else min(len(selected), self.max_photos)
+        for start in range(0, budget, batch_size):
+            stop = min(start + batch_size, budget)
+            batch = np.stack(selected[start:stop])
+            for defects_found in self.detect_defects_batch(batch, self.batch_statistics(batch)):
+                photo_stats["analyzed"] += 1
+                seen.update(defects_found)
+                for defect in defects_found:
+                    photo_stats["defect_counts"][defect] = photo_stats["defect_counts"].get(defect, 0) + 1
+            if len(seen) == len(POSSIBLE_DEFECTS) and stop < len(selected):
+                photo_stats["early_exit"] = "all_defects_found"
+                break
+        else:
+            if budget < len(selected):
+                photo_stats["early_exit"] = "photo_budget"
+
+        if not photo_stats["analyzed"]:
+            return dict(UNKNOWN_RESULT, defects_found=[], photo_stats=photo_stats)
+        result = self._summarize([defect for defect in POSSIBLE_DEFECTS if defect in seen])
+        result["photo_stats"] = photo_stats
+        return result
+
+# Example Usage:
+# img_analyzer = ImageAnalyzer()
+# analysis_results = img_analyzer.analyze_property_image("data/raw_appraisals/property_photo.jpg")
+# print("Image Analysis:", analysis_results)
+#
+# # Many photos at once: decoded concurrently at reduced resolution, analyzed as one tensor
+# batch_results = img_analyzer.analyze_images_batch(["front.jpg", "roof.jpg", "rear.jpg"])
+#
+# # A whole case: duplicates and non-photos are dropped, the rest aggregated into one result
+# case_result = img_analyzer.analyze_property_images(["front.jpg", "front_copy.jpg", "roof.jpg", "logo.png"])
+# print("Case:", case_result["overall_condition_ai"], case_result["photo_stats"])
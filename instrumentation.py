@@ -0,0 +1,286 @@
+import cProfile
+import json
+import os
+import random
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from config import Config
+
+# Pipeline stages timed by process_underwriting_case, in order
+STAGES = ["ocr", "parse", "image", "fuse", "rules", "ml"]
+
+# Histogram bucket upper bounds in seconds (Prometheus convention)
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+def max_rss_bytes():
+    """High-water mark of this process's resident memory."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024 # bytes on macOS, KiB on Linux
+
+class _Histogram:
+    __slots__ = ("counts", "count", "sum", "max")
+
+    def __init__(self):
+        self.counts = [0] * len(LATENCY_BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                self.counts[i] += 1
+                break
+        self.count += 1
+        self.sum += seconds
+        self.max = max(self.max, seconds)
+
+class PipelineMetrics:
+    """
+    Per-stage timers, counters and memory high-water marks for the pipeline.
+
+    Every case is timed stage by stage into a small per-case record (see
+    begin_case/end_case) and folded into process-wide histograms. Records from
+    other processes (batch or service workers) can be merged with record_case,
+    so the parent exports totals for the whole pool. Export with to_prometheus()
+    or to_json_line(). Recording is a few dict updates per stage, cheap enough
+    to leave on for every case.
+    """
+    def __init__(self, cache=None):
+        self.cache = cache # StageCache whose hit/miss counts are exported too
+        self._lock = threading.Lock()
+        self._local = threading.local() # the case being recorded on this thread
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started_at = time.time()
+            self.stage_seconds = {}
+            self.counters = {}
+            self.peak_rss_bytes = 0
+            self.peak_traced_bytes = 0
+
+    # --- recording ---
+
+    def begin_case(self, case_id=None):
+        self._local.case = {"case_id": case_id, "stage_ms": {}, "counters": {}}
+        self._local.started = time.perf_counter()
+
+    def end_case(self):
+        """Finishes the current case and returns its record (JSON-serializable)."""
+        case = getattr(self._local, "case", None)
+        if case is None:
+            return None
+        self._local.case = None
+        case["total_ms"] = round((time.perf_counter() - self._local.started) * 1000, 3)
+        case["max_rss_bytes"] = max_rss_bytes()
+        self._observe("total", case["total_ms"] / 1000)
+        self.incr("cases")
+        with self._lock:
+            self.peak_rss_bytes = max(self.peak_rss_bytes, case["max_rss_bytes"])
+        return case
+
+    @contextmanager
+    def stage(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            case = getattr(self._local, "case", None)
+            if case is not None:
+                case["stage_ms"][name] = round(case["stage_ms"].get(name, 0.0) + elapsed * 1000, 3)
+            self._observe(name, elapsed)
+
+    def incr(self, name, value=1):
+        case = getattr(self._local, "case", None)
+        if case is not None and name != "cases":
+            case["counters"][name] = case["counters"].get(name, 0) + value
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe_traced_peak(self, peak_bytes):
+        case = getattr(self._local, "case", None)
+        if case is not None:
+            case["traced_peak_bytes"] = peak_bytes
+        with self._lock:
+            self.peak_traced_bytes = max(self.peak_traced_bytes, peak_bytes)
+
+    def _observe(self, name, seconds):
+        with self._lock:
+            histogram = self.stage_seconds.get(name)
+            if histogram is None:
+                histogram = self.stage_seconds[name] = _Histogram()
+            histogram.observe(seconds)
+
+    def record_case(self, case):
+        """Merges a case record produced by end_case() in another process."""
+        for name, ms in case.get("stage_ms", {}).items():
+            self._observe(name, ms / 1000)
+        if "total_ms" in case:
+            self._observe("total", case["total_ms"] / 1000)
+        with self._lock:
+            for name, value in case.get("counters", {}).items():
+                self.counters[name] = self.counters.get(name, 0) + value
+            self.counters["cases"] = self.counters.get("cases", 0) + 1
+            self.peak_rss_bytes = max(self.peak_rss_bytes, case.get("max_rss_bytes", 0))
+            self.peak_traced_bytes = max(self.peak_traced_bytes, case.get("traced_peak_bytes", 0))
+
+    # --- export ---
+
+    def snapshot(self):
+        with self._lock:
+            snapshot = {
+                "timestamp": time.time(),
+                "uptime_sec": round(time.time() - self.started_at, 3),
+                "stages": {
+                    name: {
+                        "count": h.count,
+                        "sum_sec": round(h.sum, 6),
+                        "mean_ms": round(h.sum / h.count * 1000, 3) if h.count else 0.0,
+                        "max_ms": round(h.max * 1000, 3),
+                    }
+                    for name, h in self.stage_seconds.items()
+                },
+                "counters": dict(self.counters),
+                "peak_rss_bytes": max(self.peak_rss_bytes, max_rss_bytes()),
+                "peak_traced_bytes": self.peak_traced_bytes,
+            }
+        if self.cache is not None:
+            snapshot["cache"] = self.cache.metrics()
+        return snapshot
+
+    def to_json_line(self):
+        return json.dumps(self.snapshot(), sort_keys=True)
+
+    def append_json_line(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, "a") as f:
+            f.write(self.to_json_line() + "\n")
+
+    def to_prometheus(self, prefix="underwriting"):
+        """Prometheus text exposition format (version 0.0.4)."""
+        lines = [
+            f"# HELP {prefix}_stage_seconds Wall time per pipeline stage (stage=\"total\" is the whole case).",
+            f"# TYPE {prefix}_stage_seconds histogram",
+        ]
+        with self._lock:
+            for name, h in sorted(self.stage_seconds.items()):
+                cumulative = 0
+                for bound, count in zip(LATENCY_BUCKETS, h.counts):
+                    cumulative += count
+                    lines.append(f'{prefix}_stage_seconds_bucket{{stage="{name}",le="{bound}"}} {cumulative}')
+                lines.append(f'{prefix}_stage_seconds_bucket{{stage="{name}",le="+Inf"}} {h.count}')
+                lines.append(f'{prefix}_stage_seconds_sum{{stage="{name}"}} {h.sum:.6f}')
+                lines.append(f'{prefix}_stage_seconds_count{{stage="{name}"}} {h.count}')
+            for name, value in sorted(self.counters.items()):
+                lines.append(f"# TYPE {prefix}_{name}_total counter")
+                lines.append(f"{prefix}_{name}_total {value}")
+            peak_traced = self.peak_traced_bytes
+            peak_rss = self.peak_rss_bytes
+        lines.append(f"# TYPE {prefix}_peak_rss_bytes gauge")
+        lines.append(f"{prefix}_peak_rss_bytes {max(peak_rss, max_rss_bytes())}")
+        lines.append(f"# TYPE {prefix}_peak_traced_bytes gauge")
+        lines.append(f"{prefix}_peak_traced_bytes {peak_traced}")
+        if self.cache is not None:
+            lines.append(f"# TYPE {prefix}_cache_lookups_total counter")
+            for stage, stats in sorted(self.cache.metrics().items()):
+                lines.append(f'{prefix}_cache_lookups_total{{stage="{stage}",result="hit"}} {stats["hits"]}')
+                lines.append(f'{prefix}_cache_lookups_total{{stage="{stage}",result="miss"}} {stats["misses"]}')
+        return "\n".join(lines) + "\n"
+
+class SampledProfiler:
+    """
+    Opt-in profiling for a random sample of cases.
+
+    mode="cprofile" writes <case_id>.prof (open with pstats or snakeviz);
+    mode="tracemalloc" writes <case_id>.alloc.txt with the top allocation sites
+    and the case's traced memory peak. With sample_rate=0 (the default) the
+    only cost per case is one comparison.
+    """
+    def __init__(self, sample_rate=Config.PROFILE_SAMPLE_RATE, mode=Config.PROFILE_MODE,
+                 output_dir=Config.PROFILE_DIR, top_n=25):
+        if mode not in ("cprofile", "tracemalloc"):
+            raise ValueError(f"Unknown profiler mode '{mode}'")
+        self.sample_rate = sample_rate
+        self.mode = mode
+        self.output_dir = output_dir
+        self.top_n = top_n
+        self._active = threading.Lock() # one profiled case at a time per process
+
+    def _output_path(self, case_id, suffix):
+        os.makedirs(self.output_dir, exist_ok=True)
+        name = "".join(c if c.isalnum() or c in "-_." else "_" for c in str(case_id or "case"))
+        return os.path.join(self.output_dir, f"{name}.{os.getpid()}.{int(time.time() * 1000)}{suffix}")
+
+    @contextmanager
+    def profile(self, case_id=None, metrics=None):
+        if self.sample_rate <= 0 or random.random() >= self.sample_rate or not self._active.acquire(blocking=False):
+            yield None
+            return
+        try:
+            if self.mode == "cprofile":
+                with self._cprofile(case_id) as path:
+                    yield path
+            else:
+                with self._tracemalloc(case_id, metrics) as path:
+                    yield path
+        finally:
+            self._active.release()
+
+    @contextmanager
+    def _cprofile(self, case_id):
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError: # another profiler is already active on this thread
+            yield None
+            return
+        path = self._output_path(case_id, ".prof")
+        try:
+            yield path
+        finally:
+            profiler.disable()
+            profiler.dump_stats(path)
+            print(f"Profiled case {case_id} -> {path}")
+
+    @contextmanager
+    def _tracemalloc(self, case_id, metrics):
+        already_tracing = tracemalloc.is_tracing()
+        if not already_tracing:
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        path = self._output_path(case_id, ".alloc.txt")
+        try:
+            yield path
+        finally:
+            _, peak = tracemalloc.get_traced_memory()
+            snapshot = tracemalloc.take_snapshot()
+            if not already_tracing:
+                tracemalloc.stop()
+            with open(path, "w") as f:
+                f.write(f"case: {case_id}\ntraced peak: {peak} bytes\n\n")
+                for stat in snapshot.statistics("lineno")[:self.top_n]:
+                    f.write(f"{stat}\n")
+            if metrics is not None:
+                metrics.observe_traced_peak(peak)
+            print(f"Traced allocations for case {case_id} -> {path}")
+
+# Example Usage:
+# metrics = PipelineMetrics()
+# metrics.begin_case("case_001")
+# with metrics.stage("ocr"):
+#     text = ocr_parser.extract_text_from_pdf("report_001.pdf")
+# metrics.incr("pages", 3)
+# print(metrics.end_case())
+# print(metrics.to_prometheus())
+#
+# profiler = SampledProfiler(sample_rate=0.01) # profile ~1% of cases
+# with profiler.profile("case_001", metrics):
+#     process_underwriting_case("report_001.pdf", "property_001.jpg")
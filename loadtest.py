@@ -0,0 +1,146 @@
+"""
+Local load-test harness for service.py. Standard library only.
+
+Drives either the synchronous fast path (/score) or full uploads (/cases, then
+polling /jobs/{id} until the case finishes) with a fixed number of concurrent
+clients, and reports throughput plus p50/p90/p99 end-to-end latency.
+
+    uvicorn service:app --port 8000 &
+    python loadtest.py --mode score --requests 2000 --concurrency 32
+    python loadtest.py --mode cases --report data/raw_appraisals/report_001.pdf \
+        --photo data/raw_appraisals/property_001.jpg --requests 100 --concurrency 8
+"""
+import argparse
+import http.client
+import json
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+SAMPLE_SCORE_REQUEST = {
+    "text_data": {
+        "square_footage": "1,850", "year_built": "1985", "roof_condition_classified": "fair",
+        "foundation_cracks_detected": "no", "flood_zone": "low",
+    },
+    "image_data": {"defects_found": [], "overall_condition_ai": "good", "num_defects": 0},
+}
+
+_local = threading.local()
+
+def _connection(base):
+    # One keep-alive connection per client thread
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = _local.conn = http.client.HTTPConnection(base.hostname, base.port or 80, timeout=600)
+    return conn
+
+def _request(base, method, path, body=None, headers=None):
+    conn = _connection(base)
+    try:
+        conn.request(method, path, body=body, headers=headers or {})
+        response = conn.getresponse()
+        return response.status, response.read()
+    except (http.client.HTTPException, OSError):
+        conn.close()
+        _local.conn = None
+        raise
+
+def _multipart(files):
+    boundary = uuid.uuid4().hex
+    parts = []
+    for field, path in files.items():
+        with open(path, "rb") as f:
+            data = f.read()
+        parts.append(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{field}"; filename="{os.path.basename(path)}"\r\n'
+            f"Content-Type: application/octet-stream\r\n\r\n".encode() + data + b"\r\n"
+        )
+    body = b"".join(parts) + f"--{boundary}--\r\n".encode()
+    return body, {"Content-Type": f"multipart/form-data; boundary={boundary}"}
+
+def _score_once(base, payload):
+    status, _ = _request(base, "POST", "/score", payload, {"Content-Type": "application/json"})
+    return status
+
+def _case_once(base, body, headers, poll_interval):
+    status, response = _request(base, "POST", "/cases", body, headers)
+    if status != 202:
+        return status
+    status_url = json.loads(response)["status_url"]
+    while True:
+        status, response = _request(base, "GET", status_url)
+        if status != 200:
+            return status
+        job = json.loads(response)
+        if job["status"] in ("done", "failed"):
+            return 200 if job["status"] == "done" else 500
+        time.sleep(poll_interval)
+
+def run(url, mode="score", requests=1000, concurrency=16, report=None, photo=None, poll_interval=0.05):
+    base = urlparse(url)
+    if mode == "score":
+        payload = json.dumps(SAMPLE_SCORE_REQUEST).encode()
+        call = lambda: _score_once(base, payload)
+    else:
+        files = {"report": report}
+        if photo:
+            files["photo"] = photo
+        body, headers = _multipart(files)
+        call = lambda: _case_once(base, body, headers, poll_interval)
+
+    def timed(_):
+        started = time.perf_counter()
+        try:
+            status = call()
+        except Exception:
+            status = -1
+        return status, time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        outcomes = list(pool.map(timed, range(requests)))
+    wall = time.perf_counter() - started
+
+    latencies = sorted(latency for status, latency in outcomes if status == 200)
+    def percentile(p):
+        if not latencies:
+            return None
+        return round(latencies[min(len(latencies) - 1, int(p / 100 * len(latencies)))] * 1000, 2)
+
+    statuses = {}
+    for status, _ in outcomes:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    return {
+        "mode": mode,
+        "requests": requests,
+        "concurrency": concurrency,
+        "ok": len(latencies),
+        "statuses": statuses, # 503 = refused by admission control, -1 = connection error
+        "wall_sec": round(wall, 3),
+        "throughput_per_sec": round(len(latencies) / wall, 2) if wall else 0.0,
+        "latency_ms_p50": percentile(50),
+        "latency_ms_p90": percentile(90),
+        "latency_ms_p99": percentile(99),
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--mode", choices=["score", "cases"], default="score")
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--report", help="PDF to upload in cases mode")
+    parser.add_argument("--photo", help="optional photo to upload in cases mode")
+    args = parser.parse_args(argv)
+    if args.mode == "cases" and not args.report:
+        parser.error("--report is required in cases mode")
+
+    summary = run(args.url, args.mode, args.requests, args.concurrency, args.report, args.photo)
+    print(json.dumps(summary, indent=2))
+    return summary
+
+if __name__ == "__main__":
+    main()
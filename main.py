@@ -1,130 +1,262 @@
-import os
-from config import Config
-from src.document_processing.ocr_parser import OCRParser
-from src.document_processing.report_parser import ReportParser
-from src.computer_vision.image_analyzer import ImageAnalyzer
-from src.multimodal_fusion.data_integrator import DataIntegrator
-from src.risk_assessment.rule_engine import RuleEngine
-from src.risk_assessment.ml_risk_model import MLRiskModel
-
-def process_underwriting_case(report_path, photo_path):
-    print(f"--- Processing Case: {os.path.basename(report_path)} ---")
-
-    # 1. Document Processing
-    ocr_parser = OCRParser(Config.TESSERACT_CMD)
-    report_parser = ReportParser()
-
-    print("Step 1: Document Processing (Text & Image Extraction)")
-    text_content, extracted_images = ocr_parser.extract_text_from_pdf(report_path)
-    parsed_text_data = report_parser.parse_text(text_content)
-    print("Parsed Text Data:", parsed_text_data)
-
-    # 2. Computer Vision (for primary photo or extracted images)
-    image_analyzer = ImageAnalyzer()
-    image_analysis_results = {}
-    if photo_path and os.path.exists(photo_path):
-        image_analysis_results = image_analyzer.analyze_property_image(photo_path)
-    elif extracted_images: # Use first extracted image if no primary photo provided
-        image_analysis_results = image_analyzer.analyze_property_image(extracted_images[0])
-    print("Image Analysis Results:", image_analysis_results)
-
-    # 3. Multimodal Fusion
-    data_integrator = DataIntegrator()
-    combined_features = data_integrator.integrate_data(parsed_text_data, image_analysis_results)
-    print("Combined Features:", combined_features)
-
-    # 4. Risk Assessment (Rule-based)
-    rule_engine = RuleEngine()
-    rule_based_assessment = rule_engine.apply_rules(combined_features)
-    print("Rule-based Assessment:", rule_based_assessment)
-
-    # 5. Risk Assessment (ML Model)
-    ml_model = MLRiskModel()
-    if not ml_model.load_model():
-        print("ML Model not loaded. Skipping ML risk prediction.")
-        ml_prediction = {"predicted_label": "N/A", "probabilities": {}}
-    else:
-        # Preprocess combined_features for the ML model
-        # This part needs to be robust: handle missing features, encode categoricals
-        # For simplicity, let's assume combined_features has numerical/boolean
-        # and ML model handles dummy variables.
-        # In a real system, you'd use the same preprocessing (e.g., OneHotEncoder)
-        # that was used during training.
-        
-        # Dummy preprocessing to match expected ML model features
-        ml_features_for_prediction = {
-            'text_square_footage': float(combined_features.get('text_square_footage', 0).replace(',', '')) if combined_features.get('text_square_footage') else 0,
-            'text_year_built': int(combined_features.get('text_year_built', 0)) if combined_features.get('text_year_built') else 0,
-            'image_num_defects': combined_features.get('image_num_defects', 0),
-            'multimodal_roof_conflict': 1 if combined_features.get('multimodal_roof_conflict') else 0,
-            'combined_property_condition_score': combined_features.get('combined_property_condition_score', 0),
-            'text_roof_condition_classified_poor': 1 if combined_features.get('text_roof_condition_classified') == 'poor' else 0,
-            'text_roof_condition_classified_unknown': 1 if combined_features.get('text_roof_condition_classified') == 'unknown' else 0,
-            # Add other dummy-encoded features as per your training data
-            'text_roof_condition_classified_good': 1 if combined_features.get('text_roof_condition_classified') == 'good' else 0,
-            # If your ML model was trained with 'text_roof_condition_classified_fair' as a feature, include it here.
-            # Otherwise, ensure your training strategy accounts for `drop_first=True`
-            # For simplicity, if 'good' 'poor' 'unknown' are not set to 1, then 'fair' is implicitly the case when drop_first=True.
-        }
-
-        # Filter to only the features the ML model was trained on
-        # (This is why self.feature_columns in MLRiskModel is important)
-        if ml_model.feature_columns:
-            final_ml_input = {k: ml_features_for_prediction.get(k, 0) for k in ml_model.feature_columns}
-        else:
-            final_ml_input = ml_features_for_prediction # Fallback if feature_columns not set
-
-        ml_prediction = ml_model.predict_risk(final_ml_input)
-    print("ML Model Prediction:", ml_prediction)
-
-    print("--- Final Underwriting Decision ---")
-    final_decision = rule_based_assessment["decision"]
-    if ml_prediction["predicted_label"] == "HIGH_RISK" and final_decision == "APPROVED":
-        final_decision = "REVIEW_REQUIRED (ML flag)"
-    if ml_prediction["predicted_label"] == "DECLINE" and final_decision != "DECLINE":
-        final_decision = "DECLINE (ML override)"
-
-    print(f"Overall Decision: {final_decision}")
-    print("-" * 40)
-    return final_decision, rule_based_assessment, ml_prediction, combined_features
-
-# To run this:
-if __name__ == "__main__":
-    # Create dummy data directories and files for testing
-    os.makedirs(Config.RAW_DATA_DIR, exist_ok=True)
-    os.makedirs(Config.MODELS_DIR, exist_ok=True)
-
-    # Create a dummy PDF (you'll need to create a real one or use existing)
-    # For a quick test, you might mock the OCR and parser output
-    dummy_pdf_content = """
-    Property Appraisal Report
-    Property Address: 123 Elm Street, Springfield, IL 62704
-    Property Type: Single Family Home
-    Year Built: 1985
-    Total Living Area: 1850 sq ft
-    Roof Condition: Fair, some granular loss.
-    Foundation Condition: Solid, no visible cracks.
-    """
-    with open(os.path.join(Config.RAW_DATA_DIR, "report_001.pdf"), "w") as f: # Not a real PDF, just for text example
-         f.write(dummy_pdf_content)
-    # You'd typically need a library like reportlab to truly create a PDF
-    # Or just use an existing PDF report for testing.
-
-    # Create a dummy image (e.g., a blank image or a photo you have)
-    from PIL import Image
-    dummy_image = Image.new('RGB', (60, 30), color = 'red')
-    dummy_image.save(os.path.join(Config.RAW_DATA_DIR, "property_001.jpg"))
-
-    # --- IMPORTANT: Train and save a dummy ML model first! ---
-    # Run the ML model training section in ml_risk_model.py once
-    # to generate a dummy model file for this main.py to load.
-    # Otherwise, the ML prediction step will be skipped.
-
-    # Example usage:
-    process_underwriting_case(
-        os.path.join(Config.RAW_DATA_DIR, "report_001.pdf"),
-        os.path.join(Config.RAW_DATA_DIR, "property_001.jpg")
-    )
-
-    # You could extend this to process multiple files in a loop
-    # or build a web API with FastAPI to upload documents.
\ No newline at end of file
+import logging
+import os
+from config import Config
+from instrumentation import PipelineMetrics, SampledProfiler
+from result_cache import build_default_cache, hash_file, hash_obj
+from data_integrator import DataIntegrator
+from image_analyzer import ImageAnalyzer
+from ml_risk_model import MLRiskModel
+from ocr_parser import OCRParser
+from report_parser import ReportParser
+from rule_engine import RuleEngine
+
+logger = logging.getLogger(__name__)
+
+def _cached(cache, stage, version, input_hash, compute, metrics=None, cacheable=None):
+    if cache is None:
+        return compute()
+    computed = []
+    def compute_and_note():
+        computed.append(True)
+        return compute()
+    value = cache.get_or_compute(stage, version, input_hash, compute_and_note, cacheable)
+    if metrics is not None:
+        metrics.incr("cache_misses" if computed else "cache_hits")
+    return value
+
+def final_underwriting_decision(rule_decision, ml_label):
+    final_decision = rule_decision
+    if ml_label == "HIGH_RISK" and final_decision in ("APPROVED", "APPROVED_WITH_CONDITIONS"):
+        final_decision = "REVIEW_REQUIRED (ML flag)"
+    if ml_label == "DECLINE" and final_decision != "DECLINE":
+        final_decision = "DECLINE (ML override)"
+    return final_decision
+
+def build_components(ocr_workers=Config.OCR_MAX_WORKERS, ml_model=None):
+    """
+    Builds every pipeline component once so callers that process many cases
+    (e.g. batch workers) don't re-create parsers or re-load the risk model per case.
+    ml_model: an already loaded MLRiskModel to use instead of loading one
+    (e.g. the one batch_runner.preload_worker_state loaded before forking).
+    """
+    if ml_model is None:
+        ml_model = MLRiskModel()
+        if not ml_model.load_model():
+            ml_model = None
+    cache = build_default_cache() if Config.CACHE_ENABLED else None
+    return {
+        "ocr_parser": OCRParser(Config.TESSERACT_CMD, ocr_workers=ocr_workers),
+        "report_parser": ReportParser(),
+        "image_analyzer": ImageAnalyzer(Config.IMAGE_MODEL_PATH),
+        "data_integrator": DataIntegrator(),
+        "rule_engine": RuleEngine(),
+        "ml_model": ml_model,
+        "cache": cache,
+        "metrics": PipelineMetrics(cache),
+        "profiler": SampledProfiler(),
+    }
+
+def process_underwriting_case(report_path, photo_path, components=None, case_id=None):
+    """
+    Returns (final_decision, rule_based_assessment, ml_prediction, combined_features).
+    See run_underwriting_case for every stage's output.
+    """
+    outputs = run_underwriting_case(report_path, photo_path, components, case_id)
+    return (outputs["decision"], outputs["rule_based_assessment"], outputs["ml_prediction"],
+            outputs["features"].to_dict())
+
+def run_underwriting_case(report_path, photo_path, components=None, case_id=None):
+    """
+    Runs one case through every stage and returns a dict with each stage's
+    output (parsed_text, image_analysis, features as a FeatureRecord,
+    rule_based_assessment, ml_prediction, decision) plus the hashes and
+    component versions that produced them, e.g. for the feature store.
+    degraded lists what went wrong reading the report (e.g. pages OCR
+    failed on) when the case was decided on incomplete text.
+    photo_path may be one uploaded photo, a list of them, or None; the images
+    embedded in the report are analyzed along with them.
+    """
+    if components is None:
+        components = build_components()
+    case_id = case_id or os.path.splitext(os.path.basename(report_path))[0]
+    metrics = components.get("metrics") or PipelineMetrics()
+    profiler = components.get("profiler")
+
+    metrics.begin_case(case_id)
+    try:
+        if profiler is None:
+            result = _run_stages(report_path, photo_path, components, metrics)
+        else:
+            with profiler.profile(case_id, metrics):
+                result = _run_stages(report_path, photo_path, components, metrics)
+    finally:
+        case_record = metrics.end_case()
+        # Kept on the components so callers (batch/service workers) can ship it to their parent
+        components["last_case_metrics"] = case_record
+
+    result["case_id"] = case_id
+    logger.info("case=%s decision=%s total_ms=%s stage_ms=%s", case_id, result["decision"],
+                case_record["total_ms"], case_record["stage_ms"])
+    return result
+
+def _run_stages(report_path, photo_path, components, metrics):
+    # Every stage result is cached by (stage, component version, input content hash),
+    # so a resubmitted case only recomputes stages whose inputs actually changed
+    cache = components.get("cache")
+    report_hash = hash_file(report_path)
+
+    # 1. Document Processing
+    ocr_parser = components["ocr_parser"]
+    report_parser = components["report_parser"]
+
+    extract_errors = []
+    def extract():
+        # Embedded images come back as lazy handles; only the one we analyze gets decoded
+        extracted = ocr_parser.extract_text_from_pdf(report_path, lazy_images=True, ocr_fallback=Config.OCR_FALLBACK_ENABLED)
+        stats = ocr_parser.last_ocr_stats
+        metrics.incr("pages", stats["pages"])
+        metrics.incr("ocr_pages", stats["ocr_pages"])
+        metrics.incr("ocr_page_cache_hits", stats["cache_hits"])
+        if stats.get("ocr_failed_pages"):
+            metrics.incr("ocr_failed_pages", stats["ocr_failed_pages"])
+            extract_errors.extend(stats["ocr_errors"])
+        if stats.get("error"):
+            metrics.incr("ocr_errors")
+            extract_errors.append(stats["error"])
+        return extracted
+
+    with metrics.stage("ocr"):
+        # Partial text from a failed extraction (or pages whose OCR failed) is used
+        # for this case, which is flagged as degraded, but never cached, so
+        # resubmitting the report gets a fresh attempt
+        text_content, extracted_images = _cached(
+            cache, "ocr", f"{ocr_parser.version}:fallback={Config.OCR_FALLBACK_ENABLED}", report_hash, extract, metrics,
+            cacheable=lambda _: not extract_errors,
+        )
+        # Handles from the cache point at wherever the report was when it was first
+        # extracted (e.g. a service spool directory since deleted); same content, so
+        # read them from this copy
+        extracted_images = [image.for_path(report_path) for image in extracted_images]
+    with metrics.stage("parse"):
+        parsed_text_data = _cached(cache, "parse", report_parser.version, hash_obj(text_content),
+                                   lambda: report_parser.parse_text(text_content), metrics)
+    logger.debug("Parsed Text Data: %s", parsed_text_data)
+
+    # 2. Computer Vision: every uploaded photo and every image in the report,
+    # aggregated into one case-level result (duplicates and non-photos are dropped first)
+    image_analyzer = components["image_analyzer"]
+    image_version = image_analyzer.case_version
+    photo_paths = [photo_path] if isinstance(photo_path, str) else list(photo_path or [])
+    photo_paths = [path for path in photo_paths if os.path.exists(path)]
+    image_sources = photo_paths + list(extracted_images)
+
+    def analyze():
+        result = image_analyzer.analyze_property_images(image_sources)
+        photo_stats = result["photo_stats"]
+        metrics.incr("images", photo_stats["analyzed"])
+        metrics.incr("images_skipped", sum(photo_stats["skipped"].values()))
+        metrics.incr("images_duplicate", photo_stats["duplicates"])
+        return result
+
+    image_analysis_results = {}
+    image_hash = None
+    with metrics.stage("image"):
+        if image_sources:
+            # Extracted images are identified by the report they came from
+            image_hash = hash_obj([hash_file(path) for path in photo_paths] + ([f"pdf:{report_hash}"] if extracted_images else []))
+            image_analysis_results = _cached(cache, "image", image_version, image_hash, analyze, metrics)
+    logger.debug("Image Analysis Results: %s", image_analysis_results)
+
+    # 3. Multimodal Fusion
+    data_integrator = components["data_integrator"]
+    # One typed FeatureRecord per case: numbers are parsed and categories encoded
+    # once here, and the same record feeds the rules and the risk model
+    with metrics.stage("fuse"):
+        features = _cached(cache, "fuse", data_integrator.VERSION, hash_obj([parsed_text_data, image_analysis_results]),
+                           lambda: data_integrator.integrate_record(parsed_text_data, image_analysis_results), metrics)
+    features_hash = hash_obj(features.as_tuple())
+    logger.debug("Combined Features: %s", features)
+
+    # 4. Risk Assessment (Rule-based)
+    rule_engine = components["rule_engine"]
+    with metrics.stage("rules"):
+        rule_based_assessment = _cached(cache, "rules", rule_engine.version, features_hash,
+                                        lambda: rule_engine.apply_rules(features), metrics)
+    logger.debug("Rule-based Assessment: %s", rule_based_assessment)
+
+    # 5. Risk Assessment (ML Model)
+    ml_model = components["ml_model"]
+    with metrics.stage("ml"):
+        if ml_model is None:
+            logger.debug("ML Model not loaded. Skipping ML risk prediction.")
+            ml_prediction = {"predicted_label": "N/A", "probabilities": {}}
+        else:
+            # The record is encoded into exactly the columns the model was trained on,
+            # in training order (feature_columns is restored from the model artifact)
+            ml_prediction = _cached(cache, "ml", ml_model.model_hash, features_hash,
+                                    lambda: ml_model.predict_risk(features), metrics)
+    logger.debug("ML Model Prediction: %s", ml_prediction)
+
+    final_decision = final_underwriting_decision(rule_based_assessment["decision"], ml_prediction["predicted_label"])
+    if extract_errors:
+        metrics.incr("degraded_cases")
+    return {
+        "decision": final_decision,
+        # Why this decision rests on incomplete input (e.g. pages OCR couldn't read); empty when it doesn't
+        "degraded": extract_errors,
+        "parsed_text": parsed_text_data,
+        "image_analysis": image_analysis_results,
+        "features": features,
+        "rule_based_assessment": rule_based_assessment,
+        "ml_prediction": ml_prediction,
+        "report_hash": report_hash,
+        "image_hash": image_hash,
+        "versions": {
+            "parser": report_parser.version,
+            "image": image_version,
+            "fuse": data_integrator.VERSION,
+            "rules": rule_engine.version,
+            "model": ml_model.model_version if ml_model is not None else None,
+            "model_hash": ml_model.model_hash if ml_model is not None else None,
+        },
+    }
+
+# To run this:
+if __name__ == "__main__":
+    # Create dummy data directories and files for testing
+    os.makedirs(Config.RAW_DATA_DIR, exist_ok=True)
+    os.makedirs(Config.MODELS_DIR, exist_ok=True)
+
+    # python main.py [report.pdf [photo.jpg]]; without a report, a realistic sample
+    # case (a multi-page appraisal PDF with text-layer and scanned pages, and a
+    # 12 MP property photo) comes from the benchmark corpus generator, which
+    # needs reportlab (a benchmark-only dependency)
+    import sys
+    if len(sys.argv) > 1:
+        report_path = sys.argv[1]
+        photo_path = sys.argv[2] if len(sys.argv) > 2 else None
+    else:
+        try:
+            from benchmarks.corpus import generate_corpus
+        except ImportError as e:
+            sys.exit(f"No report given and the sample case can't be generated ({e}).\n"
+                     "Usage: python main.py REPORT_PDF [PHOTO]  (or pip install reportlab for the sample)")
+        sample_dir = os.path.join(Config.RAW_DATA_DIR, "sample")
+        sample = generate_corpus(sample_dir, cases=1)["cases"][0]
+        report_path = os.path.join(sample_dir, sample["report"])
+        photo_path = os.path.join(sample_dir, sample["photo"])
+
+    # --- IMPORTANT: Train and save a dummy ML model first! ---
+    # Run the ML model training section in ml_risk_model.py once
+    # to generate a dummy model file for this main.py to load.
+    # Otherwise, the ML prediction step will be skipped.
+
+    # Example usage:
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    process_underwriting_case(report_path, photo_path)
+
+    # Benchmarks (per stage and end to end, with regression thresholds):
+    #   python -m benchmarks.run_benchmarks
+    # To process a whole directory of cases in parallel, see batch_runner.py:
+    #   python batch_runner.py --input-dir data/raw_appraisals --workers 8
+    # You could also build a web API with FastAPI to upload documents.
\ No newline at end of file
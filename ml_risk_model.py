@@ -1,110 +1,311 @@
-import pandas as pd
-from sklearn.model_selection import train_test_split
-from sklearn.ensemble import RandomForestClassifier
-from sklearn.metrics import classification_report, accuracy_score
-import joblib # For saving/loading models
-import os
-from config import Config
-
-class MLRiskModel:
-    def __init__(self, model_path=Config.RISK_MODEL_PATH):
-        self.model = None
-        self.model_path = model_path
-        self.feature_columns = None # Store feature names used during training
-
-    def train_model(self, X_train, y_train, feature_names):
-        """
-        Trains a classification model.
-        X_train: DataFrame of features
-        y_train: Series of target labels (e.g., 'Approved', 'Declined', 'High_Risk')
-        feature_names: List of column names used as features
-        """
-        print("Training ML Risk Model...")
-        self.model = RandomForestClassifier(n_estimators=100, random_state=42)
-        self.model.fit(X_train, y_train)
-        self.feature_columns = feature_names
-        print("Model training complete.")
-
-    def evaluate_model(self, X_test, y_test):
-        if self.model is None:
-            print("Model not trained or loaded.")
-            return
-        predictions = self.model.predict(X_test)
-        print("\nML Model Evaluation:")
-        print(classification_report(y_test, predictions))
-        print(f"Accuracy: {accuracy_score(y_test, predictions):.2f}")
-
-    def predict_risk(self, features_dict):
-        if self.model is None:
-            print("Model not trained or loaded. Cannot predict.")
-            return "UNKNOWN_RISK"
-
-        # Convert input features to a DataFrame in the correct order
-        input_df = pd.DataFrame([features_dict])
-        
-        # Ensure all training features are present, fill missing with 0 or mean
-        # This is a critical step for real-world robustness
-        for col in self.feature_columns:
-            if col not in input_df.columns:
-                input_df[col] = 0 # Or a default value based on your data
-
-        # Select and order features correctly
-        input_df = input_df[self.feature_columns]
-
-        prediction = self.model.predict(input_df)[0]
-        probability = self.model.predict_proba(input_df)[0]
-        
-        # Map prediction to a more readable format if needed
-        # (e.g., if '0' is 'Low Risk', '1' is 'High Risk')
-        return {
-            "predicted_label": prediction,
-            "probabilities": dict(zip(self.model.classes_, probability))
-        }
-
-    def save_model(self):
-        if self.model:
-            os.makedirs(os.path.dirname(self.model_path), exist_ok=True)
-            joblib.dump(self.model, self.model_path)
-            print(f"Model saved to {self.model_path}")
-
-    def load_model(self):
-        if os.path.exists(self.model_path):
-            self.model = joblib.load(self.model_path)
-            # In a real model, you'd also save/load self.feature_columns
-            # For this example, assume features are known or derived dynamically
-            print(f"Model loaded from {self.model_path}")
-            return True
-        print(f"No model found at {self.model_path}")
-        return False
-
-# Example Training (You'd do this in a separate notebook or script)
-# from sklearn.preprocessing import LabelEncoder
-#
-# # Dummy Data for demonstration
-# data = {
-#     'text_square_footage': [1500, 2000, 1200, 3000, 1800],
-#     'text_year_built': [1990, 2010, 1960, 2005, 1975],
-#     'text_roof_condition_classified': ['good', 'good', 'poor', 'good', 'fair'],
-#     'image_num_defects': [0, 0, 3, 1, 2],
-#     'multimodal_roof_conflict': [False, False, False, False, True],
-#     'combined_property_condition_score': [4, 4, 1, 3, 2],
-#     'risk_label': ['LOW_RISK', 'LOW_RISK', 'HIGH_RISK', 'MEDIUM_RISK', 'HIGH_RISK']
-# }
-# df = pd.DataFrame(data)
-#
-# # One-hot encode categorical features
-# df = pd.get_dummies(df, columns=['text_roof_condition_classified'], drop_first=True)
-#
-# # Prepare data for ML model
-# X = df.drop('risk_label', axis=1)
-# y = df['risk_label']
-#
-# # Store feature names before splitting to ensure consistency
-# feature_names = X.columns.tolist()
-#
-# X_train_ml, X_test_ml, y_train_ml, y_test_ml = train_test_split(X, y, test_size=0.3, random_state=42)
-#
-# ml_model = MLRiskModel()
-# ml_model.train_model(X_train_ml, y_train_ml, feature_names)
-# ml_model.evaluate_model(X_test_ml, y_test_ml)
-# ml_model.save_model()
\ No newline at end of file
+import numpy as np
+import copy
+import warnings
+import os
+import hashlib
+import pickle
+from datetime import datetime, timezone
+from config import Config
+from feature_record import FeatureBatch, FeatureRecord
+from forest_compiler import CompiledForest
+
+# Bump when the layout of the saved artifact bundle changes
+# (2: the estimator is stored pickled, so loading can leave it unpickled;
+#  3: ... as a uint8 array, so loading memory-maps it rather than reading it)
+MODEL_ARTIFACT_FORMAT_VERSION = 3
+
+class MLRiskModel:
+    def __init__(self, model_path=Config.RISK_MODEL_PATH, n_jobs=None, use_compiled=Config.RISK_MODEL_COMPILED,
+                 compiled_max_batch=Config.RISK_MODEL_COMPILED_MAX_BATCH):
+        self._model = None
+        self._estimator_pickle = None # estimator from the artifact, not unpickled yet (memory-mapped)
+        self._classes = None # its classes_, known without unpickling it
+        self.model_path = model_path
+        self.feature_columns = None # Store feature names used during training
+        self.n_jobs = n_jobs # Forest parallelism for predict_batch (None = estimator's own setting)
+        self.model_version = None
+        self.model_hash = None
+        self.use_compiled = use_compiled # Score tree models with forest_compiler.CompiledForest
+        self.compiled_max_batch = compiled_max_batch # ... for batches up to this many cases
+        self.compiled = None
+        self._compiled_source = None # the estimator self.compiled was built from
+
+    @property
+    def model(self):
+        # Left pickled by load_model when the artifact's compiled forest can do the
+        # scoring, so a scoring process never imports sklearn unless it needs the
+        # estimator itself (batches over compiled_max_batch, use_compiled=False)
+        if self._model is None and self._estimator_pickle is not None:
+            estimator_pickle, self._estimator_pickle = self._estimator_pickle, None # don't keep the bytes around
+            if hashlib.sha256(estimator_pickle).hexdigest() != self.model_hash:
+                raise ValueError(f"Model artifact {self.model_path} estimator doesn't match its hash")
+            self._model = pickle.loads(estimator_pickle)
+            if self.compiled is not None and self._compiled_source is None:
+                self._compiled_source = self._model # the artifact's arrays were compiled from it
+        return self._model
+
+    @model.setter
+    def model(self, estimator):
+        self._model = estimator
+        self._estimator_pickle = None
+        self._classes = None
+
+    @property
+    def has_model(self):
+        return self._model is not None or self._estimator_pickle is not None
+
+    @property
+    def classes(self):
+        return self._classes if self._model is None else self._model.classes_
+
+    def train_model(self, X_train, y_train, feature_names):
+        """
+        Trains a classification model.
+        X_train: DataFrame of features
+        y_train: Series of target labels (e.g., 'Approved', 'Declined', 'High_Risk')
+        feature_names: List of column names used as features
+        """
+        from sklearn.ensemble import RandomForestClassifier # training only; scoring never imports it
+        print("Training ML Risk Model...")
+        self.model = RandomForestClassifier(n_estimators=100, random_state=42)
+        self.model.fit(X_train, y_train)
+        self.feature_columns = feature_names
+        print("Model training complete.")
+
+    def evaluate_model(self, X_test, y_test):
+        if self.model is None:
+            print("Model not trained or loaded.")
+            return
+        from sklearn.metrics import classification_report, accuracy_score
+        predictions = self.model.predict(X_test)
+        print("\nML Model Evaluation:")
+        print(classification_report(y_test, predictions))
+        print(f"Accuracy: {accuracy_score(y_test, predictions):.2f}")
+
+    def _resolve_feature_columns(self):
+        # Models fit on a DataFrame remember their column order
+        if self.feature_columns is None and hasattr(self.model, "feature_names_in_"):
+            self.feature_columns = list(self.model.feature_names_in_)
+        return self.feature_columns
+
+    def features_to_matrix(self, feature_rows):
+        """
+        Packs features into a float64 matrix in feature_columns order.
+        feature_rows: a FeatureBatch, a list of FeatureRecords (both encoded with
+        the schema in feature_record.py), or a list of feature dicts, where
+        missing or None features are 0.
+        """
+        columns = self._resolve_feature_columns()
+        if isinstance(feature_rows, FeatureBatch):
+            return feature_rows.to_ml_matrix(columns)
+        if feature_rows and isinstance(feature_rows[0], FeatureRecord):
+            matrix = np.empty((len(feature_rows), len(columns)), dtype=np.float64)
+            for i, record in enumerate(feature_rows):
+                record.to_ml_row(columns, out=matrix[i])
+            return matrix
+        column_index = {col: j for j, col in enumerate(columns)}
+        matrix = np.zeros((len(feature_rows), len(columns)), dtype=np.float64)
+        for i, row in enumerate(feature_rows):
+            for key, value in row.items():
+                j = column_index.get(key)
+                if j is not None and value is not None:
+                    matrix[i, j] = value
+        return matrix
+
+    def compiled_forest(self):
+        """
+        The flat-array form of the current model, or None when compiled scoring is
+        off or the model isn't a tree classifier (e.g. HistGradientBoosting, SGD).
+        Compiled on first use unless it came with the artifact.
+        """
+        if not self.use_compiled or not self.has_model:
+            return None
+        if self._model is None:
+            return self.compiled # still pickled: the artifact came with its compiled arrays
+        if self._compiled_source is not self.model:
+            self.compiled = CompiledForest.from_estimator(self.model)
+            self._compiled_source = self.model
+        return self.compiled
+
+    def predict_batch(self, X, n_jobs=None):
+        """
+        Scores many cases at once.
+        X: array-like of shape (n_cases, n_features), columns in feature_columns order
+        n_jobs: forest parallelism for this call (defaults to self.n_jobs)
+        Returns (labels, probabilities): labels has shape (n_cases,), probabilities
+        (n_cases, n_classes) with columns in self.classes order.
+
+        Runs a single predict_proba pass; labels are its argmax, which is exactly
+        what RandomForestClassifier.predict computes internally. Forests and
+        batches up to compiled_max_batch cases go through the compiled scorer
+        (same probabilities, bit for bit, as sklearn's; n_jobs doesn't apply).
+        """
+        X = np.asarray(X, dtype=np.float64)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+
+        compiled = self.compiled_forest()
+        if compiled is not None and len(X) <= self.compiled_max_batch:
+            probabilities = compiled.predict_proba(X)
+            return self.classes.take(np.argmax(probabilities, axis=1)), probabilities
+
+        n_jobs = self.n_jobs if n_jobs is None else n_jobs
+        estimator = self.model
+        if n_jobs is not None and getattr(estimator, "n_jobs", n_jobs) != n_jobs:
+            # The model is shared (e.g. by the service's scoring threads), so never set
+            # n_jobs on it: a shallow copy shares the fitted trees and costs microseconds
+            estimator = copy.copy(estimator)
+            estimator.n_jobs = n_jobs
+        with warnings.catch_warnings():
+            # Fit on a DataFrame, scored on a plain matrix in the same column order
+            warnings.filterwarnings("ignore", message="X does not have valid feature names")
+            probabilities = estimator.predict_proba(X)
+
+        labels = self.model.classes_.take(np.argmax(probabilities, axis=1))
+        return labels, probabilities
+
+    def predict_risk(self, features_dict):
+        # features_dict: a FeatureRecord, or a feature dict keyed by model column
+        if not self.has_model:
+            print("Model not trained or loaded. Cannot predict.")
+            return "UNKNOWN_RISK"
+
+        # A single case is a batch of one; thread fan-out would only add overhead here
+        labels, probabilities = self.predict_batch(self.features_to_matrix([features_dict]), n_jobs=1)
+
+        # Map prediction to a more readable format if needed
+        # (e.g., if '0' is 'Low Risk', '1' is 'High Risk')
+        return {
+            "predicted_label": labels[0],
+            "probabilities": dict(zip(self.classes, probabilities[0]))
+        }
+
+    def save_model(self, model_version=None, training_info=None):
+        """
+        Saves a versioned artifact bundle: the (pickled) estimator together with its ordered
+        feature schema, class labels, a version string and a content hash, so a
+        loaded model always knows exactly which columns it expects.
+        training_info (e.g. the train_pipeline report) is stored alongside, and
+        for forests the compiled flat arrays (forest_compiler.py).
+        Stored uncompressed so load_model can memory-map its arrays, the
+        estimator's pickle included (as a uint8 array).
+        """
+        if self.model:
+            os.makedirs(os.path.dirname(self.model_path), exist_ok=True)
+            estimator_pickle = pickle.dumps(self.model, protocol=pickle.HIGHEST_PROTOCOL)
+            self.model_hash = hashlib.sha256(estimator_pickle).hexdigest()
+            self.model_version = model_version or datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+            compiled = CompiledForest.from_estimator(self.model)
+            bundle = {
+                "format_version": MODEL_ARTIFACT_FORMAT_VERSION,
+                "estimator_pickle": np.frombuffer(estimator_pickle, dtype=np.uint8),
+                "feature_columns": list(self._resolve_feature_columns() or []),
+                "classes": self.model.classes_,
+                "model_version": self.model_version,
+                "model_hash": self.model_hash,
+                "training_info": training_info,
+                "compiled_forest": compiled.to_arrays() if compiled is not None else None,
+            }
+            import joblib
+            joblib.dump(bundle, self.model_path)
+            print(f"Model saved to {self.model_path} (version {self.model_version}, hash {self.model_hash[:12]})")
+
+    def load_model(self, mmap_mode=Config.RISK_MODEL_MMAP_MODE):
+        """
+        Loads an artifact bundle written by save_model (or a legacy bare estimator).
+
+        With mmap_mode="r" joblib maps the numpy arrays stored in the file
+        read-only instead of reading them into private memory, so every worker
+        process that loads the same file shares those pages through the OS page
+        cache. sklearn's tree objects copy their node arrays into their own
+        buffers when unpickled, but the compiled forest arrays saved with the
+        bundle are used as mapped, so workers scoring with them share one copy.
+
+        When the bundle has compiled arrays (and use_compiled is on) the
+        estimator stays pickled until something asks for self.model, so loading
+        a forest for scoring doesn't import sklearn at all, and its pickle stays
+        in the mapped file: no page of it is read (or hashed) until then.
+        """
+        if os.path.exists(self.model_path):
+            import joblib
+            artifact = joblib.load(self.model_path, mmap_mode=mmap_mode)
+            self.compiled, self._compiled_source = None, None
+            if isinstance(artifact, dict) and "format_version" in artifact:
+                if artifact["format_version"] > MODEL_ARTIFACT_FORMAT_VERSION:
+                    print(f"Model artifact {self.model_path} has unsupported format version {artifact['format_version']}")
+                    return False
+                self.feature_columns = artifact["feature_columns"] or None
+                self.model_version = artifact["model_version"]
+                self.model_hash = artifact["model_hash"]
+                if "estimator_pickle" in artifact:
+                    self.model = None
+                    self._estimator_pickle = artifact["estimator_pickle"] # checked against model_hash when unpickled
+                    self._classes = np.asarray(artifact["classes"])
+                else: # format 1: the estimator itself
+                    self.model = artifact["estimator"]
+                    if list(self.model.classes_) != list(artifact["classes"]):
+                        print(f"Model artifact {self.model_path} class labels don't match its estimator")
+                        return False
+                arrays = artifact.get("compiled_forest")
+                if arrays is not None and self.use_compiled:
+                    self.compiled = CompiledForest.from_arrays(arrays) # None for an older layout: recompiled on use
+                if self.compiled is not None:
+                    self._compiled_source = self._model # None while pickled; set when it's unpickled
+                else:
+                    try:
+                        self.model # nothing to score with but the estimator: unpickle it now
+                    except ValueError as e:
+                        print(e)
+                        return False
+            else:
+                # Legacy artifact: just the estimator
+                self.model = artifact
+                self.feature_columns = None
+                self.model_version = "legacy"
+                with open(self.model_path, "rb") as f:
+                    self.model_hash = hashlib.sha256(f.read()).hexdigest()
+                self._resolve_feature_columns()
+            self.compiled_forest() # compile now (if the artifact had no arrays) rather than on the first case
+            print(f"Model loaded from {self.model_path} (version {self.model_version})")
+            return True
+        print(f"No model found at {self.model_path}")
+        return False
+
+# Example Training (You'd do this in a separate notebook or script)
+# import pandas as pd
+# from sklearn.model_selection import train_test_split
+# from sklearn.preprocessing import LabelEncoder
+#
+# # Dummy Data for demonstration
+# data = {
+#     'text_square_footage': [1500, 2000, 1200, 3000, 1800],
+#     'text_year_built': [1990, 2010, 1960, 2005, 1975],
+#     'text_roof_condition_classified': ['good', 'good', 'poor', 'good', 'fair'],
+#     'image_num_defects': [0, 0, 3, 1, 2],
+#     'multimodal_roof_conflict': [False, False, False, False, True],
+#     'combined_property_condition_score': [4, 4, 1, 3, 2],
+#     'risk_label': ['LOW_RISK', 'LOW_RISK', 'HIGH_RISK', 'MEDIUM_RISK', 'HIGH_RISK']
+# }
+# df = pd.DataFrame(data)
+#
+# from feature_record import FeatureBatch, ML_FEATURE_COLUMNS
+#
+# # Encode with the same schema the pipeline scores with (feature_record.py), so
+# # training and serving can't disagree on parsing or one-hot columns
+# feature_names = [c for c in ML_FEATURE_COLUMNS if not c.endswith("_fair")] # e.g. drop one category
+# X = FeatureBatch.from_columns(df).to_ml_frame(feature_names)
+# y = df['risk_label']
+#
+# X_train_ml, X_test_ml, y_train_ml, y_test_ml = train_test_split(X, y, test_size=0.3, random_state=42)
+#
+# ml_model = MLRiskModel()
+# ml_model.train_model(X_train_ml, y_train_ml, feature_names)
+# ml_model.evaluate_model(X_test_ml, y_test_ml)
+# ml_model.save_model(model_version="2024.1")
+#
+# # Training on the whole book from the feature store (streamed, parallel): see train_pipeline.py
+#
+# # Batch scoring: one predict_proba pass over many cases
+# labels, probabilities = ml_model.predict_batch(X_test_ml.to_numpy(), n_jobs=-1)
+# # Single cases and small batches run on the compiled forest (forest_compiler.py)
+# # stored in the artifact; MLRiskModel(use_compiled=False) always uses sklearn
\ No newline at end of file
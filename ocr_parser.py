@@ -1,40 +1,375 @@
-import pdfplumber
-from PIL import Image
-import pytesseract
-import io
-
-class OCRParser:
-    def __init__(self, tesseract_cmd_path=None):
-        if tesseract_cmd_path:
-            pytesseract.pytesseract.tesseract_cmd = tesseract_cmd_path
-
-    def extract_text_from_pdf(self, pdf_path):
-        text = ""
-        images = []
-        try:
-            with pdfplumber.open(pdf_path) as pdf:
-                for page in pdf.pages:
-                    text += page.extract_text() + "\n"
-                    # Extract images if present
-                    for img in page.images:
-                        if 'stream' in img:
-                            image = Image.open(io.BytesIO(img['stream'].get_data()))
-                            images.append(image)
-        except Exception as e:
-            print(f"Error extracting text/images from PDF {pdf_path}: {e}")
-        return text, images
-
-    def extract_text_from_image(self, image_path):
-        try:
-            image = Image.open(image_path)
-            text = pytesseract.image_to_string(image)
-            return text
-        except Exception as e:
-            print(f"Error extracting text from image {image_path}: {e}")
-            return ""
-
-# Example Usage:
-# from config import Config
-# ocr_parser = OCRParser(Config.TESSERACT_CMD)
-# text, images = ocr_parser.extract_text_from_pdf("data/raw_appraisals/sample_report.pdf")
-# print("Extracted Text:", text[:200])
\ No newline at end of file
+from PIL import Image
+import io
+import os
+import hashlib
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from config import Config
+
+# pdfplumber/pdfminer and pytesseract are imported where they're used, so
+# importing this module (e.g. via main) costs nothing in processes that never
+# open a PDF; batch_runner.preload_worker_state imports them ahead of forking.
+
+# Bump when rasterization/OCR settings change in a way that should invalidate cached pages
+OCR_CACHE_VERSION = "1"
+
+class LazyPDFImage:
+    """
+    Handle to an image embedded in a PDF page. Nothing is decoded until load()
+    is called, so images nobody looks at never cost a PIL decode.
+
+    Handles of images that may be photos keep a reference to the (still encoded)
+    image stream until load() reads it; otherwise, e.g. for logos and banners,
+    after pickling to another process or when created by a parallel worker,
+    load() re-opens the PDF and reads just that page. size is the image's
+    (width, height) from the PDF, known without decoding anything.
+    """
+    size = None # for handles pickled into the stage cache before sizes were recorded
+
+    def __init__(self, pdf_path, page_number, index, stream=None, size=None):
+        self.pdf_path = pdf_path
+        self.page_number = page_number # 1-based, like pdfplumber's page.page_number
+        self.index = index
+        self.size = size
+        self._stream = stream
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_stream"] = None # pdfminer stream objects are tied to the open file
+        return state
+
+    def for_path(self, pdf_path):
+        """The same image in a copy of the PDF at pdf_path (e.g. a handle restored from the stage cache)."""
+        return LazyPDFImage(pdf_path, self.page_number, self.index, self._stream if pdf_path == self.pdf_path else None,
+                            self.size)
+
+    def __repr__(self):
+        return f"LazyPDFImage({self.pdf_path!r}, page={self.page_number}, index={self.index})"
+
+    def load(self):
+        stream = self._stream
+        if stream is None:
+            import pdfplumber
+            with pdfplumber.open(self.pdf_path) as pdf:
+                img = pdf.pages[self.page_number - 1].images[self.index]
+                return Image.open(io.BytesIO(img['stream'].get_data()))
+        self._stream = None # the image stage reads each handle once; don't hold the encoded bytes after
+        return Image.open(io.BytesIO(stream.get_data()))
+
+def _image_size(img):
+    size = img.get('srcsize')
+    return (int(size[0]), int(size[1])) if size else None
+
+def _may_be_photo(size):
+    # The size checks of image_analyzer.triage_reason: logos, signatures and banner
+    # strips never reach the image stage, so there's no point holding their streams
+    if size is None or not Config.IMAGE_TRIAGE_ENABLED:
+        return True
+    width, height = size
+    return min(width, height) >= Config.IMAGE_MIN_PHOTO_SIDE and max(width, height) <= Config.IMAGE_MAX_ASPECT_RATIO * min(width, height)
+
+def _page_image_handles(pdf_path, page, keep_stream):
+    handles = []
+    for i, img in enumerate(page.images):
+        if 'stream' in img:
+            size = _image_size(img)
+            stream = img['stream'] if keep_stream and _may_be_photo(size) else None
+            handles.append(LazyPDFImage(pdf_path, page.page_number, i, stream, size))
+    return handles
+
+def _release_page(page):
+    # pdfplumber caches parsed layout objects on each page; drop them once the
+    # page is done so memory stays flat no matter how long the packet is.
+    if hasattr(page, "close"):
+        page.close()
+    elif hasattr(page, "flush_cache"):
+        page.flush_cache()
+
+def _extract_page_range(pdf_path, page_indexes):
+    # Runs in a worker process: opens its own handle to the PDF and returns
+    # (page_number, text, image handles) for each requested page.
+    import pdfplumber
+    results = []
+    with pdfplumber.open(pdf_path) as pdf:
+        for i in page_indexes:
+            page = pdf.pages[i]
+            results.append((page.page_number, page.extract_text() or "", _page_image_handles(pdf_path, page, False)))
+            _release_page(page)
+    return results
+
+def _stream_bytes(stream):
+    from pdfminer.pdftypes import resolve1
+    stream = resolve1(stream)
+    if hasattr(stream, "get_rawdata"):
+        return stream.get_rawdata() or b""
+    return stream.get_data()
+
+def _page_content_hash(page):
+    """
+    Hash of what a page draws: its content streams plus the raw (encoded) bytes
+    of every image on it. Unchanged pages in an amended packet hash the same even
+    when other pages were added, removed or edited.
+    """
+    from pdfminer.pdftypes import resolve1
+    digest = hashlib.sha256()
+    contents = resolve1(getattr(page.page_obj, "contents", None)) or []
+    if not isinstance(contents, list):
+        contents = [contents]
+    for stream in contents:
+        digest.update(_stream_bytes(stream))
+    for img in page.images:
+        if 'stream' in img:
+            digest.update(_stream_bytes(img['stream']))
+    return digest.hexdigest()
+
+def _ocr_pdf_page(pdf_path, page_index, dpi, lang, tesseract_cmd):
+    # Runs in an OCR worker process: rasterize a single page and OCR it
+    import pdfplumber
+    import pytesseract
+    if tesseract_cmd:
+        pytesseract.pytesseract.tesseract_cmd = tesseract_cmd
+    with pdfplumber.open(pdf_path) as pdf:
+        image = pdf.pages[page_index].to_image(resolution=dpi).original
+    return pytesseract.image_to_string(image, lang=lang)
+
+class OCRPageCache:
+    """
+    On-disk OCR text cache keyed by content hash: <cache_dir>/<key[:2]>/<key>.txt
+    """
+    def __init__(self, cache_dir=Config.OCR_CACHE_DIR):
+        self.cache_dir = cache_dir
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key + ".txt")
+
+    def get(self, key):
+        try:
+            with open(self._path(key), encoding="utf-8") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def put(self, key, text):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp_path, path) # atomic, so concurrent workers never read half a file
+
+def _new_stats():
+    return {"pages": 0, "ocr_pages": 0, "cache_hits": 0, "ocr_failed_pages": 0, "ocr_errors": [], "error": None}
+
+class OCRParser:
+    def __init__(self, tesseract_cmd_path=None, ocr_workers=Config.OCR_MAX_WORKERS,
+                 cache_dir=Config.OCR_CACHE_DIR, dpi=Config.OCR_RASTER_DPI, lang=Config.OCR_LANG,
+                 min_text_chars=Config.OCR_MIN_TEXT_CHARS):
+        self.tesseract_cmd = tesseract_cmd_path # set on pytesseract when OCR first runs
+        self.ocr_workers = ocr_workers
+        self.cache = OCRPageCache(cache_dir) if cache_dir else None
+        self.dpi = dpi
+        self.lang = lang
+        self.min_text_chars = min_text_chars
+        self.last_ocr_stats = _new_stats()
+        self._ocr_pool = None
+
+    @property
+    def version(self):
+        # Everything that changes what extract_text_from_pdf returns for the same file
+        return f"{OCR_CACHE_VERSION}:dpi={self.dpi}:lang={self.lang}:min_chars={self.min_text_chars}"
+
+    def close(self):
+        if self._ocr_pool is not None:
+            self._ocr_pool.shutdown()
+            self._ocr_pool = None
+
+    def _cache_key(self, content_hash):
+        return hashlib.sha256(f"{content_hash}|dpi={self.dpi}|lang={self.lang}|v={OCR_CACHE_VERSION}".encode()).hexdigest()
+
+    def has_text_layer(self, text):
+        return len("".join(text.split())) >= self.min_text_chars
+
+    def _submit_ocr(self, pdf_path, page_index):
+        if self.ocr_workers and self.ocr_workers > 1:
+            if self._ocr_pool is None:
+                # Kept for the parser's lifetime so the workers' Tesseract setup is paid once
+                self._ocr_pool = ProcessPoolExecutor(max_workers=self.ocr_workers)
+            return self._ocr_pool.submit(_ocr_pdf_page, pdf_path, page_index, self.dpi, self.lang, self.tesseract_cmd)
+        return _ocr_pdf_page(pdf_path, page_index, self.dpi, self.lang, self.tesseract_cmd)
+
+    def iter_pdf_pages_hybrid(self, pdf_path):
+        """
+        Like iter_pdf_pages, but pages without a usable text layer are rasterized
+        and OCR'd with Tesseract in the OCR process pool. OCR results are cached on
+        disk by page content hash, so resubmitted or amended packets only OCR pages
+        that actually changed. Pages are still yielded in order; at most
+        ocr_workers * 2 pages wait on OCR at a time.
+
+        A page whose OCR fails (Tesseract missing or crashing) falls back to its
+        own text layer, however thin, and the rest of the document carries on;
+        last_ocr_stats counts it in ocr_failed_pages, with the reason in ocr_errors.
+        """
+        stats = _new_stats()
+        self.last_ocr_stats = stats
+        max_waiting = max(1, (self.ocr_workers or 1) * 2)
+        waiting = deque() # (page_number, text or Future, images, cache key, text layer)
+
+        def ready(entry):
+            return isinstance(entry[1], str) or entry[1].done()
+
+        def ocr_failed(page_number, layer_text, error):
+            print(f"OCR failed on page {page_number} of {pdf_path}: {type(error).__name__}: {error}")
+            stats["ocr_failed_pages"] += 1
+            stats["ocr_errors"].append(f"page {page_number}: {type(error).__name__}: {error}")
+            if isinstance(error, BrokenProcessPool) and self._ocr_pool is not None:
+                self._ocr_pool.shutdown(wait=False) # a worker died; the next page gets a new pool
+                self._ocr_pool = None
+            return layer_text
+
+        def finish(entry):
+            page_number, result, images, key, layer_text = entry
+            if isinstance(result, str):
+                return page_number, result, images
+            try:
+                text = result.result()
+            except Exception as e:
+                return page_number, ocr_failed(page_number, layer_text, e), images
+            if key is not None and self.cache is not None:
+                self.cache.put(key, text)
+            return page_number, text, images
+
+        import pdfplumber
+        with pdfplumber.open(pdf_path) as pdf:
+            for page_index, page in enumerate(pdf.pages):
+                stats["pages"] += 1
+                text = page.extract_text() or ""
+                images = _page_image_handles(pdf_path, page, True)
+                entry = (page.page_number, text, images, None, text)
+                if not self.has_text_layer(text):
+                    key = self._cache_key(_page_content_hash(page))
+                    cached = self.cache.get(key) if self.cache is not None else None
+                    if cached is not None:
+                        stats["cache_hits"] += 1
+                        entry = (page.page_number, cached, images, None, text)
+                    else:
+                        stats["ocr_pages"] += 1
+                        try:
+                            result = self._submit_ocr(pdf_path, page_index) # inline (a str) with one OCR worker
+                            entry = (page.page_number, result, images, key, text)
+                            if isinstance(result, str) and self.cache is not None:
+                                self.cache.put(key, result)
+                        except Exception as e:
+                            entry = (page.page_number, ocr_failed(page.page_number, text, e), images, None, text)
+                _release_page(page)
+                waiting.append(entry)
+
+                while waiting and (len(waiting) > max_waiting or ready(waiting[0])):
+                    yield finish(waiting.popleft())
+            while waiting:
+                yield finish(waiting.popleft())
+
+    def iter_pdf_pages(self, pdf_path, max_workers=1, pages_per_task=8):
+        """
+        Yields (page_number, text, images) one page at a time, in page order.
+        images is a list of LazyPDFImage handles; call .load() to decode one.
+
+        With max_workers > 1 pages are extracted in parallel processes, in chunks of
+        pages_per_task, with at most max_workers * 2 chunks in flight at once.
+        """
+        if max_workers and max_workers > 1:
+            yield from self._iter_pdf_pages_parallel(pdf_path, max_workers, pages_per_task)
+            return
+
+        import pdfplumber
+        with pdfplumber.open(pdf_path) as pdf:
+            for page in pdf.pages:
+                yield page.page_number, page.extract_text() or "", _page_image_handles(pdf_path, page, True)
+                _release_page(page)
+
+    def _iter_pdf_pages_parallel(self, pdf_path, max_workers, pages_per_task):
+        import pdfplumber
+        with pdfplumber.open(pdf_path) as pdf:
+            page_count = len(pdf.pages)
+        chunks = [range(start, min(start + pages_per_task, page_count))
+                  for start in range(0, page_count, pages_per_task)]
+
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            in_flight = []
+            next_chunk = 0
+            while next_chunk < len(chunks) or in_flight:
+                while next_chunk < len(chunks) and len(in_flight) < max_workers * 2:
+                    in_flight.append(pool.submit(_extract_page_range, pdf_path, list(chunks[next_chunk])))
+                    next_chunk += 1
+                # Chunks are consumed in submission order so pages come out in order
+                yield from in_flight.pop(0).result()
+
+    def extract_text_from_pdf(self, pdf_path, max_workers=1, lazy_images=False, ocr_fallback=False):
+        """
+        Returns (text, images) for the whole PDF. images are PIL images, or
+        LazyPDFImage handles when lazy_images=True. With ocr_fallback=True,
+        scanned pages are OCR'd (see iter_pdf_pages_hybrid).
+
+        A page whose OCR fails keeps its text layer and extraction goes on
+        (last_ocr_stats["ocr_failed_pages"] / ["ocr_errors"]). Any other error
+        part-way (e.g. an unreadable PDF) is printed and whatever was extracted
+        before it is returned, with last_ocr_stats["error"] saying what went
+        wrong. Either way the text is incomplete: callers shouldn't cache it,
+        and should flag the case as degraded.
+        """
+        text_parts = []
+        images = []
+        if ocr_fallback:
+            pages = self.iter_pdf_pages_hybrid(pdf_path)
+        else:
+            self.last_ocr_stats = _new_stats()
+            pages = self.iter_pdf_pages(pdf_path, max_workers=max_workers)
+        try:
+            for _, page_text, page_images in pages:
+                if not ocr_fallback:
+                    self.last_ocr_stats["pages"] += 1
+                text_parts.append(page_text)
+                if lazy_images:
+                    images.extend(page_images)
+                else:
+                    images.extend(handle.load() for handle in page_images)
+        except Exception as e:
+            print(f"Error extracting text/images from PDF {pdf_path}: {e}")
+            self.last_ocr_stats["error"] = f"{type(e).__name__}: {e}"
+        text = "\n".join(text_parts) + "\n" if text_parts else ""
+        return text, images
+
+    def extract_text_from_image(self, image_path):
+        try:
+            key = None
+            if self.cache is not None:
+                with open(image_path, "rb") as f:
+                    key = self._cache_key(hashlib.sha256(f.read()).hexdigest())
+                cached = self.cache.get(key)
+                if cached is not None:
+                    return cached
+            import pytesseract
+            if self.tesseract_cmd:
+                pytesseract.pytesseract.tesseract_cmd = self.tesseract_cmd
+            image = Image.open(image_path)
+            text = pytesseract.image_to_string(image, lang=self.lang)
+            if key is not None:
+                self.cache.put(key, text)
+            return text
+        except Exception as e:
+            print(f"Error extracting text from image {image_path}: {e}")
+            return ""
+
+# Example Usage:
+# from config import Config
+# ocr_parser = OCRParser(Config.TESSERACT_CMD)
+# text, images = ocr_parser.extract_text_from_pdf("data/raw_appraisals/sample_report.pdf")
+# print("Extracted Text:", text[:200])
+#
+# # Hybrid mode: scanned pages are OCR'd in a process pool and cached by content hash
+# text, images = ocr_parser.extract_text_from_pdf("data/raw_appraisals/sample_report.pdf", ocr_fallback=True)
+# print("OCR stats:", ocr_parser.last_ocr_stats)
+#
+# # Streaming, 4 worker processes, images decoded only on demand:
+# for page_number, page_text, page_images in ocr_parser.iter_pdf_pages("data/raw_appraisals/sample_report.pdf", max_workers=4):
+#     print(page_number, len(page_text), len(page_images))
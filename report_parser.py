@@ -1,45 +1,275 @@
-import re
-import pandas as pd
-
-class ReportParser:
-    def __init__(self):
-        # Define regex patterns for common appraisal fields
-        self.patterns = {
-            "property_address": r"(?i)property\s+address[:\s]*(.*?)(?:\n|$)",
-            "property_type": r"(?i)property\s+type[:\s]*(.*?)(?:\n|$)",
-            "square_footage": r"(?i)(?:total|gross)\s+living\s+area[:\s]*([\d,\.]+)\s*(?:sq\s*ft|sf|sq\.ft\.)",
-            "year_built": r"(?i)year\s+built[:\s]*(\d{4})",
-            "roof_condition_text": r"(?i)roof\s+condition[:\s]*(.*?)(?:\n|$)",
-            "foundation_condition_text": r"(?i)foundation\s+condition[:\s]*(.*?)(?:\n|$)"
-        }
-
-    def parse_text(self, text):
-        extracted_data = {}
-        for key, pattern in self.patterns.items():
-            match = re.search(pattern, text, re.IGNORECASE)
-            if match:
-                extracted_data[key] = match.group(1).strip()
-            else:
-                extracted_data[key] = None
-        
-        # Example: Simple classification based on keywords
-        roof_condition = extracted_data.get("roof_condition_text", "").lower()
-        if "good" in roof_condition or "new" in roof_condition:
-            extracted_data["roof_condition_classified"] = "good"
-        elif "fair" in roof_condition or "average" in roof_condition:
-            extracted_data["roof_condition_classified"] = "fair"
-        elif "poor" in roof_condition or "damaged" in roof_condition or "leaking" in roof_condition:
-            extracted_data["roof_condition_classified"] = "poor"
-        else:
-            extracted_data["roof_condition_classified"] = "unknown"
-
-        foundation_condition = extracted_data.get("foundation_condition_text", "").lower()
-        extracted_data["foundation_cracks_detected"] = "yes" if "crack" in foundation_condition else "no"
-
-        return extracted_data
-
-# Example Usage:
-# parser = ReportParser()
-# sample_text = "Property Address: 123 Main St, Anytown. Year Built: 1980. Roof Condition: Fair, some wear. Foundation Condition: Solid."
-# parsed_info = parser.parse_text(sample_text)
-# print("Parsed Info:", parsed_info)
\ No newline at end of file
+import re
+import hashlib
+
+# Leading literal of a label: "property\s+address" -> property, "(?:total|gross)\s+..." -> total, gross
+_LEADING_WORD = re.compile(r"[A-Za-z0-9]+")
+_LEADING_GROUP = re.compile(r"\(\?:([A-Za-z0-9]+(?:\|[A-Za-z0-9]+)*)\)")
+_OPTIONAL_QUANTIFIERS = ("?", "*", "{")
+
+def _has_top_level_alternation(pattern):
+    # "total|gross living area" is two patterns, not one starting with "total"
+    depth = 0
+    i = 0
+    while i < len(pattern):
+        ch = pattern[i]
+        if ch == "\\":
+            i += 1 # skip the escaped character
+        elif ch == "[":
+            # Skip the character class; a leading ^ or ] is part of it
+            i += 1
+            if i < len(pattern) and pattern[i] == "^":
+                i += 1
+            if i < len(pattern) and pattern[i] == "]":
+                i += 1
+            while i < len(pattern) and pattern[i] != "]":
+                i += 2 if pattern[i] == "\\" else 1
+        elif ch == "(":
+            depth += 1
+        elif ch == ")":
+            depth -= 1
+        elif ch == "|" and depth == 0:
+            return True
+        i += 1
+    return False
+
+def _label_keywords(label):
+    """
+    Lower-cased literal word(s) every match of label must start with, or None
+    when the label doesn't begin with a plain literal (such fields are searched
+    individually instead).
+    """
+    m = _LEADING_WORD.match(label)
+    if m:
+        word = m.group(0)
+        if label[m.end():m.end() + 1] in _OPTIONAL_QUANTIFIERS:
+            word = word[:-1] # "roofs?" only guarantees "roof"
+        return [word.lower()] if word else None
+    m = _LEADING_GROUP.match(label)
+    if m and label[m.end():m.end() + 1] not in _OPTIONAL_QUANTIFIERS:
+        return [word.lower() for word in m.group(1).split("|")]
+    return None
+
+def _value(match):
+    # A value group in an alternative or optional part may not take part in the match
+    if match is None or match.group(1) is None:
+        return None
+    return match.group(1).strip()
+
+def _trie_pattern(words):
+    # "year|years|yield" -> "y(?:ear(?:s)?|ield)": Python's re tries alternation
+    # branches one by one, so factoring shared prefixes keeps the scan cheap
+    # even with hundreds of keywords. Longer keywords are preferred at a position.
+    trie = {}
+    for word in words:
+        node = trie
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[""] = {}
+
+    def build(node):
+        branches = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        return f"(?:{body})?" if "" in node else body
+
+    return build(trie)
+
+class CompiledFieldExtractor:
+    """
+    Finds every registered field in a single scan of the document.
+
+    Each label starts with a literal keyword ("property", "year", ...). All
+    keywords are compiled into one prefix-factored pattern that is scanned once
+    over the lower-cased document; at each keyword hit only the fields starting
+    with that keyword are tried, using their precompiled label+value pattern
+    anchored at the hit. A field keeps its first (leftmost) match, i.e. exactly
+    what a separate re.search per field returns, but the document is scanned once
+    regardless of how many fields are registered, and the scan stops as soon as
+    every field has been found.
+    """
+    def __init__(self, fields):
+        self.names = [name for name, _, _, _ in fields]
+        self.patterns = []
+        self._fallback_fields = [] # labels without a literal keyword: plain re.search
+        fields_by_keyword = {}
+        for i, (name, label, value, flags) in enumerate(fields):
+            if re.compile(label, flags).groups:
+                raise ValueError(f"Label pattern for field '{name}' must not contain capture groups; use (?:...)")
+            pattern = re.compile(label + value, flags)
+            if pattern.groups != 1:
+                raise ValueError(f"Value pattern for field '{name}' must contain exactly one capture group")
+            self.patterns.append(pattern)
+            # A top-level | splits label + value into whole alternatives, any of
+            # which may match on its own, so no single keyword covers them
+            keywords = None if _has_top_level_alternation(label + value) else _label_keywords(label)
+            if keywords is None:
+                self._fallback_fields.append(i)
+                continue
+            for keyword in keywords:
+                fields_by_keyword.setdefault(keyword, []).append(i)
+
+        # A hit on "years" must also try fields keyed on "year"
+        self._candidates = {
+            keyword: sorted({i for other, ids in fields_by_keyword.items() if keyword.startswith(other) for i in ids})
+            for keyword in fields_by_keyword
+        }
+        # Zero-width so overlapping keywords ("total" inside "subtotal") are all seen
+        self.keyword_pattern = re.compile(f"(?=({_trie_pattern(fields_by_keyword)}))") if fields_by_keyword else None
+
+    def extract(self, text):
+        found = [None] * len(self.names)
+        done = [False] * len(self.names) # matched, even if the value group didn't take part
+        for i in self._fallback_fields:
+            found[i] = _value(self.patterns[i].search(text))
+        remaining = len(self.names) - len(self._fallback_fields)
+
+        if self.keyword_pattern is not None and remaining:
+            lowered = text.lower()
+            if len(lowered) != len(text):
+                # A few non-ASCII characters change length when lower-cased; keep offsets aligned
+                lowered = "".join(ch.lower() if len(ch.lower()) == 1 else ch for ch in text)
+            for hit in self.keyword_pattern.finditer(lowered):
+                position = hit.start()
+                for i in self._candidates[hit.group(1)]:
+                    if done[i]:
+                        continue
+                    match = self.patterns[i].match(text, position)
+                    if match:
+                        found[i] = _value(match)
+                        done[i] = True
+                        remaining -= 1
+                if not remaining:
+                    break
+        return dict(zip(self.names, found))
+
+class FieldRegistry:
+    """
+    Ordered set of extractable fields. Each field is a label pattern (no capture
+    groups) followed by a value pattern with exactly one capture group; both are
+    matched with the given flags (case-insensitive by default).
+    """
+    def __init__(self):
+        self._fields = {}
+        self.revision = 0
+
+    def register(self, name, label, value, flags=re.IGNORECASE):
+        self._fields[name] = (label, value, flags)
+        self.revision += 1
+
+    def unregister(self, name):
+        del self._fields[name]
+        self.revision += 1
+
+    def names(self):
+        return list(self._fields)
+
+    def patterns(self):
+        # Equivalent standalone pattern per field (label immediately followed by value)
+        return {name: label + value for name, (label, value, _) in self._fields.items()}
+
+    def fingerprint(self):
+        digest = hashlib.sha256()
+        for name, (label, value, flags) in self._fields.items():
+            digest.update(f"{name}\0{label}\0{value}\0{int(flags)}\n".encode())
+        return digest.hexdigest()[:16]
+
+    def compile(self):
+        return CompiledFieldExtractor([(name, label, value, flags) for name, (label, value, flags) in self._fields.items()])
+
+def default_field_registry():
+    registry = FieldRegistry()
+    # Define regex patterns for common appraisal fields
+    registry.register("property_address", r"property\s+address", r"[:\s]*(.*?)(?:\n|$)")
+    registry.register("property_type", r"property\s+type", r"[:\s]*(.*?)(?:\n|$)")
+    registry.register("square_footage", r"(?:total|gross)\s+living\s+area", r"[:\s]*([\d,\.]+)\s*(?:sq\s*ft|sf|sq\.ft\.)")
+    registry.register("year_built", r"year\s+built", r"[:\s]*(\d{4})")
+    registry.register("roof_condition_text", r"roof\s+condition", r"[:\s]*(.*?)(?:\n|$)")
+    registry.register("foundation_condition_text", r"foundation\s+condition", r"[:\s]*(.*?)(?:\n|$)")
+    registry.register("flood_zone_text", r"flood\s+zone", r"[:\s]*(.*?)(?:\n|$)")
+    return registry
+
+# FEMA flood zone designations: A*/V* are Special Flood Hazard Areas (high risk),
+# B and shaded X are moderate, C and unshaded X are minimal
+_FLOOD_ZONE_HIGH = re.compile(r"\b(?:a|ae|ah|ao|ar|a99|a\d{1,2}|v|ve|v\d{1,2})\b")
+_FLOOD_ZONE_MEDIUM = re.compile(r"\b(?:b|x500)\b")
+_FLOOD_ZONE_LOW = re.compile(r"\b(?:c|x)\b")
+
+def classify_flood_zone(flood_zone_text):
+    text = (flood_zone_text or "").lower()
+    if "high" in text:
+        return "high"
+    if "moderate" in text or "medium" in text or ("shaded" in text and "unshaded" not in text):
+        return "medium"
+    if "minimal" in text or "low" in text:
+        return "low"
+    zone = re.sub(r"^(?:fema\s+)?(?:zone\s+)?", "", text.strip())
+    if _FLOOD_ZONE_HIGH.match(zone):
+        return "high"
+    if _FLOOD_ZONE_MEDIUM.match(zone):
+        return "medium"
+    if _FLOOD_ZONE_LOW.match(zone):
+        return "low"
+    return "unknown"
+
+PARSER_VERSION = "2"
+
+class ReportParser:
+    def __init__(self, registry=None):
+        self.registry = registry or default_field_registry()
+        self._extractor = None
+        self._extractor_revision = None
+
+    @property
+    def patterns(self):
+        return self.registry.patterns()
+
+    @property
+    def version(self):
+        # Bump PARSER_VERSION when the classification logic in parse_text changes
+        return f"{PARSER_VERSION}:{self.registry.fingerprint()}"
+
+    def register_field(self, name, label, value, flags=re.IGNORECASE):
+        self.registry.register(name, label, value, flags)
+
+    def _get_extractor(self):
+        # Compiled once and reused for every document until the registry changes
+        if self._extractor is None or self._extractor_revision != self.registry.revision:
+            self._extractor = self.registry.compile()
+            self._extractor_revision = self.registry.revision
+        return self._extractor
+
+    def parse_text(self, text):
+        extracted_data = self._get_extractor().extract(text)
+
+        # Example: Simple classification based on keywords
+        roof_condition = (extracted_data.get("roof_condition_text") or "").lower()
+        if "good" in roof_condition or "new" in roof_condition:
+            extracted_data["roof_condition_classified"] = "good"
+        elif "fair" in roof_condition or "average" in roof_condition:
+            extracted_data["roof_condition_classified"] = "fair"
+        elif "poor" in roof_condition or "damaged" in roof_condition or "leaking" in roof_condition:
+            extracted_data["roof_condition_classified"] = "poor"
+        else:
+            extracted_data["roof_condition_classified"] = "unknown"
+
+        # No foundation text: leave it unknown rather than claim "no" cracks
+        foundation_condition = (extracted_data.get("foundation_condition_text") or "").lower()
+        if foundation_condition.strip():
+            extracted_data["foundation_cracks_detected"] = "yes" if "crack" in foundation_condition else "no"
+        else:
+            extracted_data["foundation_cracks_detected"] = None
+
+        # high / medium / low / unknown, as used by the flood_zone underwriting rule
+        extracted_data["flood_zone"] = classify_flood_zone(extracted_data.get("flood_zone_text"))
+
+        return extracted_data
+
+# Example Usage:
+# parser = ReportParser()
+# sample_text = "Property Address: 123 Main St, Anytown. Year Built: 1980. Roof Condition: Fair, some wear. Foundation Condition: Solid."
+# parsed_info = parser.parse_text(sample_text)
+# print("Parsed Info:", parsed_info)
+#
+# # Adding a field: a label pattern plus a value pattern with one capture group
+# parser.register_field("zoning", r"zoning(?:\s+classification)?", r"[:\s]*(.*?)(?:\n|$)")
@@ -0,0 +1,262 @@
+import argparse
+import json
+import os
+import time
+from datetime import datetime, timezone
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+from config import Config
+from feature_record import FeatureBatch
+from feature_store import FeatureStore, latest_per_case
+from main import final_underwriting_decision
+from ml_risk_model import MLRiskModel
+from rule_engine import RuleEngine
+
+# Decisions-table columns carried over from a case's stored decision when the
+# part that produced them (rules or model) isn't re-run
+RULE_COLUMNS = ["rule_decision", "overall_rule_based_risk", "risk_flags", "rule_version"]
+MODEL_COLUMNS = ["ml_label", "ml_probabilities", "model_version", "model_hash"]
+
+def run_output_path(output_path, started_at):
+    """output_path with the run's UTC start time before the extension, e.g. rescored_decisions_20240501T120000Z.jsonl."""
+    root, ext = os.path.splitext(output_path)
+    return f"{root}_{started_at.strftime('%Y%m%dT%H%M%SZ')}{ext}"
+
+def map_array(keys, values, item_type):
+    """
+    Arrow map column from an (n_cases, n_keys) array: row i maps keys[j] to
+    values[i, j], leaving out None values (e.g. rules that didn't apply).
+    """
+    values = np.asarray(values, dtype=object)
+    present = np.not_equal(values, None)
+    offsets = np.zeros(len(values) + 1, dtype=np.int32)
+    np.cumsum(present.sum(axis=1), out=offsets[1:])
+    key_grid = np.broadcast_to(np.array(keys, dtype=object), values.shape)
+    return pa.MapArray.from_arrays(pa.array(offsets, pa.int32()), pa.array(key_grid[present], pa.string()),
+                                   pa.array(values[present], item_type))
+
+def final_decisions(rule_decisions, ml_labels):
+    # Only a handful of distinct (rule decision, ML label) pairs, so
+    # final_underwriting_decision runs once per pair, not once per case
+    decided = {}
+    out = np.empty(len(rule_decisions), dtype=object)
+    for i, pair in enumerate(zip(rule_decisions, ml_labels)):
+        if pair not in decided:
+            decided[pair] = final_underwriting_decision(*pair)
+        out[i] = decided[pair]
+    return out
+
+class Rescorer:
+    """
+    Re-decides stored cases after the underwriting rules or the risk model
+    change, from the fused features in the feature store: no OCR, report
+    parsing or image analysis, just RuleEngine.apply_rules_batch and/or
+    MLRiskModel.predict_batch over batches of the features table.
+
+    Each case's latest stored decision records the rule_version and
+    model_hash that produced it. Only cases decided by a different version of
+    a part being re-run are re-scored (all of them with force=True); the part
+    not re-run keeps its stored result. Every re-scored case gets a new
+    decisions row with the versions now behind it, so a second run finds
+    nothing to do. The cases whose final decision changed are written as JSON
+    lines to a file per run (run_output_path: output_path stamped with the
+    run's start time), created only once a decision changes, so earlier runs'
+    files are never overwritten. Cases with features but no stored decision
+    are left to the batch runner.
+    """
+    def __init__(self, feature_store=None, rule_engine=None, ml_model=None, rescore_rules=True, rescore_model=True,
+                 batch_size=Config.RESCORE_BATCH_SIZE, output_path=Config.RESCORE_RESULTS_PATH, write_decisions=True,
+                 force=False, start_date=None, end_date=None):
+        if not (rescore_rules or rescore_model):
+            raise ValueError("Nothing to re-score: enable rescore_rules, rescore_model or both")
+        self.feature_store = feature_store or FeatureStore()
+        self.rule_engine = rule_engine or RuleEngine()
+        if rescore_model and ml_model is None:
+            ml_model = MLRiskModel()
+            if not ml_model.load_model():
+                print("ML model not loaded. Keeping the stored ML predictions.")
+                ml_model, rescore_model = None, False
+        self.ml_model = ml_model
+        self.rescore_rules = rescore_rules
+        self.rescore_model = rescore_model
+        self.batch_size = batch_size
+        self.output_path = output_path
+        self.write_decisions = write_decisions # append the new decisions to the feature store
+        self.force = force # re-score cases already decided by the current versions too
+        self.start_date = start_date
+        self.end_date = end_date
+
+    def stored_decisions(self):
+        """Latest stored decision of every case, as an Arrow table."""
+        return latest_per_case(self.feature_store.scan("decisions"))
+
+    def _stale(self, stored):
+        # Cases whose stored decision came from another version of a part being re-run
+        n = stored.num_rows
+        if self.force:
+            return np.ones(n, dtype=bool)
+        stale = np.zeros(n, dtype=bool)
+        if self.rescore_rules:
+            stale |= stored.column("rule_version").to_numpy() != self.rule_engine.version
+        if self.rescore_model:
+            stale |= stored.column("model_hash").to_numpy() != self.ml_model.model_hash
+        return stale
+
+    def _rescore(self, batch, stored):
+        """New decisions-table columns for the cases of batch (stored: their stored decisions)."""
+        n = len(batch)
+        columns = {"case_id": stored.column("case_id")}
+        if self.rescore_rules:
+            result = self.rule_engine.apply_rules_batch(batch.rule_columns())
+            flags = list(result["risk_flags"])
+            flag_values = np.column_stack([result["risk_flags"][flag] for flag in flags]) if flags else np.empty((n, 0), dtype=object)
+            columns.update(
+                rule_decision=result["decision"], overall_rule_based_risk=result["overall_rule_based_risk"],
+                risk_flags=map_array(flags, flag_values, pa.string()), rule_version=[result["rule_version"]] * n,
+            )
+        else:
+            columns.update({name: stored.column(name) for name in RULE_COLUMNS})
+        if self.rescore_model:
+            model = self.ml_model
+            labels, probabilities = model.predict_batch(batch.to_ml_matrix(model.feature_columns))
+            columns.update(
+                ml_label=[str(label) for label in labels],
+                ml_probabilities=map_array([str(c) for c in model.classes], probabilities, pa.float64()),
+                model_version=[model.model_version] * n, model_hash=[model.model_hash] * n,
+            )
+        else:
+            columns.update({name: stored.column(name) for name in MODEL_COLUMNS})
+        columns["decision"] = final_decisions(np.asarray(columns["rule_decision"], dtype=object),
+                                              np.asarray(columns["ml_label"], dtype=object))
+        return columns
+
+    def run(self):
+        """
+        Re-scores every stale case, streaming the features table in batches.
+        Returns a summary with counts, decision changes and cases/sec.
+        """
+        started = time.perf_counter()
+        processed_at = datetime.now(timezone.utc)
+        output_path = run_output_path(self.output_path, processed_at)
+        counts = {"cases": 0, "up_to_date": 0, "undecided": 0, "rescored": 0, "changed": 0}
+        changes = {}
+        out = None
+        try:
+            decisions = self.stored_decisions()
+            decision_ids = decisions.column("case_id").combine_chunks()
+            # A reprocessed case has several features rows; only its latest is re-scored
+            latest_features = latest_per_case(self.feature_store.scan("features", ["case_id", "processed_at"]))
+            latest_ids = latest_features.column("case_id").combine_chunks()
+
+            for ids, batch in self.feature_store.iter_feature_batches(
+                    self.batch_size, self.start_date, self.end_date, extra_columns=("case_id", "processed_at")):
+                case_ids = ids.column("case_id")
+                latest_at = latest_features.column("processed_at").take(pc.index_in(case_ids, value_set=latest_ids))
+                keep = pc.equal(ids.column("processed_at"), latest_at).to_numpy(zero_copy_only=False)
+                counts["cases"] += int(keep.sum())
+
+                stored_index = pc.index_in(case_ids, value_set=decision_ids).to_numpy(zero_copy_only=False)
+                decided = keep & ~np.isnan(stored_index.astype(np.float64))
+                counts["undecided"] += int((keep & ~decided).sum())
+                stored = decisions.take(pa.array(stored_index[decided].astype(np.int64)))
+                stale = self._stale(stored)
+                counts["up_to_date"] += int((~stale).sum())
+                if not stale.any():
+                    continue
+
+                rows = np.flatnonzero(decided)[stale]
+                stored = stored.filter(pa.array(stale))
+                columns = self._rescore(FeatureBatch(batch.values[rows]), stored)
+                counts["rescored"] += len(rows)
+                if self.write_decisions:
+                    self.feature_store.append_rows("decisions", columns, processed_at)
+
+                previous = stored.column("decision").to_numpy()
+                changed = np.flatnonzero(previous != columns["decision"])
+                counts["changed"] += len(changed)
+                if not len(changed):
+                    continue
+                new = {name: np.asarray(columns[name], dtype=object)[changed]
+                       for name in ("decision", "rule_decision", "ml_label", "rule_version", "model_hash")}
+                old = {name: stored.column(name).to_numpy()[changed]
+                       for name in ("case_id", "decision", "rule_version", "model_hash")}
+                if out is None:
+                    output_dir = os.path.dirname(output_path)
+                    if output_dir:
+                        os.makedirs(output_dir, exist_ok=True)
+                    out = open(output_path, "a")
+                for i in range(len(changed)):
+                    change = f"{old['decision'][i]} -> {new['decision'][i]}"
+                    changes[change] = changes.get(change, 0) + 1
+                    out.write(json.dumps({
+                        "case_id": old["case_id"][i],
+                        "previous_decision": old["decision"][i],
+                        "decision": new["decision"][i],
+                        "rule_decision": new["rule_decision"][i],
+                        "ml_label": new["ml_label"][i],
+                        "previous_rule_version": old["rule_version"][i],
+                        "rule_version": new["rule_version"][i],
+                        "previous_model_hash": old["model_hash"][i],
+                        "model_hash": new["model_hash"][i],
+                    }) + "\n")
+                out.flush()
+        finally:
+            if out is not None:
+                out.close()
+            if self.write_decisions:
+                self.feature_store.close()
+
+        elapsed = time.perf_counter() - started
+        summary = dict(counts,
+            decision_changes=changes,
+            rule_version=self.rule_engine.version if self.rescore_rules else None,
+            model_version=self.ml_model.model_version if self.rescore_model else None,
+            model_hash=self.ml_model.model_hash if self.rescore_model else None,
+            elapsed_sec=round(elapsed, 3),
+            cases_per_sec=round(counts["cases"] / elapsed, 3) if elapsed > 0 else 0.0,
+            output_path=output_path if out is not None else None,
+        )
+        print(f"[rescore] done: {summary}")
+        return summary
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Re-decide stored cases after a rules or model change, without re-running OCR.")
+    parser.add_argument("--rules", action=argparse.BooleanOptionalAction, default=True, help="re-run the underwriting rules")
+    parser.add_argument("--model", action=argparse.BooleanOptionalAction, default=True, help="re-run the risk model")
+    parser.add_argument("--rules-path", default=Config.UNDERWRITING_RULES_PATH)
+    parser.add_argument("--model-path", default=Config.RISK_MODEL_PATH)
+    parser.add_argument("--feature-store", default=None, help="feature store root (default: configured directories)")
+    parser.add_argument("--start-date", default=None)
+    parser.add_argument("--end-date", default=None)
+    parser.add_argument("--batch-size", type=int, default=Config.RESCORE_BATCH_SIZE)
+    parser.add_argument("--output", default=Config.RESCORE_RESULTS_PATH,
+                        help="JSON lines of the cases whose decision changed (stamped with the run's start time)")
+    parser.add_argument("--force", action="store_true", help="also re-score cases already decided by the current versions")
+    parser.add_argument("--write-decisions", action=argparse.BooleanOptionalAction, default=True,
+                        help="record the new decisions (and their versions) in the feature store")
+    args = parser.parse_args(argv)
+
+    ml_model = None
+    if args.model:
+        ml_model = MLRiskModel(args.model_path)
+        if not ml_model.load_model():
+            parser.error(f"no risk model at {args.model_path} (use --no-model to re-run the rules only)")
+    rescorer = Rescorer(
+        FeatureStore(args.feature_store), RuleEngine(rules_path=args.rules_path), ml_model, rescore_rules=args.rules,
+        rescore_model=args.model, batch_size=args.batch_size, output_path=args.output,
+        write_decisions=args.write_decisions, force=args.force, start_date=args.start_date, end_date=args.end_date,
+    )
+    return rescorer.run()
+
+if __name__ == "__main__":
+    main()
+
+# Example Usage:
+# # After editing Config.UNDERWRITING_RULES (or the rules file): re-run the rules only, keep the stored ML predictions
+# summary = Rescorer(rescore_model=False).run()
+# print(summary["changed"], "of", summary["rescored"], "re-scored cases changed decision")
+#
+# # After deploying a new risk_scorer_model.pkl
+# # python rescoring.py --no-rules --output data/rescored_decisions.jsonl
+# # -> data/rescored_decisions_<start time>.jsonl, if any decision changed
@@ -0,0 +1,215 @@
+import hashlib
+import json
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from config import Config
+
+def hash_bytes(data):
+    return hashlib.sha256(data).hexdigest()
+
+def hash_file(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _json_default(value):
+    if hasattr(value, "tolist"): # numpy scalars/arrays
+        return value.tolist()
+    return str(value)
+
+def hash_obj(obj):
+    """Content hash of a JSON-like value (dicts are hashed independent of key order)."""
+    return hash_bytes(json.dumps(obj, sort_keys=True, default=_json_default).encode())
+
+class MemoryLRUStore:
+    """In-process LRU of pickled values, bounded by total value size in bytes."""
+    def __init__(self, max_bytes=Config.CACHE_MEMORY_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._items = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._items.get(key)
+            if value is not None:
+                self._items.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        if len(value) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._items.pop(key, None)
+            if previous is not None:
+                self._bytes -= len(previous)
+            self._items[key] = value
+            self._bytes += len(value)
+            while self._bytes > self.max_bytes:
+                _, evicted = self._items.popitem(last=False)
+                self._bytes -= len(evicted)
+
+class SQLiteStore:
+    """
+    On-disk store shared by every process on the box (WAL mode). Least recently
+    used entries are evicted once the total stored size exceeds max_bytes.
+
+    Reads don't write: access times of hits are kept in memory and written back
+    in one transaction every flush_entries hits or flush_interval seconds, before
+    evicting, and on close. Eviction order is only as fresh as the last flush
+    of each process, which is plenty for LRU over a multi-GB budget.
+    """
+    def __init__(self, db_path=Config.CACHE_DB_PATH, max_bytes=Config.CACHE_DISK_MAX_BYTES,
+                 flush_entries=Config.CACHE_ACCESS_FLUSH_ENTRIES, flush_interval=Config.CACHE_ACCESS_FLUSH_INTERVAL_S):
+        self.db_path = db_path
+        self.max_bytes = max_bytes
+        self.flush_entries = flush_entries
+        self.flush_interval = flush_interval
+        self._accessed = {} # key -> last access time not yet written back
+        self._last_flush = time.monotonic()
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value BLOB NOT NULL, "
+            "size INTEGER NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS cache_last_access ON cache (last_access)")
+        # Other processes write too, so this is an estimate; the exact total is
+        # re-read from the table whenever the estimate crosses max_bytes.
+        self._approx_bytes = self._total_bytes()
+
+    def _total_bytes(self):
+        return self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()[0]
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            self._accessed[key] = time.time()
+            if len(self._accessed) >= self.flush_entries or time.monotonic() - self._last_flush >= self.flush_interval:
+                self._flush_access_times()
+            return row[0]
+
+    def _flush_access_times(self):
+        self._last_flush = time.monotonic()
+        if not self._accessed:
+            return
+        accessed, self._accessed = self._accessed, {}
+        with self._conn: # one transaction for the whole batch
+            self._conn.execute("BEGIN")
+            # Another process may have written a later access (or re-put the entry) meanwhile
+            self._conn.executemany("UPDATE cache SET last_access = MAX(last_access, ?) WHERE key = ?",
+                                   [(accessed_at, key) for key, accessed_at in accessed.items()])
+
+    def put(self, key, value):
+        with self._lock:
+            self._accessed.pop(key, None)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, size, last_access) VALUES (?, ?, ?, ?)",
+                (key, sqlite3.Binary(value), len(value), time.time()),
+            )
+            self._approx_bytes += len(value)
+            if self._approx_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        # Trim to 90% of the budget so we don't evict on every following put
+        self._flush_access_times()
+        total = self._total_bytes()
+        target = int(self.max_bytes * 0.9)
+        while total > target:
+            rows = self._conn.execute("SELECT key, size FROM cache ORDER BY last_access LIMIT 256").fetchall()
+            if not rows:
+                break
+            evicted = []
+            for key, size in rows:
+                if total <= target:
+                    break
+                evicted.append((key,))
+                total -= size
+            self._conn.executemany("DELETE FROM cache WHERE key = ?", evicted)
+        self._approx_bytes = max(total, 0)
+
+    def close(self):
+        with self._lock:
+            self._flush_access_times()
+            self._conn.close()
+
+class StageCache:
+    """
+    Content-addressed cache for pipeline stage results.
+
+    A result is keyed by the stage name, the version of the component that
+    produced it (parser field set, detector model, rule set, risk model, ...)
+    and the hash of the stage's inputs. Re-submitting a case therefore only
+    recomputes the stages whose inputs or components actually changed. Stores
+    are tried in order (e.g. memory, then SQLite); a hit in a later store is
+    copied into the earlier ones.
+    """
+    def __init__(self, stores):
+        self.stores = stores
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(stage, version, input_hash):
+        return hash_bytes(f"{stage}\0{version}\0{input_hash}".encode())
+
+    def _count(self, stage, outcome):
+        with self._lock:
+            stats = self._stats.setdefault(stage, {"hits": 0, "misses": 0})
+            stats[outcome] += 1
+
+    def get_or_compute(self, stage, version, input_hash, compute, cacheable=None):
+        """
+        Returns the cached result, or compute()'s result after storing it.
+        cacheable(value) returning False hands the value back without storing
+        it, e.g. text from an extraction that failed part-way.
+        """
+        key = self.make_key(stage, version, input_hash)
+        for i, store in enumerate(self.stores):
+            payload = store.get(key)
+            if payload is not None:
+                for earlier in self.stores[:i]:
+                    earlier.put(key, payload)
+                self._count(stage, "hits")
+                return pickle.loads(payload)
+
+        self._count(stage, "misses")
+        value = compute()
+        if cacheable is not None and not cacheable(value):
+            return value
+        payload = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        for store in self.stores:
+            store.put(key, payload)
+        return value
+
+    def metrics(self):
+        """Per-stage hits, misses and hit rate."""
+        with self._lock:
+            metrics = {}
+            for stage, stats in self._stats.items():
+                lookups = stats["hits"] + stats["misses"]
+                metrics[stage] = dict(stats, hit_rate=round(stats["hits"] / lookups, 4) if lookups else 0.0)
+            return metrics
+
+def build_default_cache():
+    return StageCache([MemoryLRUStore(Config.CACHE_MEMORY_MAX_BYTES),
+                       SQLiteStore(Config.CACHE_DB_PATH, Config.CACHE_DISK_MAX_BYTES)])
+
+# Example Usage:
+# cache = build_default_cache()
+# text = cache.get_or_compute("ocr", "1", hash_file("report_001.pdf"), lambda: expensive_ocr("report_001.pdf"))
+# print("Cache hit rates:", cache.metrics())
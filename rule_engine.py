@@ -1,53 +1,350 @@
-from config import Config
-
-class RuleEngine:
-    def __init__(self, underwriting_rules=Config.UNDERWRITING_RULES):
-        self.rules = underwriting_rules
-
-    def apply_rules(self, features):
-        """
-        Applies predefined underwriting rules to the extracted features.
-        """
-        risk_flags = {}
-        overall_risk = "LOW_RISK" # Default
-
-        # Example rule application
-        roof_condition = features.get("text_roof_condition_classified")
-        if roof_condition and roof_condition in self.rules["roof_condition"]:
-            risk_flags["roof_risk"] = self.rules["roof_condition"][roof_condition]
-            if risk_flags["roof_risk"] == "HIGH_RISK":
-                overall_risk = "HIGH_RISK" # Update overall if high risk detected
-            elif risk_flags["roof_risk"] == "MEDIUM_RISK" and overall_risk == "LOW_RISK":
-                overall_risk = "MEDIUM_RISK"
-
-        foundation_cracks = features.get("text_foundation_cracks_detected")
-        if foundation_cracks and foundation_cracks in self.rules["foundation_cracks_detected"]:
-            risk_flags["foundation_risk"] = self.rules["foundation_cracks_detected"][foundation_cracks]
-            if risk_flags["foundation_risk"] == "HIGH_RISK":
-                overall_risk = "HIGH_RISK"
-
-        # Example: Incorporating image-based risk
-        image_overall_condition = features.get("image_overall_condition_ai")
-        if image_overall_condition == "poor" and overall_risk != "DECLINE":
-            risk_flags["image_condition_risk"] = "HIGH_RISK"
-            overall_risk = "HIGH_RISK"
-        elif image_overall_condition == "fair" and overall_risk == "LOW_RISK":
-            risk_flags["image_condition_risk"] = "MEDIUM_RISK"
-            overall_risk = "MEDIUM_RISK"
-
-        # Apply more complex rules, e.g., if multiple medium risks, escalate to high
-        if overall_risk == "LOW_RISK" and features.get("multimodal_roof_conflict"):
-            overall_risk = "REVIEW_REQUIRED" # Conflict flags review
-
-        # Placeholder for final decision based on risk level
-        if overall_risk == "HIGH_RISK" or overall_risk == "DECLINE" or overall_risk == "REVIEW_REQUIRED":
-            decision = overall_risk
-        else:
-            decision = "APPROVED" # Or "APPROVED_WITH_CONDITIONS"
-
-        return {"risk_flags": risk_flags, "overall_rule_based_risk": overall_risk, "decision": decision}
-
-# Example Usage:
-# rule_engine = RuleEngine()
-# rule_results = rule_engine.apply_rules(combined_data)
-# print("Rule-based Assessment:", rule_results)
\ No newline at end of file
+import hashlib
+import json
+import logging
+import os
+import re
+from datetime import date
+import numpy as np
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Ordered from least to most severe. STANDARD (a plain-premium outcome) ranks
+# below the LOW_RISK default so it never raises a case's overall risk.
+DEFAULT_SEVERITIES = ["STANDARD", "LOW_RISK", "MEDIUM_RISK", "ADDITIONAL_PREMIUM", "REVIEW_REQUIRED", "HIGH_RISK", "DECLINE"]
+
+# Which feature each Config.UNDERWRITING_RULES entry applies to, and the flag it reports
+_CONFIG_RULE_BINDINGS = {
+    "roof_condition": ("roof_risk", "text_roof_condition_classified"),
+    "foundation_cracks_detected": ("foundation_risk", "text_foundation_cracks_detected"),
+    "property_age": ("property_age_risk", "text_year_built"),
+    "flood_zone": ("flood_risk", "text_flood_zone"),
+}
+_AGE_KEY = re.compile(r"^(gt|lt)_(\d+)_years$")
+
+def rule_spec_from_config(underwriting_rules):
+    """
+    Converts the Config.UNDERWRITING_RULES dict into a rule spec (the same
+    structure as a rules file), adding the image-condition rule and the
+    text/image conflict escalation.
+    """
+    rules = []
+    for key, outcomes in underwriting_rules.items():
+        if key not in _CONFIG_RULE_BINDINGS:
+            raise ValueError(f"No feature binding for underwriting rule '{key}'")
+        flag, feature = _CONFIG_RULE_BINDINGS[key]
+        if key == "property_age":
+            bands = []
+            for band_key, risk in outcomes.items():
+                m = _AGE_KEY.match(band_key)
+                if not m:
+                    raise ValueError(f"Unrecognised property_age band '{band_key}' (expected gt_<n>_years or lt_<n>_years)")
+                bands.append({"above" if m.group(1) == "gt" else "below": int(m.group(2)), "risk": risk})
+            rules.append({"flag": flag, "feature": feature, "type": "bands", "transform": "years_since", "bands": bands})
+        else:
+            rules.append({"flag": flag, "feature": feature, "type": "lookup", "values": dict(outcomes)})
+    rules.append({"flag": "image_condition_risk", "feature": "image_overall_condition_ai", "type": "lookup",
+                  "values": {"poor": "HIGH_RISK", "fair": "MEDIUM_RISK"}})
+    return {
+        "version": "config",
+        "severities": list(DEFAULT_SEVERITIES),
+        "default_risk": "LOW_RISK",
+        "rules": rules,
+        "escalations": [
+            # Text and image disagree about the roof: a human should look at it
+            {"when_feature": "multimodal_roof_conflict", "equals": True,
+             "if_overall_in": ["STANDARD", "LOW_RISK"], "then": "REVIEW_REQUIRED"},
+        ],
+        "decisions": {"HIGH_RISK": "HIGH_RISK", "DECLINE": "DECLINE", "REVIEW_REQUIRED": "REVIEW_REQUIRED",
+                      "ADDITIONAL_PREMIUM": "APPROVED_WITH_CONDITIONS"},
+        "default_decision": "APPROVED",
+    }
+
+def load_rule_spec(rules_path):
+    """Loads a rule spec from a .json or .yaml/.yml file."""
+    with open(rules_path) as f:
+        if rules_path.endswith((".yaml", ".yml")):
+            import yaml # Optional dependency, only needed for YAML rule files
+            return yaml.safe_load(f)
+        return json.load(f)
+
+def _to_number(value):
+    if value is None or isinstance(value, bool):
+        return None
+    try:
+        number = float(str(value).replace(",", "")) if isinstance(value, str) else float(value)
+    except ValueError:
+        return None
+    return None if number != number else number # NaN counts as missing
+
+def _equals(column, value):
+    result = np.asarray(column == value)
+    if result.shape != column.shape: # incomparable dtypes give back a single False
+        return np.zeros(column.shape, dtype=bool)
+    return result.astype(bool)
+
+class RulePlan:
+    """
+    A rule spec compiled into an evaluation plan.
+
+    Every risk label maps to its rank in the ordered severities. Each rule turns
+    one feature into a label (or no flag). The overall risk is the most severe
+    label seen, starting from default_risk. Escalations then run in order and can
+    only raise it. The decision comes from the decisions table.
+
+    evaluate() runs the plan on one feature dict. evaluate_batch() runs the same
+    plan over columns of many cases with NumPy array operations, and gives the
+    same results case for case.
+    """
+    def __init__(self, spec, reference_year=None):
+        self.spec = spec
+        self.severities = list(spec.get("severities", DEFAULT_SEVERITIES))
+        self.rank = {label: i for i, label in enumerate(self.severities)}
+        self.default_rank = self._rank_of(spec.get("default_risk", "LOW_RISK"))
+        self.reference_year = reference_year or date.today().year
+        self.decisions = dict(spec.get("decisions", {}))
+        self.default_decision = spec.get("default_decision", "APPROVED")
+        self.decision_by_rank = [self.decisions.get(label, self.default_decision) for label in self.severities]
+
+        # Ages are counted from reference_year, so the same spec gives different
+        # results in a different year: it's part of the version
+        canonical = json.dumps({"spec": spec, "reference_year": self.reference_year}, sort_keys=True, default=str).encode()
+        self.version = f"{spec.get('version', 'unversioned')}+{hashlib.sha256(canonical).hexdigest()[:8]}"
+
+        self.rules = []
+        for rule in spec.get("rules", []):
+            kind = rule.get("type", "lookup")
+            compiled = {"flag": rule["flag"], "feature": rule["feature"], "type": kind}
+            if kind == "lookup":
+                compiled["values"] = {value: self._rank_of(risk) for value, risk in rule["values"].items()}
+            elif kind == "bands":
+                if rule.get("transform") not in (None, "years_since"):
+                    raise ValueError(f"Unknown transform '{rule['transform']}' in rule '{rule['flag']}'")
+                compiled["transform"] = rule.get("transform")
+                compiled["bands"] = [(band.get("above"), band.get("below"), self._rank_of(band["risk"]))
+                                     for band in rule["bands"]]
+            else:
+                raise ValueError(f"Unknown rule type '{kind}' in rule '{rule['flag']}'")
+            self.rules.append(compiled)
+
+        self.escalations = []
+        for escalation in spec.get("escalations", []):
+            min_flags = escalation.get("min_flags")
+            self.escalations.append({
+                "when_feature": escalation.get("when_feature"),
+                "equals": escalation.get("equals", True),
+                "if_overall_in": [self._rank_of(label) for label in escalation["if_overall_in"]]
+                                 if "if_overall_in" in escalation else None,
+                # {"risk": "MEDIUM_RISK", "count": 2}: at least count flags at or above risk
+                "min_flags": (self._rank_of(min_flags["risk"]), min_flags["count"]) if min_flags else None,
+                "then": self._rank_of(escalation["then"]),
+            })
+
+    def _rank_of(self, label):
+        if label not in self.rank:
+            raise ValueError(f"Risk label '{label}' is not in the severities list {self.severities}")
+        return self.rank[label]
+
+    def _band_value(self, rule, number):
+        if rule["transform"] == "years_since":
+            return None if number is None or number <= 0 else self.reference_year - number
+        return number
+
+    # --- single case ---
+
+    def _rule_rank(self, rule, value):
+        if rule["type"] == "lookup":
+            try:
+                return rule["values"].get(value, -1)
+            except TypeError: # unhashable feature value
+                return -1
+        number = self._band_value(rule, _to_number(value))
+        if number is None:
+            return -1
+        for above, below, rank in rule["bands"]:
+            if (above is None or number > above) and (below is None or number < below):
+                return rank
+        return -1
+
+    def evaluate(self, features):
+        risk_flags = {}
+        flag_ranks = []
+        overall = self.default_rank
+        for rule in self.rules:
+            rank = self._rule_rank(rule, features.get(rule["feature"]))
+            flag_ranks.append(rank)
+            if rank >= 0:
+                risk_flags[rule["flag"]] = self.severities[rank]
+                overall = max(overall, rank)
+
+        for escalation in self.escalations:
+            if escalation["when_feature"] is not None and features.get(escalation["when_feature"]) != escalation["equals"]:
+                continue
+            if escalation["if_overall_in"] is not None and overall not in escalation["if_overall_in"]:
+                continue
+            if escalation["min_flags"] is not None:
+                at_least, count = escalation["min_flags"]
+                if sum(rank >= at_least for rank in flag_ranks) < count:
+                    continue
+            overall = max(overall, escalation["then"])
+
+        return {
+            "risk_flags": risk_flags,
+            "overall_rule_based_risk": self.severities[overall],
+            "decision": self.decision_by_rank[overall],
+            "rule_version": self.version,
+        }
+
+    # --- columnar batch ---
+
+    @staticmethod
+    def _columns(batch):
+        if isinstance(batch, list): # list of feature dicts
+            keys = {key for row in batch for key in row}
+            return {key: [row.get(key) for row in batch] for key in keys}, len(batch)
+        if hasattr(batch, "columns") and hasattr(batch, "__len__"): # DataFrame
+            return {name: batch[name].to_numpy() for name in batch.columns}, len(batch)
+        lengths = {len(column) for column in batch.values()}
+        if len(lengths) > 1:
+            raise ValueError("All columns in a batch must have the same length")
+        return batch, lengths.pop() if lengths else 0
+
+    @staticmethod
+    def _column(columns, name, n):
+        if name not in columns:
+            return np.full(n, None, dtype=object)
+        column = columns[name]
+        if isinstance(column, np.ndarray):
+            return column
+        column = np.empty(n, dtype=object)
+        column[:] = columns[name] # keeps strings/None as Python objects, like a feature dict
+        return column
+
+    def _rule_ranks_batch(self, rule, column):
+        n = len(column)
+        ranks = np.full(n, -1, dtype=np.int64)
+        if rule["type"] == "lookup":
+            for value, rank in rule["values"].items():
+                ranks[_equals(column, value)] = rank
+            return ranks
+
+        if column.dtype.kind in "iuf":
+            numbers = column.astype(np.float64)
+        else:
+            numbers = np.array([_to_number(v) for v in column], dtype=np.float64) # None -> nan
+        if rule["transform"] == "years_since":
+            numbers = np.where(numbers > 0, self.reference_year - numbers, np.nan)
+        unassigned = ~np.isnan(numbers)
+        for above, below, rank in rule["bands"]:
+            hit = unassigned.copy()
+            if above is not None:
+                hit &= numbers > above
+            if below is not None:
+                hit &= numbers < below
+            ranks[hit] = rank
+            unassigned &= ~hit # first matching band wins
+        return ranks
+
+    def evaluate_batch(self, batch):
+        """
+        batch: DataFrame, dict of equal-length columns, or list of feature dicts.
+        Returns columns: overall_rule_based_risk and decision (object arrays),
+        risk_flags ({flag: object array, None where the rule didn't apply}) and
+        the rule_version.
+        """
+        columns, n = self._columns(batch)
+        labels = np.array(self.severities + [None], dtype=object) # rank -1 -> None
+        overall = np.full(n, self.default_rank, dtype=np.int64)
+        flag_ranks = []
+        risk_flags = {}
+        for rule in self.rules:
+            ranks = self._rule_ranks_batch(rule, self._column(columns, rule["feature"], n))
+            flag_ranks.append(ranks)
+            risk_flags[rule["flag"]] = labels[ranks]
+            np.maximum(overall, ranks, out=overall)
+
+        for escalation in self.escalations:
+            applies = np.ones(n, dtype=bool)
+            if escalation["when_feature"] is not None:
+                applies &= _equals(self._column(columns, escalation["when_feature"], n), escalation["equals"])
+            if escalation["if_overall_in"] is not None:
+                applies &= np.isin(overall, escalation["if_overall_in"])
+            if escalation["min_flags"] is not None:
+                at_least, count = escalation["min_flags"]
+                applies &= sum((ranks >= at_least).astype(np.int64) for ranks in flag_ranks) >= count
+            overall = np.where(applies, np.maximum(overall, escalation["then"]), overall)
+
+        return {
+            "risk_flags": risk_flags,
+            "overall_rule_based_risk": labels[overall],
+            "decision": np.array(self.decision_by_rank, dtype=object)[overall],
+            "rule_version": self.version,
+        }
+
+class RuleEngine:
+    def __init__(self, underwriting_rules=None, rules_path=Config.UNDERWRITING_RULES_PATH, reference_year=None):
+        """
+        Rules come from underwriting_rules (a Config.UNDERWRITING_RULES-style dict)
+        when given, otherwise from the rules file at rules_path when set
+        (Config.UNDERWRITING_RULES_PATH), otherwise from Config.UNDERWRITING_RULES.
+
+        Property ages are counted from reference_year; by default the current
+        year, re-read on every call so a long-running engine moves on to the
+        new year (and a new version) on January 1st.
+        """
+        if underwriting_rules is not None:
+            self.rules, self.source = rule_spec_from_config(underwriting_rules), "underwriting_rules argument"
+        elif rules_path:
+            if not os.path.exists(rules_path):
+                raise FileNotFoundError(f"Rules file not found: {rules_path}")
+            self.rules, self.source = load_rule_spec(rules_path), rules_path
+        else:
+            self.rules, self.source = rule_spec_from_config(Config.UNDERWRITING_RULES), "Config.UNDERWRITING_RULES"
+        self.reference_year = reference_year # None: the current year
+        self._plan = RulePlan(self.rules, reference_year)
+        logger.info("Underwriting rules loaded from %s (version %s)", self.source, self._plan.version)
+
+    @property
+    def plan(self):
+        if self.reference_year is None and self._plan.reference_year != date.today().year:
+            self._plan = RulePlan(self.rules)
+        return self._plan
+
+    @property
+    def version(self):
+        return self.plan.version
+
+    def apply_rules(self, features):
+        """
+        Applies predefined underwriting rules to the extracted features.
+        """
+        return self.plan.evaluate(features)
+
+    def apply_rules_batch(self, batch):
+        """
+        Applies the same rules to many cases at once (see RulePlan.evaluate_batch).
+        """
+        return self.plan.evaluate_batch(batch)
+
+    @staticmethod
+    def batch_to_records(batch_result):
+        # Per-case dicts in the same shape apply_rules returns
+        flags = batch_result["risk_flags"]
+        records = []
+        for i in range(len(batch_result["decision"])):
+            records.append({
+                "risk_flags": {flag: values[i] for flag, values in flags.items() if values[i] is not None},
+                "overall_rule_based_risk": batch_result["overall_rule_based_risk"][i],
+                "decision": batch_result["decision"][i],
+                "rule_version": batch_result["rule_version"],
+            })
+        return records
+
+# Example Usage:
+# rule_engine = RuleEngine()
+# rule_results = rule_engine.apply_rules(combined_data)
+# print("Rule-based Assessment:", rule_results)
+#
+# # Many cases at once (DataFrame or dict of columns):
+# batch_results = rule_engine.apply_rules_batch(features_df)
+# print(batch_results["decision"][:10])
@@ -0,0 +1,245 @@
+import asyncio
+import json
+import os
+import shutil
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, File, HTTPException, UploadFile
+from fastapi.responses import PlainTextResponse
+from pydantic import BaseModel, Field
+from config import Config
+from batch_runner import (WORKER_DIED_ERROR, create_worker_pool, preload_worker_state, run_case, run_case_isolated,
+                          json_default, start_workers)
+from data_integrator import DataIntegrator
+from instrumentation import PipelineMetrics
+from rule_engine import RuleEngine
+from ml_risk_model import MLRiskModel
+from main import final_underwriting_decision
+
+class ScoreRequest(BaseModel):
+    # Output of ReportParser.parse_text and ImageAnalyzer.analyze_property_image
+    text_data: dict = Field(default_factory=dict)
+    image_data: dict = Field(default_factory=dict)
+
+def _jsonable(value):
+    return json.loads(json.dumps(value, default=json_default))
+
+class UnderwritingService:
+    """
+    Async front end for the underwriting pipeline.
+
+    Uploaded cases are spooled to disk and run in a process pool (OCR, CV and
+    scoring are CPU-bound, so none of it runs on the event loop). At most
+    max_pending cases are admitted at a time; beyond that uploads are refused
+    with 503 + Retry-After instead of queueing without bound. Cases whose text
+    and image data are already extracted take the synchronous fast path
+    (fusion, rules, ML) on a thread pool in this process.
+
+    A case worker that dies (OOM kill, crash in a native library) breaks the
+    whole process pool. It is replaced by a pool started with
+    Config.WORKER_RESTART_START_METHOD (this process has threads by then, so
+    no forking) and counted as worker_pool_restarts in /metrics. The cases
+    that were in flight on it are each re-run alone (run_case_isolated), so
+    the one that killed the worker fails by itself and the rest complete.
+    """
+    def __init__(self, process_workers=Config.SERVICE_PROCESS_WORKERS, max_pending=Config.SERVICE_MAX_PENDING,
+                 spool_dir=Config.SERVICE_SPOOL_DIR, job_retention=Config.SERVICE_JOB_RETENTION):
+        self.process_workers = process_workers
+        self.max_pending = max_pending
+        self.spool_dir = spool_dir
+        self.job_retention = job_retention
+        self.pending = 0 # only touched on the event loop thread
+        self.jobs = OrderedDict()
+        self._tasks = set()
+        # Fast-path timings plus the per-case records reported back by the case workers
+        self.metrics = PipelineMetrics()
+
+    def start(self):
+        os.makedirs(self.spool_dir, exist_ok=True)
+        # Workers are forked (after preloading, see batch_runner.create_worker_pool)
+        # before this process starts any threads of its own
+        self.process_pool = create_worker_pool(self.process_workers)
+        start_workers(self.process_pool)
+        self.thread_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="score")
+        # Fast-path components only; OCR and CV live in the worker processes
+        self.data_integrator = DataIntegrator()
+        self.rule_engine = RuleEngine()
+        if Config.WORKER_PRELOAD:
+            self.ml_model = preload_worker_state()["ml_model"] # the model the workers were forked with
+        else:
+            self.ml_model = MLRiskModel()
+            if not self.ml_model.load_model():
+                self.ml_model = None
+        self.feature_store = None
+        if Config.FEATURE_STORE_ENABLED:
+            from feature_store import FeatureStore # pyarrow is only needed when writing the store
+            self.feature_store = FeatureStore(flush_interval_sec=Config.FEATURE_STORE_FLUSH_INTERVAL_SEC)
+
+    def stop(self):
+        self.process_pool.shutdown(cancel_futures=True)
+        if self.feature_store is not None:
+            self.feature_store.close()
+        self.thread_pool.shutdown()
+
+    # --- fast path ---
+
+    def score_extracted(self, text_data, image_data):
+        metrics = self.metrics
+        with metrics.stage("score_fuse"):
+            features = self.data_integrator.integrate_record(text_data, image_data)
+        with metrics.stage("score_rules"):
+            rule_based_assessment = self.rule_engine.apply_rules(features)
+        with metrics.stage("score_ml"):
+            if self.ml_model is None:
+                ml_prediction = {"predicted_label": "N/A", "probabilities": {}}
+            else:
+                ml_prediction = self.ml_model.predict_risk(features)
+        metrics.incr("fast_path_requests")
+        return _jsonable({
+            "decision": final_underwriting_decision(rule_based_assessment["decision"], ml_prediction["predicted_label"]),
+            "rule_based_assessment": rule_based_assessment,
+            "ml_prediction": ml_prediction,
+            "combined_features": features.to_dict(),
+        })
+
+    def replace_broken_pool(self, broken):
+        """Swaps in a new case worker pool for broken, unless another job already did."""
+        if self.process_pool is not broken:
+            return
+        print("Case worker pool is broken (a worker process died); starting a new one")
+        self.process_pool = create_worker_pool(self.process_workers, start_method=Config.WORKER_RESTART_START_METHOD)
+        broken.shutdown(wait=False, cancel_futures=True)
+        self.metrics.incr("worker_pool_restarts")
+
+    # --- uploaded cases ---
+
+    def admit(self):
+        if self.pending >= self.max_pending:
+            raise HTTPException(status_code=503, detail="Too many cases in flight; retry later",
+                                headers={"Retry-After": "5"})
+        self.pending += 1
+
+    async def spool_upload(self, upload, case_dir, name):
+        # Starlette keeps at most 1 MB of an upload in memory before rolling it to a
+        # temp file; copy it into the spool directory in chunks, off the event loop.
+        extension = os.path.splitext(upload.filename or "")[1].lower()
+        path = os.path.join(case_dir, name + extension)
+
+        def copy():
+            os.makedirs(case_dir, exist_ok=True)
+            upload.file.seek(0)
+            with open(path, "wb") as out:
+                shutil.copyfileobj(upload.file, out, Config.SERVICE_UPLOAD_CHUNK_BYTES)
+
+        await asyncio.get_running_loop().run_in_executor(self.thread_pool, copy)
+        return path
+
+    def submit(self, job_id, case, case_dir):
+        self.jobs[job_id] = {"job_id": job_id, "status": "queued", "submitted_at": time.time()}
+        task = asyncio.create_task(self._run_job(job_id, case, case_dir))
+        self._tasks.add(task) # keep a reference until it finishes
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run_job(self, job_id, case, case_dir):
+        job = self.jobs[job_id]
+        loop = asyncio.get_running_loop()
+        try:
+            pool = self.process_pool
+            try:
+                future = loop.run_in_executor(pool, run_case, case)
+            except BrokenProcessPool: # broken before a job in flight on it noticed
+                self.replace_broken_pool(pool)
+                pool = self.process_pool
+                future = loop.run_in_executor(pool, run_case, case)
+            try:
+                result = await future
+            except BrokenProcessPool:
+                self.replace_broken_pool(pool)
+                result = await loop.run_in_executor(self.thread_pool, run_case_isolated, case)
+                if result.get("error") == WORKER_DIED_ERROR:
+                    self.metrics.incr("worker_crash_cases")
+            if result.get("metrics"):
+                self.metrics.record_case(result["metrics"])
+            job["status"] = "failed" if "error" in result else "done"
+            if self.feature_store is not None and "error" not in result:
+                # Appends are buffered; the occasional flush writes Parquet, so keep it off the loop
+                await loop.run_in_executor(self.thread_pool, self.feature_store.append_case, result)
+            job["result"] = _jsonable(result)
+        except Exception as e:
+            job["status"] = "failed"
+            job["result"] = {"error": f"{type(e).__name__}: {e}"}
+        finally:
+            job["finished_at"] = time.time()
+            job["elapsed_sec"] = round(job["finished_at"] - job["submitted_at"], 4)
+            self.pending -= 1
+            await loop.run_in_executor(self.thread_pool, shutil.rmtree, case_dir, True)
+            self._trim_jobs()
+
+    def _trim_jobs(self):
+        while len(self.jobs) > self.job_retention:
+            oldest_id, oldest = next(iter(self.jobs.items()))
+            if "finished_at" not in oldest:
+                break
+            del self.jobs[oldest_id]
+
+service = UnderwritingService()
+
+@asynccontextmanager
+async def lifespan(app):
+    service.start()
+    yield
+    service.stop()
+
+app = FastAPI(title="Automated Underwriting Platform", lifespan=lifespan)
+
+@app.post("/cases", status_code=202)
+async def submit_case(report: UploadFile = File(...), photo: UploadFile | None = File(None)):
+    """Upload an appraisal report (and optionally a photo); returns a job id to poll."""
+    service.admit()
+    job_id = uuid.uuid4().hex
+    case_dir = os.path.join(service.spool_dir, job_id)
+    try:
+        report_path = await service.spool_upload(report, case_dir, "report")
+        photo_path = await service.spool_upload(photo, case_dir, "photo") if photo is not None else None
+    except Exception:
+        service.pending -= 1
+        shutil.rmtree(case_dir, ignore_errors=True)
+        raise
+    service.submit(job_id, {"case_id": job_id, "report_path": report_path, "photo_path": photo_path}, case_dir)
+    return {"job_id": job_id, "status": "queued", "status_url": f"/jobs/{job_id}"}
+
+@app.get("/jobs/{job_id}")
+async def job_status(job_id: str):
+    job = service.jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job id")
+    return job
+
+@app.post("/score")
+async def score(request: ScoreRequest):
+    """Synchronous fast path for cases whose text and image data are already extracted."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(service.thread_pool, service.score_extracted, request.text_data, request.image_data)
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus text metrics: per-stage latency histograms, counters and memory high-water marks."""
+    return service.metrics.to_prometheus()
+
+@app.get("/healthz")
+async def healthz():
+    return {"pending": service.pending, "max_pending": service.max_pending, "jobs_tracked": len(service.jobs)}
+
+if __name__ == "__main__":
+    import uvicorn
+    # One server process: the case workers are this process's own process pool
+    uvicorn.run("service:app", host="0.0.0.0", port=8000, workers=1)
+
+# Example Usage:
+# uvicorn service:app --port 8000
+# curl -F report=@data/raw_appraisals/report_001.pdf -F photo=@data/raw_appraisals/property_001.jpg localhost:8000/cases
+# curl localhost:8000/jobs/<job_id>
@@ -0,0 +1,33 @@
+import os
+import sys
+import pytest
+
+# Modules live at the repo root (no package), as when running from a checkout
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_DIR not in sys.path:
+    sys.path.insert(0, REPO_DIR)
+
+from config import Config
+
+@pytest.fixture(scope="session")
+def corpus(tmp_path_factory):
+    """A few small synthetic appraisals (benchmarks/corpus.py): (directory, manifest)."""
+    from benchmarks.corpus import generate_corpus
+    directory = str(tmp_path_factory.mktemp("corpus"))
+    # Text-layer pages only, so the tests don't depend on Tesseract being installed
+    manifest = generate_corpus(directory, cases=4, pages=(1, 3), scanned_fraction=0.0, photos=(0, 1),
+                               photo_size=(640, 480))
+    return directory, manifest
+
+@pytest.fixture(scope="session")
+def forest_model():
+    """A small forest fitted on synthetic cases labelled by the rule engine."""
+    from benchmarks.bench_forest_scorer import fit_model
+    return fit_model(n_cases=2000, n_estimators=20)
+
+@pytest.fixture
+def pipeline_config(monkeypatch):
+    # Pipeline runs neither read nor write the stage cache under data/, and never need Tesseract
+    monkeypatch.setattr(Config, "CACHE_ENABLED", False)
+    monkeypatch.setattr(Config, "OCR_FALLBACK_ENABLED", False)
+    return Config
@@ -0,0 +1,78 @@
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import pytest
+import batch_runner
+from batch_runner import WORKER_DIED_ERROR, BatchRunner
+
+class RecordingStore:
+    closed = False
+
+    def append_case(self, outputs):
+        pass
+
+    def close(self):
+        self.closed = True
+
+def test_feature_store_closed_when_the_run_fails(tmp_path):
+    def cases():
+        raise RuntimeError("manifest unreadable")
+        yield
+
+    store = RecordingStore()
+    runner = BatchRunner(max_workers=1, output_path=str(tmp_path / "results.jsonl"), metrics_path=None,
+                         feature_store=store, preload=False)
+    with pytest.raises(RuntimeError):
+        runner.run(cases())
+    assert store.closed
+
+def test_batch_run_results_and_errors(corpus, pipeline_config, tmp_path):
+    from feature_store import FeatureStore
+    directory, manifest = corpus
+    cases = [{"case_id": case["case_id"], "report_path": os.path.join(directory, case["report"]),
+              "photo_path": os.path.join(directory, case["photo"])} for case in manifest["cases"]]
+    cases.append({"case_id": "missing", "report_path": str(tmp_path / "missing.pdf"), "photo_path": None})
+    output_path = str(tmp_path / "results.jsonl")
+    runner = BatchRunner(max_workers=2, output_path=output_path, metrics_path=None,
+                         feature_store=FeatureStore(str(tmp_path / "store")), preload=False)
+    summary = runner.run(cases)
+
+    assert summary["cases"] == len(cases) and summary["errors"] == 1 and summary["degraded"] == 0
+    assert summary["worker_restarts"] == 0
+    with open(output_path) as f:
+        results = {result["case_id"]: result for result in map(json.loads, f)}
+    assert set(results) == {case["case_id"] for case in cases}
+    assert "error" in results["missing"]
+    for case in manifest["cases"]:
+        result = results[case["case_id"]]
+        assert "error" not in result and result["decision"]
+        assert result["parsed_text"]["property_address"] == case["fields"]["property_address"]
+    stored = FeatureStore(str(tmp_path / "store")).scan("decisions", ["case_id"]).column("case_id").to_pylist()
+    assert sorted(stored) == sorted(case["case_id"] for case in manifest["cases"])
+    assert summary["stage_mean_ms"]
+
+def crash_or_echo(case):
+    """Stands in for run_case in the workers: a "crash" case kills its worker process."""
+    if case.get("crash"):
+        os._exit(1)
+    time.sleep(0.3) # still running when the crash breaks the pool
+    return {"case_id": case["case_id"]}
+
+def spawn_pool(max_workers, preload=None, start_method=None):
+    return ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn"))
+
+def test_batch_run_survives_a_dying_worker(tmp_path, monkeypatch):
+    monkeypatch.setattr(batch_runner, "create_worker_pool", spawn_pool)
+    monkeypatch.setattr(batch_runner, "run_case", crash_or_echo)
+    cases = [{"case_id": f"case_{i}"} for i in range(6)]
+    cases[1]["crash"] = True
+    output_path = str(tmp_path / "results.jsonl")
+    summary = BatchRunner(max_workers=2, output_path=output_path, metrics_path=None).run(cases)
+
+    assert summary["cases"] == 6 and summary["errors"] == 1 and summary["worker_restarts"] == 1
+    with open(output_path) as f:
+        results = {result["case_id"]: result for result in map(json.loads, f)}
+    assert results["case_1"]["error"] == WORKER_DIED_ERROR
+    assert all(results[f"case_{i}"] == {"case_id": f"case_{i}"} for i in (0, 2, 3, 4, 5))
@@ -0,0 +1,46 @@
+import threading
+import time
+import numpy as np
+import pytest
+from defect_detector import DEFECT_CLASSES, MicroBatcher, StubDefectBackend
+
+def _images(n):
+    return np.zeros((n, 224, 224, 3), dtype=np.uint8)
+
+def _backend():
+    backend = StubDefectBackend()
+    backend.load()
+    return backend
+
+def test_close_flushes_a_partial_batch():
+    # Nothing would send these before max_wait; close() must not wait for it (or hang)
+    batcher = MicroBatcher(_backend(), max_batch_size=16, max_wait_ms=60_000, timeout=5)
+    first, carried = batcher.submit(_images(10)), batcher.submit(_images(10)) # the second starts a new batch
+    started = time.perf_counter()
+    batcher.close()
+    assert time.perf_counter() - started < 5
+    assert first.result(0).shape == carried.result(0).shape == (10, len(DEFECT_CLASSES))
+    with pytest.raises(RuntimeError):
+        batcher.submit(_images(1))
+
+class StuckBackend:
+    def __init__(self):
+        self.release = threading.Event()
+
+    def predict(self, batch):
+        self.release.wait()
+        return np.zeros((len(batch), len(DEFECT_CLASSES)))
+
+def test_close_gives_up_on_a_stuck_backend():
+    backend = StuckBackend()
+    batcher = MicroBatcher(backend, max_batch_size=1, max_wait_ms=0, timeout=0.2)
+    running, waiting = batcher.submit(_images(1)), batcher.submit(_images(1))
+    time.sleep(0.05) # let the first batch reach the backend
+    batcher.close()
+    assert isinstance(waiting.exception(0), TimeoutError)
+    with pytest.raises(TimeoutError):
+        running.result(0.05)
+    backend.release.set()
+    assert running.result(5).shape == (1, len(DEFECT_CLASSES))
+    batcher._thread.join(5)
+    assert not batcher._thread.is_alive()
@@ -0,0 +1,38 @@
+import pytest
+from config import Config
+from data_integrator import DataIntegrator
+from feature_record import FeatureBatch
+from rule_engine import RuleEngine
+
+def test_missing_foundation_cracks_is_unknown():
+    integrator, rules = DataIntegrator(), RuleEngine(Config.UNDERWRITING_RULES)
+    missing = integrator.integrate_record({"roof_condition_classified": "good"}, {})
+    assert missing.get("text_foundation_cracks_detected") == "unknown"
+    assert "foundation_risk" not in rules.apply_rules(missing)["risk_flags"]
+
+    no_cracks = integrator.integrate_record({"foundation_cracks_detected": "no"}, {})
+    assert no_cracks.get("text_foundation_cracks_detected") == "no"
+    assert rules.apply_rules(no_cracks)["risk_flags"]["foundation_risk"] == "LOW_RISK"
+    assert missing.foundation_cracks != no_cracks.foundation_cracks
+
+def test_unknown_foundation_cracks_encoding():
+    batch = FeatureBatch.from_columns({"text_foundation_cracks_detected": [None, "no", "yes"]})
+    columns = ["text_foundation_cracks_detected_unknown", "text_foundation_cracks_detected_no",
+               "text_foundation_cracks_detected_yes"]
+    assert batch.to_ml_matrix(columns).tolist() == [[1, 0, 0], [0, 1, 0], [0, 0, 1]]
+
+def test_from_columns_matches_integrate_record():
+    integrator = DataIntegrator()
+    cases = [
+        ({"roof_condition_classified": "good", "foundation_cracks_detected": "yes", "square_footage": "1,850",
+          "year_built": "1985", "flood_zone": "medium"}, {"overall_condition_ai": "poor", "num_defects": 2}),
+        ({"roof_condition_classified": "fair", "foundation_cracks_detected": "no"},
+         {"overall_condition_ai": "good", "num_defects": 0}),
+    ]
+    expected = FeatureBatch.from_records([integrator.integrate_record(text, image) for text, image in cases]).values
+    rows = [integrator.integrate_data(text, image) for text, image in cases]
+    assert rows[0]["multimodal_roof_conflict"] is True
+    columns = {key: [row.get(key) for row in rows] for key in rows[0]}
+    assert FeatureBatch.from_columns(columns).values.tolist() == expected.tolist()
+    pd = pytest.importorskip("pandas")
+    assert FeatureBatch.from_columns(pd.DataFrame(rows)).values.tolist() == expected.tolist()
@@ -0,0 +1,64 @@
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pytest
+from ml_risk_model import MLRiskModel
+from benchmarks.bench_forest_scorer import synthetic_features
+
+def _sklearn_model(model):
+    sklearn_model = MLRiskModel(model.model_path, use_compiled=False)
+    sklearn_model.model, sklearn_model.feature_columns = model.model, model.feature_columns
+    return sklearn_model
+
+@pytest.mark.parametrize("n", [1, 7, 500])
+def test_compiled_forest_matches_sklearn(forest_model, n):
+    X = synthetic_features(n, seed=n).to_ml_matrix(forest_model.feature_columns)
+    compiled = forest_model.compiled_forest()
+    assert compiled is not None
+
+    labels, probabilities = _sklearn_model(forest_model).predict_batch(X, n_jobs=1)
+    compiled_probabilities = compiled.predict_proba(X)
+    assert np.array_equal(compiled_probabilities, probabilities)
+    assert np.array_equal(forest_model.classes.take(compiled_probabilities.argmax(axis=1)), labels)
+
+def test_predict_risk_matches_predict_batch(forest_model):
+    batch = synthetic_features(50, seed=3)
+    labels, probabilities = forest_model.predict_batch(batch.to_ml_matrix(forest_model.feature_columns))
+    for i in range(len(batch)):
+        prediction = forest_model.predict_risk(batch.record(i))
+        assert prediction["predicted_label"] == labels[i]
+        assert list(prediction["probabilities"].values()) == pytest.approx(list(probabilities[i]), abs=0)
+
+def test_saved_model_scores_the_same(forest_model, tmp_path):
+    X = synthetic_features(200, seed=5).to_ml_matrix(forest_model.feature_columns)
+    expected = forest_model.predict_batch(X)[1]
+    saved = MLRiskModel(str(tmp_path / "risk_scorer_model.pkl"))
+    saved.model, saved.feature_columns = forest_model.model, forest_model.feature_columns
+    saved.save_model(model_version="test")
+
+    loaded = MLRiskModel(str(tmp_path / "risk_scorer_model.pkl"))
+    assert loaded.load_model()
+    assert loaded.model_hash == saved.model_hash
+    assert np.array_equal(loaded.predict_batch(X)[1], expected)
+
+def test_predict_batch_leaves_shared_model_alone(forest_model):
+    # The service's scoring threads share one MLRiskModel and ask for different n_jobs
+    X = synthetic_features(300, seed=9).to_ml_matrix(forest_model.feature_columns)
+    sklearn_model = _sklearn_model(forest_model)
+    original_n_jobs = sklearn_model.model.n_jobs
+    expected = sklearn_model.predict_batch(X, n_jobs=1)[1]
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        results = list(pool.map(lambda n_jobs: sklearn_model.predict_batch(X, n_jobs=n_jobs)[1], [1, 2, -1, 3] * 4))
+    assert sklearn_model.model.n_jobs == original_n_jobs
+    assert all(np.array_equal(probabilities, expected) for probabilities in results)
+
+def test_saved_estimator_stays_mapped_until_used(forest_model, tmp_path):
+    saved = MLRiskModel(str(tmp_path / "risk_scorer_model.pkl"))
+    saved.model, saved.feature_columns = forest_model.model, forest_model.feature_columns
+    saved.save_model(model_version="test")
+
+    loaded = MLRiskModel(str(tmp_path / "risk_scorer_model.pkl"), use_compiled=True)
+    assert loaded.load_model()
+    # Scored with the compiled arrays; the estimator's pickle is a view of the file, not a private copy
+    assert isinstance(loaded._estimator_pickle, np.memmap)
+    assert loaded.model.classes_.tolist() == forest_model.model.classes_.tolist()
+    assert loaded._estimator_pickle is None
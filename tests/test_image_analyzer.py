@@ -0,0 +1,49 @@
+import numpy as np
+from config import Config
+from defect_detector import DEFECT_CLASSES, StubDefectBackend
+from image_analyzer import ImageAnalyzer
+
+class NoDefectBackend(StubDefectBackend):
+    """Never finds a defect, so analysis only stops at the photo budget."""
+    def predict(self, batch):
+        return np.zeros((len(batch), len(DEFECT_CLASSES)))
+
+def _photos(n):
+    rng = np.random.default_rng(0)
+    return [rng.integers(150, 256, (240, 320, 3), dtype=np.uint8) for _ in range(n)]
+
+def _analyzer(max_photos):
+    return ImageAnalyzer(backend=NoDefectBackend(), micro_batching=False, triage=False, dedup_max_distance=None,
+                         max_photos=max_photos)
+
+def test_photo_budget_not_a_batch_multiple():
+    max_photos = Config.DEFECT_MAX_BATCH_SIZE + 4
+    result = _analyzer(max_photos).analyze_property_images(_photos(max_photos + 4))
+    assert result["photo_stats"]["analyzed"] == max_photos
+    assert result["photo_stats"]["early_exit"] == "photo_budget"
+
+def test_within_budget_has_no_early_exit():
+    result = _analyzer(8).analyze_property_images(_photos(8))
+    assert result["photo_stats"]["analyzed"] == 8
+    assert result["photo_stats"]["early_exit"] is None
+    assert result["overall_condition_ai"] == "good" and result["num_defects"] == 0
+
+def test_no_photos_has_summary_keys():
+    result = _analyzer(8).analyze_property_images([])
+    assert result["overall_condition_ai"] == "unknown"
+    assert result["num_defects"] == 0 and result["defects_found"] == []
+
+def test_unreadable_image_has_summary_keys():
+    ok, unreadable = _analyzer(8).analyze_images_batch([_photos(1)[0], "/nonexistent/photo.jpg"])
+    assert set(unreadable) == set(ok)
+    assert unreadable["overall_condition_ai"] == "unknown" and unreadable["num_defects"] == 0
+
+def test_triage_thresholds_are_part_of_the_version():
+    default = ImageAnalyzer(backend=NoDefectBackend(), micro_batching=False)
+    stricter = ImageAnalyzer(backend=NoDefectBackend(), micro_batching=False,
+                             triage_thresholds=dict(default.triage_thresholds, min_side=400))
+    assert default.case_version != stricter.case_version
+    # A photo below the stricter minimum side is skipped, not analyzed
+    photo = _photos(1)[0] # 320x240
+    assert default.analyze_property_images([photo])["photo_stats"]["analyzed"] == 1
+    assert stricter.analyze_property_images([photo])["photo_stats"]["skipped"] == {"too_small": 1}
@@ -0,0 +1,76 @@
+import io
+import os
+import numpy as np
+from PIL import Image
+import ocr_parser
+from ocr_parser import LazyPDFImage, OCRParser
+
+def _multi_page_case(corpus):
+    directory, manifest = corpus
+    case = next(case for case in manifest["cases"] if len(case["layout"]) >= 2)
+    return os.path.join(directory, case["report"]), len(case["layout"])
+
+def fail_first_page(pdf_path, page_index, dpi, lang, tesseract_cmd):
+    if page_index == 0:
+        raise RuntimeError("tesseract is not installed")
+    return f"OCR text of page {page_index + 1}"
+
+def test_failed_ocr_page_falls_back_to_its_text_layer(corpus, tmp_path, monkeypatch):
+    report_path, n_pages = _multi_page_case(corpus)
+    monkeypatch.setattr(ocr_parser, "_ocr_pdf_page", fail_first_page)
+    first_page_layer = next(OCRParser(ocr_workers=1, cache_dir=None).iter_pdf_pages(report_path))[1]
+    # Every page counts as scanned, so every page goes to OCR
+    parser = OCRParser(ocr_workers=1, cache_dir=str(tmp_path / "cache"), min_text_chars=10**6)
+    text, _ = parser.extract_text_from_pdf(report_path, lazy_images=True, ocr_fallback=True)
+
+    stats = parser.last_ocr_stats
+    assert stats["pages"] == n_pages and stats["error"] is None
+    assert stats["ocr_failed_pages"] == 1 and stats["ocr_errors"][0].startswith("page 1: RuntimeError")
+    assert first_page_layer in text
+    assert all(f"OCR text of page {page}" in text for page in range(2, n_pages + 1))
+    # Only the pages OCR actually read are cached
+    cached = [name for _, _, names in os.walk(tmp_path / "cache") for name in names]
+    assert len(cached) == n_pages - 1
+
+def _pdf_with_logo_and_photo(path):
+    from reportlab.lib.pagesizes import letter
+    from reportlab.lib.utils import ImageReader
+    from reportlab.pdfgen import canvas
+    rng = np.random.default_rng(0)
+    logo = Image.fromarray(rng.integers(0, 255, (40, 120, 3), dtype=np.uint8))
+    photo = Image.fromarray(rng.integers(0, 255, (300, 400, 3), dtype=np.uint8))
+    def jpeg(image):
+        buffer = io.BytesIO()
+        image.save(buffer, format="JPEG") # embedded as-is, like photos in real reports
+        buffer.seek(0)
+        return ImageReader(buffer)
+    pdf = canvas.Canvas(str(path), pagesize=letter)
+    pdf.drawString(72, 720, "Subject property photos")
+    pdf.drawImage(jpeg(logo), 72, 650, 120, 40)
+    pdf.drawImage(jpeg(photo), 72, 300, 400, 300)
+    pdf.save()
+
+def test_only_likely_photos_keep_their_stream(tmp_path):
+    path = tmp_path / "report.pdf"
+    _pdf_with_logo_and_photo(path)
+    _, images = OCRParser(cache_dir=None).extract_text_from_pdf(str(path), lazy_images=True)
+    logo, photo = sorted(images, key=lambda image: image.size)
+    assert logo.size == (120, 40) and logo._stream is None
+    assert photo.size == (400, 300) and photo._stream is not None
+    assert photo.load().size == (400, 300) and photo._stream is None # released once read
+    assert logo.load().size == (120, 40) # still readable, from the file
+
+def test_small_pdf_images_are_skipped_without_decoding(tmp_path, monkeypatch):
+    from defect_detector import StubDefectBackend
+    from image_analyzer import ImageAnalyzer
+    path = tmp_path / "report.pdf"
+    _pdf_with_logo_and_photo(path)
+    _, images = OCRParser(cache_dir=None).extract_text_from_pdf(str(path), lazy_images=True)
+    loaded = []
+    original_load = LazyPDFImage.load
+    monkeypatch.setattr(LazyPDFImage, "load", lambda self: loaded.append(self.size) or original_load(self))
+    analyzer = ImageAnalyzer(backend=StubDefectBackend(), micro_batching=False, decode_workers=1)
+    photo_stats = analyzer.analyze_property_images(images)["photo_stats"]
+    assert loaded == [(400, 300)]
+    assert photo_stats["skipped"] == {"too_small": 1} and photo_stats["photos"] == 2
+    assert photo_stats["analyzed"] == 1 and photo_stats["unreadable"] == 0
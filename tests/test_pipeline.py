@@ -0,0 +1,46 @@
+import os
+from feature_record import FeatureBatch
+from main import build_components, run_underwriting_case
+from rule_engine import RuleEngine
+
+def test_corpus_cases(corpus, forest_model, pipeline_config):
+    directory, manifest = corpus
+    components = build_components(ocr_workers=1, ml_model=forest_model)
+    try:
+        outputs = [run_underwriting_case(os.path.join(directory, case["report"]), os.path.join(directory, case["photo"]),
+                                         components, case["case_id"]) for case in manifest["cases"]]
+    finally:
+        components["image_analyzer"].close()
+        components["ocr_parser"].close()
+
+    for case, result in zip(manifest["cases"], outputs):
+        assert result["case_id"] == case["case_id"]
+        assert result["parsed_text"]["property_address"] == case["fields"]["property_address"]
+    # The batch paths (used by re-scoring) decide these cases exactly as the per-case pipeline did
+    batch = FeatureBatch.from_records([result["features"] for result in outputs])
+    rules = RuleEngine.batch_to_records(components["rule_engine"].apply_rules_batch(batch.rule_columns()))
+    assert rules == [result["rule_based_assessment"] for result in outputs]
+    labels = forest_model.predict_batch(batch.to_ml_matrix(forest_model.feature_columns))[0]
+    assert list(labels) == [result["ml_prediction"]["predicted_label"] for result in outputs]
+
+def test_case_with_failed_ocr_is_degraded(corpus, forest_model, pipeline_config, monkeypatch):
+    import ocr_parser
+    def no_tesseract(*args):
+        raise RuntimeError("tesseract is not installed")
+    monkeypatch.setattr(ocr_parser, "_ocr_pdf_page", no_tesseract)
+    monkeypatch.setattr(pipeline_config, "OCR_FALLBACK_ENABLED", True)
+    directory, manifest = corpus
+    case = manifest["cases"][0]
+    components = build_components(ocr_workers=1, ml_model=forest_model)
+    components["ocr_parser"].min_text_chars = 10**6 # every page goes to OCR
+    try:
+        degraded = run_underwriting_case(os.path.join(directory, case["report"]), None, components, case["case_id"])
+        components["ocr_parser"].min_text_chars = 0
+        clean = run_underwriting_case(os.path.join(directory, case["report"]), None, components, case["case_id"])
+    finally:
+        components["image_analyzer"].close()
+        components["ocr_parser"].close()
+    assert degraded["decision"] and len(degraded["degraded"]) == len(case["layout"])
+    assert clean["degraded"] == []
+    # Falling back to the text layer, the case reads the same fields as a clean run
+    assert degraded["parsed_text"] == clean["parsed_text"]
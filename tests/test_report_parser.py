@@ -0,0 +1,81 @@
+import re
+import pytest
+from ocr_parser import OCRParser
+from report_parser import FieldRegistry, ReportParser
+from benchmarks.bench_report_parser import build_document, build_parser, legacy_parse
+
+@pytest.mark.parametrize("num_fields,num_pages", [(6, 1), (25, 2), (100, 1)])
+def test_compiled_extractor_matches_search(num_fields, num_pages):
+    parser = build_parser(num_fields)
+    text = build_document(num_pages, num_fields)
+    assert parser._get_extractor().extract(text) == legacy_parse(parser.patterns, text)
+
+def test_corpus_reports(corpus):
+    directory, manifest = corpus
+    ocr_parser = OCRParser(ocr_workers=1, cache_dir=None)
+    parser = ReportParser()
+    try:
+        for case in manifest["cases"]:
+            text, _ = ocr_parser.extract_text_from_pdf(f"{directory}/{case['report']}", lazy_images=True,
+                                                       ocr_fallback=False)
+            parsed = parser.parse_text(text)
+            assert parser._get_extractor().extract(text) == legacy_parse(parser.patterns, text)
+            for field, value in case["fields"].items():
+                assert (parsed.get(field) or "").strip() == value, field
+    finally:
+        ocr_parser.close()
+
+# Labels of every shape the extractor treats differently: plain literals,
+# shared prefixes, optional suffixes, leading groups, top-level alternation
+# (in the label or the value), classes containing | and no literal at all
+LABELS = [
+    ("gla", r"total|gross living area", r"[:\s]*(\d+)"),
+    ("either", r"(?:lot|site)\s+size|acreage", r"[:\s]*([\d\.]+)"),
+    ("zoning", r"zoning", r"[:\s]*(\w+)|n/a"),
+    ("year", r"year\s+built", r"[:\s]*(\d{4})"),
+    ("years", r"years?\s+remaining", r"[:\s]*(\d+)"),
+    ("total", r"total\s+rooms", r"[:\s]*(\d+)"),
+    ("subtotal", r"subtotal", r"[:\s]*(\d+)"),
+    ("grouped", r"(?:bed|bath)rooms", r"[:\s]*(\d+)"),
+    ("pipe_class", r"[|]\s*code", r"[:\s]*(\w+)"),
+    ("escaped_pipe", r"unit\|apt", r"[:\s]*(\w+)"),
+    ("no_literal", r"\bcounty\b", r"[:\s]*(\w+)"),
+    ("optional_value", r"garage", r"(?:[:\s]*(\d+)\s+cars?)?"),
+]
+
+TEXTS = [
+    "Gross living area: 1500\nTotal rooms: 7\n",
+    "Total: 12\nGross living area: 1500\nSubtotal 40\n",
+    "Site size: 0.25\nAcreage 3.5\nZoning: R1\nYears remaining: 30\nYear built: 1985\n",
+    "Zoning n/a\nBedrooms: 3\nBathrooms 2\n| code: X9\nUnit|Apt 4B\nCounty: Dane\n",
+    "garage\nGarage: 2 cars\nLot size 1.2\nyear remaining 4\n",
+    "Nothing to see here.\n",
+]
+
+def _search_each_field(labels, text):
+    found = {}
+    for name, label, value in labels:
+        match = re.search(label + value, text, re.IGNORECASE)
+        found[name] = match.group(1).strip() if match and match.group(1) is not None else None
+    return found
+
+@pytest.mark.parametrize("text", TEXTS)
+def test_registered_labels_match_search(text):
+    registry = FieldRegistry()
+    for name, label, value in LABELS:
+        registry.register(name, label, value)
+    assert registry.compile().extract(text) == _search_each_field(LABELS, text)
+
+def test_top_level_alternation_label():
+    parser = ReportParser()
+    parser.register_field("gla", r"total|gross living area", r"[:\s]*(\d+)")
+    assert parser.parse_text("Gross living area: 1500")["gla"] == "1500"
+
+def test_foundation_cracks_unknown_without_foundation_text():
+    from data_integrator import DataIntegrator
+    parser = ReportParser()
+    missing = parser.parse_text("Year Built: 1985\nRoof Condition: good\n")
+    assert missing["foundation_cracks_detected"] is None
+    assert DataIntegrator().integrate_record(missing, {}).get("text_foundation_cracks_detected") == "unknown"
+    assert parser.parse_text("Foundation Condition: minor cracks\n")["foundation_cracks_detected"] == "yes"
+    assert parser.parse_text("Foundation Condition: solid\n")["foundation_cracks_detected"] == "no"
@@ -0,0 +1,66 @@
+import numpy as np
+from config import Config
+from feature_store import FeatureStore
+from rescoring import Rescorer, latest_per_case
+from rule_engine import RuleEngine
+from benchmarks.bench_forest_scorer import fit_model, synthetic_features
+from benchmarks.bench_rescoring import CHANGED_RULES, build_store, per_case
+
+def _store(tmp_path, forest_model, n=400):
+    forest_model.model_version, forest_model.model_hash = "test", "test"
+    batch = synthetic_features(n, seed=1)
+    build_store(str(tmp_path / "store"), batch, RuleEngine(Config.UNDERWRITING_RULES), forest_model)
+    return batch, str(tmp_path / "store")
+
+def test_rescoring_matches_per_case(tmp_path, forest_model):
+    batch, root = _store(tmp_path, forest_model)
+    new_rules = RuleEngine(CHANGED_RULES)
+    output_path = str(tmp_path / "changed.jsonl")
+    summary = Rescorer(FeatureStore(root), new_rules, forest_model, output_path=output_path).run()
+    assert summary["rescored"] == len(batch)
+    assert summary["changed"] > 0
+
+    latest = Rescorer(FeatureStore(root), new_rules, forest_model, output_path=output_path).stored_decisions()
+    latest = latest.sort_by("case_id")
+    assert latest.column("decision").to_pylist() == per_case(batch, new_rules, forest_model)
+    assert set(latest.column("rule_version").to_pylist()) == {new_rules.version}
+
+    again = Rescorer(FeatureStore(root), new_rules, forest_model, output_path=output_path).run()
+    assert again["rescored"] == 0 and again["up_to_date"] == len(batch)
+
+def test_rules_only_keeps_stored_model_results(tmp_path, forest_model):
+    batch, root = _store(tmp_path, forest_model)
+    before = FeatureStore(root).scan("decisions").sort_by("case_id")
+    Rescorer(FeatureStore(root), RuleEngine(CHANGED_RULES), forest_model, rescore_model=False,
+             output_path=str(tmp_path / "changed.jsonl")).run()
+    after = Rescorer(FeatureStore(root), RuleEngine(CHANGED_RULES), forest_model,
+                     output_path=str(tmp_path / "x.jsonl")).stored_decisions().sort_by("case_id")
+    for column in ("ml_label", "ml_probabilities", "model_version", "model_hash"):
+        assert after.column(column).to_pylist() == before.column(column).to_pylist()
+
+def test_new_model_rescored(tmp_path, forest_model):
+    batch, root = _store(tmp_path, forest_model)
+    new_model = fit_model(n_cases=1000, n_estimators=5)
+    new_model.model_version, new_model.model_hash = "new", "new"
+    summary = Rescorer(FeatureStore(root), RuleEngine(Config.UNDERWRITING_RULES), new_model, rescore_rules=False,
+                       output_path=str(tmp_path / "changed.jsonl")).run()
+    assert summary["rescored"] == len(batch)
+    latest = FeatureStore(root).scan("decisions", ["case_id", "processed_at", "ml_label", "model_hash"])
+    latest = latest_per_case(latest)
+    labels = new_model.predict_batch(batch.to_ml_matrix(new_model.feature_columns))[0]
+    assert latest.column("ml_label").to_pylist() == [str(label) for label in labels]
+    assert np.all(latest.column("model_hash").to_numpy(zero_copy_only=False) == "new")
+
+def test_changed_cases_file_per_run(tmp_path, forest_model):
+    batch, root = _store(tmp_path, forest_model)
+    output_path = str(tmp_path / "out" / "changed.jsonl")
+    summary = Rescorer(FeatureStore(root), RuleEngine(CHANGED_RULES), forest_model, output_path=output_path).run()
+    assert summary["output_path"] != output_path
+    with open(summary["output_path"]) as f:
+        assert len(f.readlines()) == summary["changed"]
+
+    # Nothing changes on a second run: no new file, and the first one is left alone
+    again = Rescorer(FeatureStore(root), RuleEngine(CHANGED_RULES), forest_model, output_path=output_path).run()
+    assert again["changed"] == 0 and again["output_path"] is None
+    with open(summary["output_path"]) as f:
+        assert len(f.readlines()) == summary["changed"]
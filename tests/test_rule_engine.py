@@ -0,0 +1,62 @@
+import os
+from datetime import date
+import pytest
+import rule_engine
+from config import Config
+from feature_record import FeatureBatch
+from rule_engine import RuleEngine
+from benchmarks.bench_forest_scorer import synthetic_features
+from benchmarks.bench_rule_engine import synthetic_cases
+
+RULES_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "underwriting_rules.example.json")
+
+def _engines():
+    engines = [RuleEngine(Config.UNDERWRITING_RULES)]
+    if os.path.exists(RULES_FILE):
+        engines.append(RuleEngine(rules_path=RULES_FILE))
+    return engines
+
+@pytest.mark.parametrize("engine", _engines(), ids=lambda engine: engine.version)
+def test_batch_matches_per_case(engine):
+    columns = synthetic_cases(2000)
+    cases = [{name: column[i] for name, column in columns.items()} for i in range(2000)]
+    batch = engine.apply_rules_batch(columns)
+    assert RuleEngine.batch_to_records(batch) == [engine.apply_rules(case) for case in cases]
+
+def test_batch_matches_per_case_on_feature_records():
+    engine = RuleEngine(Config.UNDERWRITING_RULES)
+    batch = synthetic_features(1000, seed=11)
+    records = [batch.record(i) for i in range(len(batch))]
+    assert FeatureBatch.from_records(records).values.tolist() == batch.values.tolist()
+    expected = [engine.apply_rules(record) for record in records]
+    assert RuleEngine.batch_to_records(engine.apply_rules_batch(batch.rule_columns())) == expected
+
+def test_reference_year_is_part_of_the_version():
+    assert (RuleEngine(Config.UNDERWRITING_RULES, reference_year=2024).version
+            != RuleEngine(Config.UNDERWRITING_RULES, reference_year=2025).version)
+
+def test_engine_moves_on_with_the_calendar_year(monkeypatch):
+    engine = RuleEngine(Config.UNDERWRITING_RULES)
+    this_year = date.today().year
+    case = {"text_year_built": str(this_year - 50)} # exactly 50 years old: not yet over 50
+    version = engine.version
+    assert "property_age_risk" not in engine.apply_rules(case)["risk_flags"]
+
+    class NextYear(date):
+        @classmethod
+        def today(cls):
+            return date(this_year + 1, 1, 1)
+    monkeypatch.setattr(rule_engine, "date", NextYear)
+    assert engine.apply_rules(case)["risk_flags"]["property_age_risk"] == "MEDIUM_RISK"
+    assert engine.version != version
+    assert engine.apply_rules_batch({"text_year_built": [case["text_year_built"]]})["rule_version"] == engine.version
+
+def test_missing_rules_file_is_an_error(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        RuleEngine(rules_path=str(tmp_path / "missing.json"))
+
+def test_rules_source_is_logged(caplog, capsys):
+    with caplog.at_level("INFO", logger="rule_engine"):
+        engine = RuleEngine()
+    assert f"loaded from Config.UNDERWRITING_RULES (version {engine.version})" in caplog.text
+    assert capsys.readouterr().out == ""
@@ -0,0 +1,55 @@
+import asyncio
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import batch_runner
+import service as service_module
+from batch_runner import WORKER_DIED_ERROR
+from service import UnderwritingService
+
+def crash_or_echo(case):
+    """Stands in for run_case in the workers: a "crash" case kills its worker process."""
+    if case.get("crash"):
+        os._exit(1)
+    time.sleep(0.5) # still running when the crash breaks the pool
+    return {"case_id": case["case_id"]}
+
+def spawn_pool(max_workers, preload=None, start_method=None):
+    return ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn"))
+
+def test_crashing_case_fails_alone(tmp_path, monkeypatch):
+    for module in (service_module, batch_runner):
+        monkeypatch.setattr(module, "create_worker_pool", spawn_pool)
+        monkeypatch.setattr(module, "run_case", crash_or_echo)
+    service = UnderwritingService(process_workers=2, spool_dir=str(tmp_path))
+    service.process_pool = first_pool = spawn_pool(2)
+    service.thread_pool = ThreadPoolExecutor(max_workers=4)
+    service.feature_store = None
+    cases = [{"case_id": "ok_1"}, {"case_id": "poison", "crash": True}, {"case_id": "ok_2"}]
+
+    async def main():
+        for case in cases:
+            service.pending += 1
+            service.jobs[case["case_id"]] = {"job_id": case["case_id"], "status": "queued", "submitted_at": 0.0}
+        await asyncio.gather(*(service._run_job(case["case_id"], case, str(tmp_path / case["case_id"]))
+                               for case in cases))
+        # The replacement pool takes new cases
+        service.pending += 1
+        service.jobs["after"] = {"job_id": "after", "status": "queued", "submitted_at": 0.0}
+        await service._run_job("after", {"case_id": "after"}, str(tmp_path / "after"))
+
+    try:
+        asyncio.run(main())
+        assert service.jobs["poison"]["status"] == "failed"
+        assert service.jobs["poison"]["result"]["error"] == WORKER_DIED_ERROR
+        for job_id in ("ok_1", "ok_2", "after"):
+            assert service.jobs[job_id]["status"] == "done", service.jobs[job_id]
+            assert service.jobs[job_id]["result"] == {"case_id": job_id}
+        assert service.process_pool is not first_pool
+        assert service.metrics.counters["worker_pool_restarts"] == 1
+        assert service.metrics.counters["worker_crash_cases"] == 1
+        assert "worker_pool_restarts_total 1" in service.metrics.to_prometheus()
+    finally:
+        service.process_pool.shutdown()
+        service.thread_pool.shutdown()
@@ -0,0 +1,104 @@
+import os
+import shutil
+import sqlite3
+from main import build_components, run_underwriting_case
+from result_cache import MemoryLRUStore, SQLiteStore, StageCache
+
+def _components(forest_model):
+    components = build_components(ocr_workers=1, ml_model=forest_model)
+    components["cache"] = StageCache([MemoryLRUStore()])
+    return components
+
+def _close(components):
+    components["image_analyzer"].close()
+    components["ocr_parser"].close()
+
+def _case_with_embedded_photo(corpus):
+    directory, manifest = corpus
+    return next(case for case in manifest["cases"] if "photo" in case["layout"])
+
+def test_failed_extraction_is_not_cached(corpus, forest_model, pipeline_config, monkeypatch):
+    directory, manifest = corpus
+    case = manifest["cases"][0]
+    report_path = os.path.join(directory, case["report"])
+    components = _components(forest_model)
+    ocr_parser = components["ocr_parser"]
+    iter_pdf_pages = ocr_parser.iter_pdf_pages
+
+    def crash_after_first_page(pdf_path, max_workers=1):
+        pages = iter_pdf_pages(pdf_path, max_workers)
+        yield next(pages)
+        raise RuntimeError("decoder crashed")
+
+    try:
+        monkeypatch.setattr(ocr_parser, "iter_pdf_pages", crash_after_first_page)
+        run_underwriting_case(report_path, None, components, case["case_id"])
+        assert components["cache"].metrics()["ocr"] == {"hits": 0, "misses": 1, "hit_rate": 0.0}
+        assert components["last_case_metrics"]["counters"].get("ocr_errors") == 1
+
+        # Resubmitted once extraction works again: extracted afresh, not served the partial text
+        monkeypatch.setattr(ocr_parser, "iter_pdf_pages", iter_pdf_pages)
+        result = run_underwriting_case(report_path, None, components, case["case_id"])
+        assert components["cache"].metrics()["ocr"]["misses"] == 2
+        assert result["parsed_text"]["property_address"] == case["fields"]["property_address"]
+
+        run_underwriting_case(report_path, None, components, case["case_id"])
+        assert components["cache"].metrics()["ocr"]["hits"] == 1
+    finally:
+        _close(components)
+
+def test_cached_report_images_follow_the_report(corpus, forest_model, pipeline_config, tmp_path):
+    directory, _ = corpus
+    case = _case_with_embedded_photo(corpus)
+    photo_path = os.path.join(directory, case["photo"])
+    components = _components(forest_model)
+    try:
+        # As in the service: each job's files sit in a spool directory deleted afterwards
+        first = tmp_path / "job1"
+        first.mkdir()
+        shutil.copy(os.path.join(directory, case["report"]), first / "report.pdf")
+        expected = run_underwriting_case(str(first / "report.pdf"), None, components, case["case_id"])
+        shutil.rmtree(first)
+
+        # Same report, new photo: OCR is a cache hit, the image stage runs again
+        second = tmp_path / "job2"
+        second.mkdir()
+        shutil.copy(os.path.join(directory, case["report"]), second / "report.pdf")
+        shutil.copy(photo_path, second / "photo.jpg")
+        result = run_underwriting_case(str(second / "report.pdf"), str(second / "photo.jpg"), components, case["case_id"])
+        assert components["cache"].metrics()["ocr"]["hits"] == 1
+        stats = result["image_analysis"]["photo_stats"]
+        assert stats["unreadable"] == 0
+        assert stats["photos"] == expected["image_analysis"]["photo_stats"]["photos"] + 1
+    finally:
+        _close(components)
+
+def _last_access(db_path):
+    with sqlite3.connect(db_path) as conn:
+        return dict(conn.execute("SELECT key, last_access FROM cache"))
+
+def test_sqlite_reads_write_access_times_in_batches(tmp_path):
+    db_path = str(tmp_path / "cache.sqlite3")
+    store = SQLiteStore(db_path, flush_entries=3, flush_interval=3600)
+    for key in "abc":
+        store.put(key, key.encode() * 10)
+    stored = _last_access(db_path)
+    assert store.get("a") == b"a" * 10 and store.get("b") == b"b" * 10
+    assert _last_access(db_path) == stored # hits alone don't touch the database
+    store.get("a")
+    assert _last_access(db_path) == stored # still two distinct keys
+    store.get("c")
+    flushed = _last_access(db_path)
+    assert all(flushed[key] > stored[key] for key in "abc")
+    store.get("b")
+    store.close()
+    assert _last_access(db_path)["b"] > flushed["b"]
+
+def test_sqlite_eviction_sees_unflushed_hits(tmp_path):
+    store = SQLiteStore(str(tmp_path / "cache.sqlite3"), max_bytes=250, flush_entries=100, flush_interval=3600)
+    store.put("old", b"x" * 100)
+    store.put("newer", b"y" * 100)
+    store.get("old") # the most recently used now, though only in memory
+    store.put("newest", b"z" * 100)
+    assert store.get("old") is not None and store.get("newer") is None
+    store.close()
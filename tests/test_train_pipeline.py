@@ -0,0 +1,64 @@
+import time
+import pytest
+from config import Config
+from feature_store import FeatureStore
+from ml_risk_model import MLRiskModel
+from rescoring import Rescorer
+from rule_engine import RuleEngine
+from train_pipeline import TrainingPipeline
+from benchmarks.bench_forest_scorer import synthetic_features
+from benchmarks.bench_rescoring import CHANGED_RULES, build_store
+
+def test_labels_are_required(tmp_path):
+    with pytest.raises(ValueError):
+        TrainingPipeline(FeatureStore(str(tmp_path / "store")))
+
+def test_decision_labels_come_from_the_latest_decision(tmp_path, forest_model):
+    forest_model.model_version, forest_model.model_hash = "test", "test"
+    root = str(tmp_path / "store")
+    build_store(root, synthetic_features(300, seed=2), RuleEngine(Config.UNDERWRITING_RULES), forest_model)
+    # A second decisions row per case, decided by the changed rules
+    Rescorer(FeatureStore(root), RuleEngine(CHANGED_RULES), forest_model, rescore_model=False,
+             output_path=str(tmp_path / "changed.jsonl")).run()
+    latest = Rescorer(FeatureStore(root), RuleEngine(CHANGED_RULES), forest_model,
+                      output_path=str(tmp_path / "x.jsonl")).stored_decisions()
+    expected = dict(zip(latest.column("case_id").to_pylist(), latest.column("decision").to_pylist()))
+
+    pipeline = TrainingPipeline(FeatureStore(root), decisions_label_column="decision")
+    labels = pipeline.load_labels()
+    assert dict(zip(labels.column("case_id").to_pylist(), labels.column("label").to_pylist())) == expected
+
+def test_labels_file(tmp_path):
+    path = tmp_path / "outcomes.csv"
+    path.write_text("case_id,outcome\na,claim\nb,no_claim\na,no_claim\n")
+    pipeline = TrainingPipeline(FeatureStore(str(tmp_path / "store")), labels_path=str(path), label_column="outcome")
+    labels = pipeline.load_labels().sort_by("case_id")
+    assert labels.column("label").to_pylist() == ["no_claim", "no_claim"]
+
+@pytest.mark.parametrize("estimator", ["hist", "sgd"])
+def test_trains_once_per_case_on_its_latest_features(tmp_path, forest_model, estimator):
+    forest_model.model_version, forest_model.model_hash = "test", "test"
+    root = str(tmp_path / "store")
+    engine = RuleEngine(Config.UNDERWRITING_RULES)
+    build_store(root, synthetic_features(200, seed=3), engine, forest_model)
+    time.sleep(0.01) # a later processed_at for the reprocessed cases
+    reprocessed = synthetic_features(200, seed=4)
+    build_store(root, reprocessed, engine, forest_model)
+
+    pipeline = TrainingPipeline(FeatureStore(root), estimator=estimator, decisions_label_column="decision",
+                                test_fraction=0.2, estimator_params={"early_stopping": False})
+    labels = pipeline.with_latest_features(pipeline.load_labels())
+    classes = sorted(set(labels.column("label").to_pylist()))
+    seen = {}
+    for case_ids, batch, _ in pipeline.iter_labelled_batches(labels, classes):
+        for case_id, values in zip(case_ids, batch.values):
+            assert case_id not in seen
+            seen[case_id] = values
+    assert len(seen) == len(reprocessed)
+    assert all((seen[f"case_{i:07d}"] == reprocessed.values[i]).all() for i in range(len(reprocessed)))
+
+    report = pipeline.run(model_path=str(tmp_path / "model.pkl"), model_version="test")
+    assert report["train_rows"] + report["test_rows"] == len(reprocessed)
+    model = MLRiskModel(str(tmp_path / "model.pkl"))
+    assert model.load_model()
+    assert list(model.classes) == report["classes"]
@@ -0,0 +1,303 @@
+import argparse
+import json
+import time
+import zlib
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pacsv
+import pyarrow.parquet as pq
+from config import Config
+from feature_record import FIELDS, ML_FEATURE_COLUMNS
+from feature_store import FeatureStore, latest_per_case
+from instrumentation import max_rss_bytes
+from ml_risk_model import MLRiskModel
+
+ESTIMATORS = ("hist", "forest", "sgd")
+
+def _holdout_mask(case_ids, test_fraction):
+    # Stable per case id, so a case stays on the same side of the split across runs
+    threshold = int(test_fraction * 2**32)
+    return np.fromiter((zlib.crc32(case_id.encode()) < threshold for case_id in case_ids), dtype=bool, count=len(case_ids))
+
+class TrainingPipeline:
+    """
+    Trains MLRiskModel from the feature store without re-running OCR, reading
+    the features table in record batches (memory-mapped Parquet) rather than
+    as one DataFrame.
+
+    Labels come from a CSV/Parquet file with case_id and label columns (e.g.
+    historical claim outcomes). Training on a column of the decisions table
+    instead (decisions_label_column, each case's latest decision) has to be
+    asked for: labels such as overall_rule_based_risk only teach the model to
+    reproduce the rule engine.
+    Each case is trained on once, with its latest features row (a reprocessed
+    case has several), and cases are split into train and holdout sets by a
+    hash of their case id.
+
+    Estimators:
+      hist   - HistGradientBoostingClassifier. Features are streamed into one
+               preallocated float32 matrix (4 bytes per value, the dtype the
+               tree code works in, so the estimator doesn't copy it again)
+               and binned to uint8 internally; multithreaded via OpenMP.
+      forest - RandomForestClassifier over the same float32 matrix with
+               n_jobs parallel tree building. max_samples bounds each
+               tree's bootstrap sample.
+      sgd    - StandardScaler + SGDClassifier(log_loss) trained with
+               partial_fit over the batches: memory stays at one batch, so
+               it scales to books that don't fit in memory.
+
+    run() saves the model through MLRiskModel.save_model, so the artifact
+    carries the feature columns and class labels it was fit with, and
+    returns a report with wall time per phase and peak memory.
+    """
+    def __init__(self, feature_store=None, estimator=Config.TRAIN_ESTIMATOR, feature_columns=None,
+                 labels_path=None, label_column=Config.TRAIN_LABEL_COLUMN,
+                 decisions_label_column=Config.TRAIN_DECISIONS_LABEL_COLUMN, batch_size=Config.TRAIN_BATCH_SIZE,
+                 n_jobs=Config.TRAIN_N_JOBS, test_fraction=Config.TRAIN_TEST_FRACTION, max_rows=None,
+                 start_date=None, end_date=None, epochs=3, random_state=42, estimator_params=None):
+        if estimator not in ESTIMATORS:
+            raise ValueError(f"Unknown estimator '{estimator}', expected one of {ESTIMATORS}")
+        if not labels_path and not decisions_label_column:
+            raise ValueError("No labels: pass labels_path (case_id + outcome file), or decisions_label_column "
+                             "to train on stored decisions")
+        if not labels_path:
+            print(f"Warning: training on decisions column '{decisions_label_column}' instead of real outcomes. "
+                  "The model will learn to reproduce the stored decisions.")
+        self.feature_store = feature_store or FeatureStore()
+        self.estimator = estimator
+        self.feature_columns = list(feature_columns or ML_FEATURE_COLUMNS)
+        self.labels_path = labels_path
+        self.label_column = label_column
+        self.decisions_label_column = decisions_label_column
+        self.batch_size = batch_size
+        self.n_jobs = n_jobs
+        self.test_fraction = test_fraction
+        self.max_rows = max_rows
+        self.start_date = start_date
+        self.end_date = end_date
+        self.epochs = epochs
+        self.random_state = random_state
+        self.estimator_params = estimator_params or {}
+        self.timings = {}
+
+    # --- data ---
+
+    def load_labels(self):
+        """
+        Arrow table (case_id, label), one row per case id: the last row of a
+        labels file, or a case's latest decision (by processed_at).
+        """
+        if not self.labels_path:
+            decisions = self.feature_store.scan("decisions", ["case_id", "processed_at", self.decisions_label_column],
+                                                self.start_date, self.end_date)
+            labels = latest_per_case(decisions).select(["case_id", self.decisions_label_column])
+            return labels.rename_columns(["case_id", "label"]).filter(pc.is_valid(pc.field("label")))
+        if self.labels_path.endswith(".parquet"):
+            labels = pq.read_table(self.labels_path, columns=["case_id", self.label_column], memory_map=True)
+        else:
+            labels = pacsv.read_csv(self.labels_path, convert_options=pacsv.ConvertOptions(
+                include_columns=["case_id", self.label_column],
+                column_types={"case_id": pa.string(), self.label_column: pa.string()}))
+        labels = labels.rename_columns(["case_id", "label"]).filter(pc.is_valid(pc.field("label")))
+        labels = labels.group_by("case_id", use_threads=False).aggregate([("label", "last")])
+        return labels.select(["case_id", "label_last"]).rename_columns(["case_id", "label"])
+
+    def with_latest_features(self, labels):
+        """
+        labels plus the processed_at of each case's latest features row: a case
+        processed (or re-fused) several times is trained on once, with its
+        latest features, however many rows it has in the features table.
+        """
+        latest = latest_per_case(self.feature_store.scan("features", ["case_id", "processed_at"],
+                                                         self.start_date, self.end_date))
+        return labels.join(latest, "case_id", join_type="inner", use_threads=False)
+
+    def iter_labelled_batches(self, labels, classes):
+        """
+        Yields (case_ids, FeatureBatch, label codes) for cases that have a label,
+        from the features rows picked by with_latest_features(labels).
+        """
+        class_set = pa.array(classes, type=pa.string())
+        rows = 0
+        for record_batch in self.feature_store.iter_batches("features", ["case_id", "processed_at"] + FIELDS,
+                                                            self.batch_size, self.start_date, self.end_date):
+            joined = pa.Table.from_batches([record_batch]).join(labels, ["case_id", "processed_at"], join_type="inner",
+                                                                use_threads=False)
+            if self.max_rows is not None:
+                joined = joined.slice(0, max(0, self.max_rows - rows))
+            if joined.num_rows == 0:
+                if self.max_rows is not None and rows >= self.max_rows:
+                    return
+                continue
+            rows += joined.num_rows
+            codes = pc.index_in(joined.column("label"), value_set=class_set).to_numpy(zero_copy_only=False)
+            yield joined.column("case_id").to_pylist(), FeatureStore.feature_batch(joined), codes.astype(np.int16)
+
+    def _load_matrices(self, labels, classes):
+        # Upper bound on rows; pages of the unused tail are never touched, so
+        # they cost address space, not memory
+        capacity = self.feature_store.dataset("features").count_rows() if self.max_rows is None else self.max_rows
+        n_features = len(self.feature_columns)
+        X = {"train": np.empty((capacity, n_features), dtype=np.float32), "test": np.empty((capacity, n_features), dtype=np.float32)}
+        y = {"train": np.empty(capacity, dtype=np.int16), "test": np.empty(capacity, dtype=np.int16)}
+        filled = {"train": 0, "test": 0}
+        for case_ids, batch, codes in self.iter_labelled_batches(labels, classes):
+            is_test = _holdout_mask(case_ids, self.test_fraction)
+            matrix = batch.to_ml_matrix(self.feature_columns)
+            for split, mask in (("train", ~is_test), ("test", is_test)):
+                count = int(mask.sum())
+                start = filled[split]
+                X[split][start:start + count] = matrix[mask]
+                y[split][start:start + count] = codes[mask]
+                filled[split] += count
+        return ({split: X[split][:filled[split]] for split in X}, {split: y[split][:filled[split]] for split in y})
+
+    # --- estimators ---
+
+    def _build_estimator(self):
+        if self.estimator == "hist":
+            from sklearn.ensemble import HistGradientBoostingClassifier
+            params = dict(max_iter=200, early_stopping=True, random_state=self.random_state)
+            params.update(self.estimator_params)
+            return HistGradientBoostingClassifier(**params)
+        if self.estimator == "forest":
+            from sklearn.ensemble import RandomForestClassifier
+            params = dict(n_estimators=100, n_jobs=self.n_jobs, max_samples=None, random_state=self.random_state)
+            params.update(self.estimator_params)
+            return RandomForestClassifier(**params)
+        from sklearn.linear_model import SGDClassifier
+        from sklearn.pipeline import Pipeline
+        from sklearn.preprocessing import StandardScaler
+        params = dict(loss="log_loss", random_state=self.random_state)
+        params.update(self.estimator_params)
+        return Pipeline([("scale", StandardScaler()), ("sgd", SGDClassifier(**params))])
+
+    def _fit_in_memory(self, labels, classes):
+        started = time.perf_counter()
+        X, y = self._load_matrices(labels, classes)
+        self.timings["load_sec"] = round(time.perf_counter() - started, 3)
+        if len(X["train"]) == 0:
+            raise ValueError("No labelled training rows in the feature store")
+
+        # Labels are held as compact int16 codes and turned back into the label
+        # strings for fitting, so the estimator's classes_ are the labels themselves
+        label_names = np.array(classes, dtype=object)
+        estimator = self._build_estimator()
+        started = time.perf_counter()
+        estimator.fit(X["train"], label_names[y["train"]])
+        self.timings["fit_sec"] = round(time.perf_counter() - started, 3)
+
+        started = time.perf_counter()
+        correct = int((estimator.predict(X["test"]) == label_names[y["test"]]).sum()) if len(X["test"]) else 0
+        self.timings["evaluate_sec"] = round(time.perf_counter() - started, 3)
+        return estimator, {"train_rows": len(X["train"]), "test_rows": len(X["test"]), "test_correct": correct}
+
+    def _fit_streaming(self, labels, classes):
+        estimator = self._build_estimator()
+        scaler, sgd = estimator.named_steps["scale"], estimator.named_steps["sgd"]
+        label_names = np.array(classes, dtype=object)
+
+        def train_batches():
+            for case_ids, batch, codes in self.iter_labelled_batches(labels, classes):
+                is_train = ~_holdout_mask(case_ids, self.test_fraction)
+                yield batch.to_ml_matrix(self.feature_columns)[is_train], codes[is_train]
+
+        started = time.perf_counter()
+        train_rows = 0
+        for X, _ in train_batches(): # pass 1: feature means/variances
+            if len(X):
+                scaler.partial_fit(X)
+                train_rows += len(X)
+        if train_rows == 0:
+            raise ValueError("No labelled training rows in the feature store")
+        for _ in range(self.epochs):
+            for X, codes in train_batches():
+                if len(X):
+                    sgd.partial_fit(scaler.transform(X), label_names[codes], classes=label_names)
+        self.timings["fit_sec"] = round(time.perf_counter() - started, 3)
+
+        started = time.perf_counter()
+        test_rows = correct = 0
+        for case_ids, batch, codes in self.iter_labelled_batches(labels, classes):
+            is_test = _holdout_mask(case_ids, self.test_fraction)
+            if is_test.any():
+                predicted = estimator.predict(batch.to_ml_matrix(self.feature_columns)[is_test])
+                correct += int((predicted == label_names[codes[is_test]]).sum())
+                test_rows += int(is_test.sum())
+        self.timings["evaluate_sec"] = round(time.perf_counter() - started, 3)
+        return estimator, {"train_rows": train_rows, "test_rows": test_rows, "test_correct": correct}
+
+    # --- run ---
+
+    def run(self, model_path=Config.RISK_MODEL_PATH, model_version=None):
+        started = time.perf_counter()
+        rss_before = max_rss_bytes()
+        labels = self.with_latest_features(self.load_labels())
+        classes = sorted(pc.unique(labels.column("label")).to_pylist())
+        if not classes:
+            raise ValueError("No labels found")
+
+        if self.estimator == "sgd":
+            estimator, counts = self._fit_streaming(labels, classes)
+        else:
+            estimator, counts = self._fit_in_memory(labels, classes)
+        report = {
+            "estimator": self.estimator,
+            "classes": classes,
+            "feature_columns": self.feature_columns,
+            "train_rows": counts["train_rows"],
+            "test_rows": counts["test_rows"],
+            "test_accuracy": round(counts["test_correct"] / counts["test_rows"], 4) if counts["test_rows"] else None,
+            "n_jobs": self.n_jobs,
+            **self.timings,
+            "wall_sec": round(time.perf_counter() - started, 3),
+            "peak_rss_bytes": max_rss_bytes(),
+            "peak_rss_growth_bytes": max_rss_bytes() - rss_before,
+        }
+
+        risk_model = MLRiskModel(model_path)
+        risk_model.model = estimator
+        risk_model.feature_columns = self.feature_columns
+        risk_model.save_model(model_version, training_info=report)
+        report["model_version"] = risk_model.model_version
+        report["model_hash"] = risk_model.model_hash
+        return report
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Train the risk model from the feature store.")
+    parser.add_argument("--estimator", choices=ESTIMATORS, default=Config.TRAIN_ESTIMATOR)
+    parser.add_argument("--labels", default=None, help="CSV/Parquet with case_id and label columns")
+    parser.add_argument("--label-column", default=Config.TRAIN_LABEL_COLUMN, help="label column of the --labels file")
+    parser.add_argument("--labels-from-decisions", default=Config.TRAIN_DECISIONS_LABEL_COLUMN, metavar="COLUMN",
+                        help="train on this decisions-table column when there is no labels file "
+                             "(e.g. overall_rule_based_risk: the model learns to copy the rules)")
+    parser.add_argument("--feature-store", default=None, help="feature store root (default: configured directories)")
+    parser.add_argument("--start-date", default=None)
+    parser.add_argument("--end-date", default=None)
+    parser.add_argument("--batch-size", type=int, default=Config.TRAIN_BATCH_SIZE)
+    parser.add_argument("--n-jobs", type=int, default=Config.TRAIN_N_JOBS)
+    parser.add_argument("--max-rows", type=int, default=None)
+    parser.add_argument("--epochs", type=int, default=3, help="passes over the data for --estimator sgd")
+    parser.add_argument("--model-path", default=Config.RISK_MODEL_PATH)
+    parser.add_argument("--model-version", default=None)
+    args = parser.parse_args(argv)
+    if not args.labels and not args.labels_from_decisions:
+        parser.error("--labels is required (or --labels-from-decisions COLUMN to train on stored decisions)")
+
+    pipeline = TrainingPipeline(
+        FeatureStore(args.feature_store), estimator=args.estimator, labels_path=args.labels,
+        label_column=args.label_column, decisions_label_column=args.labels_from_decisions, batch_size=args.batch_size,
+        n_jobs=args.n_jobs, max_rows=args.max_rows, start_date=args.start_date, end_date=args.end_date, epochs=args.epochs,
+    )
+    report = pipeline.run(args.model_path, args.model_version)
+    print(json.dumps(report, indent=2))
+    return report
+
+if __name__ == "__main__":
+    main()
+
+# Example Usage:
+# pipeline = TrainingPipeline(estimator="hist", labels_path="data/claims_outcomes.parquet", label_column="outcome")
+# report = pipeline.run(model_version="2024.2")
+# print("Trained in", report["wall_sec"], "s, peak RSS", report["peak_rss_bytes"] // 2**20, "MiB")